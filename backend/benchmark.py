@@ -0,0 +1,527 @@
+"""
+Reproducible load test for the API.
+
+Seeds a throwaway database with generated users, products, listings and carts,
+then drives the real FastAPI app through scripted shopping scenarios and
+reports throughput and latency percentiles per endpoint:
+
+    python benchmark.py --output before.json                 # mongomock, default sizes
+    python benchmark.py --users 200 --products 5000 --iterations 500 --output after.json
+    python benchmark.py --mongo-url mongodb://localhost:27017 --output real.json
+    python benchmark.py --compare before.json after.json     # exit 1 on a p95 regression
+    python benchmark.py --serialization                      # /products response encoding only
+    python benchmark.py --compression                        # gzip/Brotli size and cost per payload
+
+With --mongo-url the benchmark database (--database, default
+`ecommerce-benchmark`) is dropped and reseeded, so never point it at real data.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import mongomock
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import main
+from compression import brotli
+
+SCENARIOS = ["browse", "search", "add_to_cart", "checkout", "verify_payment"]
+
+CATEGORIES = ["Electronics", "Books", "Home", "Sports", "Toys", "Fashion", "Grocery", "Beauty"]
+ADJECTIVES = ["wireless", "compact", "classic", "premium", "portable", "organic", "smart", "vintage", "rugged"]
+NOUNS = ["mouse", "lamp", "kettle", "backpack", "novel", "headphones", "mat", "bottle", "watch", "jacket"]
+
+SHIPPING_ADDRESS = {
+    "full_name": "Bench User",
+    "phone": "9999999999",
+    "address_line1": "1 Load Street",
+    "city": "Pune",
+    "state": "MH",
+    "postal_code": "411001",
+}
+
+
+def generate_dataset(db, users: int, products: int, listings: int, carts: int, seed: int) -> dict:
+    """Fill `db` with deterministic fake data and return the ids scenarios pick from"""
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+
+    emails = [f"user{i}@bench.example" for i in range(users)]
+    if emails:
+        db["users"].insert_many([
+            {"username": f"user{i}", "email": email, "hashed_password": "not-a-real-hash", "created_at": started}
+            for i, email in enumerate(emails)
+        ])
+
+    catalog = []
+    for i in range(products):
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        moment = started + timedelta(minutes=i)
+        catalog.append({
+            "name": f"{adjective.title()} {noun.title()} {i}",
+            "description": f"A {adjective} {noun} for everyday use.",
+            "price": round(rng.uniform(5, 500), 2),
+            "category": rng.choice(CATEGORIES),
+            # Deep enough that checkout never runs out during a run
+            "in_stock": 1_000_000,
+            "image_url": f"https://images.example/{i}.jpg",
+            "created_at": moment,
+            "updated_at": moment,
+        })
+    product_ids = [str(pid) for pid in db["products"].insert_many(catalog).inserted_ids] if catalog else []
+
+    selling = [
+        {
+            "name": f"Used {rng.choice(NOUNS).title()} {i}",
+            "description": "Gently used.",
+            "price": round(rng.uniform(1, 100), 2),
+            "quantity": 1_000_000,
+            "seller_email": rng.choice(emails) if emails else "seller@bench.example",
+            "status": "unsold",
+            "category": "User Listings",
+            "selling_type": "normal",
+            "created_at": started,
+        }
+        for i in range(listings)
+    ]
+    if selling:
+        db["selling_products"].insert_many(selling)
+
+    carted = emails[:carts]
+    if carted and product_ids:
+        db["cart"].insert_many([
+            {
+                "user_email": email,
+                "items": [
+                    {"product_id": pid, "quantity": rng.randint(1, 3)}
+                    for pid in rng.sample(product_ids, min(3, len(product_ids)))
+                ],
+            }
+            for email in carted
+        ])
+
+    return {"emails": emails, "product_ids": product_ids, "terms": ADJECTIVES + NOUNS, "categories": CATEGORIES}
+
+
+class Recorder:
+    """Wraps a TestClient and times each call under its route template"""
+
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def call(self, method: str, template: str, url: str, **kwargs):
+        name = f"{method} {template}"
+        started = time.perf_counter()
+        response = self.client.request(method, url, **kwargs)
+        self.samples.setdefault(name, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+
+def browse(recorder: Recorder, data: dict, rng: random.Random):
+    page = recorder.call("GET", "/products", "/products", params={"limit": 20}).json()
+    if page.get("next_cursor"):
+        recorder.call("GET", "/products", "/products", params={"limit": 20, "cursor": page["next_cursor"]})
+    if data["product_ids"]:
+        product_id = rng.choice(data["product_ids"])
+        recorder.call("GET", "/products/{product_id}", f"/products/{product_id}")
+
+
+def search(recorder: Recorder, data: dict, rng: random.Random):
+    recorder.call("GET", "/products/search", "/products/search", params={"name": rng.choice(data["terms"])})
+    recorder.call("GET", "/products/search", "/products/search", params={"category": rng.choice(data["categories"])})
+
+
+def add_to_cart(recorder: Recorder, data: dict, rng: random.Random):
+    if not data["emails"] or not data["product_ids"]:
+        return
+    email = rng.choice(data["emails"])
+    recorder.call("POST", "/cart/add", "/cart/add", json={
+        "user_email": email, "product_id": rng.choice(data["product_ids"]), "quantity": 1,
+    })
+    recorder.call("GET", "/cart/detailed", "/cart/detailed", params={"user_email": email})
+    recorder.call("GET", "/cart/total", "/cart/total", params={"user_email": email})
+
+
+def _place_order(recorder: Recorder, data: dict, rng: random.Random):
+    if not data["emails"] or not data["product_ids"]:
+        return None
+    items = [
+        {"product_id": pid, "product_name": "Bench item", "quantity": rng.randint(1, 2), "price": 10.0}
+        for pid in rng.sample(data["product_ids"], min(2, len(data["product_ids"])))
+    ]
+    response = recorder.call("POST", "/orders/create", "/orders/create", json={
+        "user_email": rng.choice(data["emails"]),
+        "items": items,
+        "shipping_address": SHIPPING_ADDRESS,
+        "total_amount": sum(item["price"] * item["quantity"] for item in items),
+    })
+    return response.json().get("order", {}).get("order_id") if response.status_code == 200 else None
+
+
+def checkout(recorder: Recorder, data: dict, rng: random.Random):
+    _place_order(recorder, data, rng)
+
+
+def verify_payment(recorder: Recorder, data: dict, rng: random.Random):
+    order_id = _place_order(recorder, data, rng)
+    if order_id:
+        recorder.call("POST", "/orders/verify-payment", "/orders/verify-payment", json={
+            "order_id": order_id,
+            "razorpay_order_id": f"order_{order_id}",
+            "razorpay_payment_id": f"pay_{order_id}",
+            "razorpay_signature": "demo",
+        })
+
+
+SCENARIO_FUNCTIONS = {
+    "browse": browse,
+    "search": search,
+    "add_to_cart": add_to_cart,
+    "checkout": checkout,
+    "verify_payment": verify_payment,
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int], wall_seconds: float) -> dict:
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        values = sorted(values)
+        total = sum(values)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "mean_ms": round(total * 1000 / len(values), 3),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+            "throughput_rps": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+    requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "requests": requests,
+        "errors": sum(errors.values()),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(requests / wall_seconds, 2) if wall_seconds else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def setup_database(mongo_url=None, database="ecommerce-benchmark"):
+    """Point the app at a fresh benchmark database and return its handle"""
+    if mongo_url:
+        main.mongo = main.MongoConnectionManager(mongo_url, database, event_listeners=[main.mongo_profiler])
+        main.mongo.connect().drop_database(database)
+    else:
+        main.mongo = main.MongoConnectionManager("mongodb://benchmark", database, client_factory=mongomock.MongoClient)
+    # Payment verification runs in demo mode so no request leaves the process
+    main.razorpay_client = None
+    main.product_cache.clear()
+    return main.get_mongo_client()[1]
+
+
+def run_benchmark(
+    users: int = 50,
+    products: int = 500,
+    listings: int = 50,
+    carts: int = 25,
+    iterations: int = 100,
+    concurrency: int = 1,
+    scenarios: List[str] = None,
+    warmup: int = 5,
+    seed: int = 42,
+    mongo_url: str = None,
+    database: str = "ecommerce-benchmark",
+) -> dict:
+    """Seed the database, run each scenario `iterations` times and return the report"""
+    scenarios = scenarios or SCENARIOS
+    db = setup_database(mongo_url, database)
+    data = generate_dataset(db, users, products, listings, carts, seed)
+    main.apply_database_migrations()
+    main.rebuild_search_index()
+
+    def worker(worker_id: int, count: int, record: bool) -> Recorder:
+        recorder = Recorder(TestClient(main.app))
+        rng = random.Random(seed * 1000 + worker_id + (0 if record else 999))
+        for _ in range(count):
+            for name in scenarios:
+                SCENARIO_FUNCTIONS[name](recorder, data, rng)
+        return recorder
+
+    # Warm caches and the search index so the first samples are not outliers
+    worker(0, warmup, record=False)
+
+    shares = [iterations // concurrency + (1 if i < iterations % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        recorders = list(pool.map(lambda args: worker(*args), [(i, share, True) for i, share in enumerate(shares)]))
+    wall_seconds = time.perf_counter() - started
+
+    samples, errors = {}, {}
+    for recorder in recorders:
+        for name, values in recorder.samples.items():
+            samples.setdefault(name, []).extend(values)
+        for name, count in recorder.errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+    report = summarize(samples, errors, wall_seconds)
+    report["config"] = {
+        "users": users,
+        "products": products,
+        "listings": listings,
+        "carts": carts,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "scenarios": scenarios,
+        "warmup": warmup,
+        "seed": seed,
+        "backend": "mongodb" if mongo_url else "mongomock",
+    }
+    report["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+    }
+    return report
+
+
+def legacy_convert_product_to_dict(product_doc, source: str = "catalog"):
+    """convert_product_to_dict as it was before the lean serialization path, kept as the baseline"""
+    if product_doc is None:
+        return None
+    if isinstance(product_doc, dict):
+        product_dict = product_doc
+    else:
+        try:
+            product_dict = dict(product_doc)
+        except (TypeError, AttributeError):
+            product_dict = {k: getattr(product_doc, k, None) for k in dir(product_doc) if not k.startswith('_')}
+    image_url = (
+        product_dict.get("image_url") or
+        product_dict.get("imageUrl") or
+        product_dict.get("image") or
+        ""
+    )
+    if image_url is None:
+        image_url = ""
+    product_id = str(product_dict.get("_id", ""))
+    if source == "seller":
+        product_id = f"{main.SELLER_PRODUCT_PREFIX}{product_id}"
+        stock_value = int(product_dict.get("quantity", product_dict.get("in_stock", 0)))
+    else:
+        stock_value = int(product_dict.get("in_stock", product_dict.get("quantity", 0)))
+    return {
+        "_id": product_id,
+        "name": str(product_dict.get("name", "")),
+        "description": str(product_dict.get("description", "")),
+        "price": float(product_dict.get("price", 0.0)),
+        "category": str(product_dict.get("category", "")),
+        "in_stock": stock_value,
+        "image_url": str(image_url),
+        "created_at": product_dict.get("created_at"),
+        "updated_at": product_dict.get("updated_at"),
+        "source": source,
+        "seller_email": product_dict.get("seller_email"),
+        "status": product_dict.get("status", "unsold" if source == "seller" else product_dict.get("status", "active")),
+    }
+
+
+def serialization_benchmark(items: int = 100, rounds: int = 500, seed: int = 42) -> dict:
+    """Time building one /products response body, before and after the orjson path.
+
+    "legacy" is the old converter followed by jsonable_encoder and JSONResponse,
+    which is what a returned dict went through; "current" is the lean converter
+    rendered by FastJSONResponse. Both produce the same JSON document.
+    """
+    db = mongomock.MongoClient()["serialization"]
+    generate_dataset(db, users=0, products=items, listings=0, carts=0, seed=seed)
+    docs = list(db["products"].find({}, main.PRODUCT_PROJECTION))
+
+    def legacy():
+        payload = {"products": [legacy_convert_product_to_dict(doc) for doc in docs], "count": len(docs)}
+        return JSONResponse(jsonable_encoder(payload)).body
+
+    def current():
+        payload = {"products": [main.convert_product_to_dict(doc) for doc in docs], "count": len(docs)}
+        return main.FastJSONResponse(payload).body
+
+    if json.loads(legacy()) != json.loads(current()):
+        raise AssertionError("legacy and current serialization disagree")
+
+    results = {}
+    for name, build in (("legacy", legacy), ("current", current)):
+        for _ in range(min(rounds, 20)):
+            build()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            build()
+        results[name] = round((time.perf_counter() - started) * 1_000_000 / rounds, 1)
+    return {
+        "items": items,
+        "rounds": rounds,
+        "legacy_us_per_response": results["legacy"],
+        "current_us_per_response": results["current"],
+        "speedup": round(results["legacy"] / results["current"], 2) if results["current"] else None,
+    }
+
+
+def compression_benchmark(products: int = 500, rounds: int = 50, seed: int = 42) -> dict:
+    """Size and time of each encoding for the seeded catalog's large JSON payloads"""
+    db = setup_database()
+    data = generate_dataset(db, users=5, products=products, listings=products // 10, carts=5, seed=seed)
+    main.rebuild_search_index()
+    client = TestClient(main.app)
+    identity = {"Accept-Encoding": "identity"}
+    email = data["emails"][0]
+    payloads = {
+        "GET /products?limit=100": client.get("/products", params={"limit": 100}, headers=identity).content,
+        "GET /products?limit=20": client.get("/products", params={"limit": 20}, headers=identity).content,
+        "GET /cart/detailed": client.get("/cart/detailed", params={"user_email": email}, headers=identity).content,
+    }
+    encoders = {f"gzip-{level}": (lambda body, level=level: zlib.compress(body, level, 31)) for level in (1, 6, 9)}
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            encoders[f"br-{quality}"] = lambda body, quality=quality: brotli.compress(body, quality=quality)
+
+    results = {}
+    for name, body in payloads.items():
+        row = {"identity_bytes": len(body)}
+        for encoder_name, encode in encoders.items():
+            started = time.perf_counter()
+            for _ in range(rounds):
+                compressed = encode(body)
+            row[encoder_name] = {
+                "bytes": len(compressed),
+                "ratio": round(len(compressed) / len(body), 3) if body else 0.0,
+                "us": round((time.perf_counter() - started) * 1_000_000 / rounds, 1),
+            }
+        results[name] = row
+    return {"products": products, "rounds": rounds, "brotli_available": brotli is not None, "payloads": results}
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float = 10.0):
+    """Return (lines, regressed): per-endpoint p50/p95 change, regressed when a p95 grew past tolerance %"""
+    lines, regressed = [], False
+    for name, before in sorted(baseline["endpoints"].items()):
+        after = current["endpoints"].get(name)
+        if after is None:
+            lines.append(f"{name}: missing from current run")
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            delta = (after[key] - before[key]) * 100 / before[key] if before[key] else 0.0
+            changes.append(f"{key} {before[key]:.2f} -> {after[key]:.2f} ({delta:+.1f}%)")
+            if key == "p95_ms" and delta > tolerance:
+                regressed = True
+                changes[-1] += " REGRESSION"
+        lines.append(f"{name}: " + ", ".join(changes))
+    return lines, regressed
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests in {report['wall_seconds']}s "
+          f"({report['throughput_rps']} req/s, {report['errors']} errors)")
+    print(f"{'endpoint':<32}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'err':>6}")
+    for name, endpoint in report["endpoints"].items():
+        print(f"{name:<32}{endpoint['requests']:>7}{endpoint['p50_ms']:>10.2f}{endpoint['p95_ms']:>10.2f}"
+              f"{endpoint['p99_ms']:>10.2f}{endpoint['throughput_rps']:>10.1f}{endpoint['errors']:>6}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API against a seeded database")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--listings", type=int, default=50)
+    parser.add_argument("--carts", type=int, default=25)
+    parser.add_argument("--iterations", type=int, default=100, help="runs of every scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads sharing the iterations")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default is all")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", help="benchmark a real MongoDB instead of mongomock")
+    parser.add_argument("--database", default="ecommerce-benchmark")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="diff two JSON reports")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed p95 growth in percent")
+    parser.add_argument("--serialization", action="store_true", help="only time /products response encoding")
+    parser.add_argument("--items", type=int, default=100, help="products per response for --serialization")
+    parser.add_argument("--compression", action="store_true", help="only compare response compression settings")
+    args = parser.parse_args(argv)
+
+    if args.compression:
+        result = compression_benchmark(products=args.products, rounds=max(args.iterations // 2, 1), seed=args.seed)
+        for name, row in result["payloads"].items():
+            print(f"{name}: {row['identity_bytes']} bytes uncompressed")
+            for encoder_name, stats in row.items():
+                if encoder_name != "identity_bytes":
+                    print(f"  {encoder_name:<8}{stats['bytes']:>9} bytes  ratio {stats['ratio']:.3f}  {stats['us']:>8.1f} us")
+        if not result["brotli_available"]:
+            print("brotli is not installed; only gzip was measured")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+        return 0
+
+    if args.serialization:
+        result = serialization_benchmark(items=args.items, rounds=max(args.iterations, 1) * 5, seed=args.seed)
+        print(f"{result['items']} products per response: legacy {result['legacy_us_per_response']} us, "
+              f"current {result['current_us_per_response']} us ({result['speedup']}x)")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+        return 0
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        lines, regressed = compare_reports(baseline, current, args.tolerance)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    report = run_benchmark(
+        users=args.users,
+        products=args.products,
+        listings=args.listings,
+        carts=args.carts,
+        iterations=args.iterations,
+        concurrency=max(args.concurrency, 1),
+        scenarios=args.scenario,
+        warmup=args.warmup,
+        seed=args.seed,
+        mongo_url=args.mongo_url,
+        database=args.database,
+    )
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
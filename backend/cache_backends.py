@@ -0,0 +1,410 @@
+"""
+Cache backends shared by the product, cart total and token caches.
+
+MemoryBackend is a per-process LRU with per-entry TTLs. RedisBackend stores
+entries in Redis through redis-py, so the server acts as a tier shared by
+every worker. TieredCache puts a MemoryBackend in front of a RedisBackend;
+invalidations are written to both and published on a channel so the other
+workers drop their local copies.
+
+Cache failures never fail a request: a Redis error is counted and treated as
+a miss. Values are stored in Redis as JSON (datetimes tagged and restored on
+read), never pickled, so write access to the server cannot run code in the
+workers.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import orjson
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+
+class CacheBackend:
+    """Interface every backend implements.
+
+    Keys are strings; values are what JSON holds (dicts with string keys, lists,
+    strings, numbers, None) plus datetimes, so every backend can store them.
+    """
+
+    name = "none"
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        raise NotImplementedError
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, value, ttl: float):
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[str, object], ttl: float):
+        """Store several entries with the same TTL; backends override this to batch the writes"""
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def clear(self, prefix: str = ""):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+    def start(self):
+        """Begin background work (e.g. listening for invalidations); called once at startup"""
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """Thread-safe LRU; entries expire `ttl` seconds after they are set"""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = 10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        found = {}
+        with self._lock:
+            now = self.clock()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set(self, key: str, value, ttl: float):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, object], ttl: float):
+        if self.maxsize <= 0 or ttl <= 0 or not items:
+            return
+        with self._lock:
+            expires_at = self.clock() + ttl
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self, prefix: str = ""):
+        with self._lock:
+            if not prefix:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Type is not cacheable in Redis: {type(value).__name__}")
+
+
+def _restore_dates(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and "$date" in value:
+            return datetime.fromisoformat(value["$date"])
+        return {key: _restore_dates(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_restore_dates(item) for item in value]
+    return value
+
+
+def encode_value(value) -> bytes:
+    """JSON for Redis; datetimes are tagged as {"$date": iso} so decode_value can restore them"""
+    return orjson.dumps(value, default=_encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def decode_value(raw: bytes):
+    return _restore_dates(orjson.loads(raw))
+
+
+class RedisBackend(CacheBackend):
+    """redis-py client (connection pool and pub/sub invalidation listener) with a circuit breaker.
+
+    After a connection failure the backend stops contacting the server for
+    `retry_after` seconds (every call is a miss meanwhile), so an outage does
+    not add a connect timeout to each cache call.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "ecommerce:",
+                 max_connections: Optional[int] = None, timeout: float = 0.5, retry_after: float = 5.0,
+                 clock=time.monotonic):
+        # RESP2 works with any Redis compatible server. No client-side retries:
+        # a failure opens the circuit instead
+        self.client = redis.Redis.from_url(
+            url, protocol=2, socket_timeout=timeout, socket_connect_timeout=timeout,
+            max_connections=max_connections, retry=Retry(NoBackoff(), 0),
+        )
+        kwargs = self.client.connection_pool.connection_kwargs
+        self.server = f"{kwargs.get('host', 'localhost')}:{kwargs.get('port', 6379)}/{kwargs.get('db', 0)}"
+        self.prefix = prefix
+        self.origin = uuid.uuid4().hex
+        self._subscribers: Dict[str, List[Callable[[dict], None]]] = {}
+        self._listener = None
+        self._closed = threading.Event()
+        self.retry_after = retry_after
+        self.clock = clock
+        self._unavailable_until = 0.0
+        self.errors = 0
+        self.skipped = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def circuit_open(self) -> bool:
+        return self.clock() < self._unavailable_until
+
+    def _record_error(self, error: Exception):
+        self.errors += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+    def _run(self, call, default):
+        """Run call(client); any failure is counted and returns `default`"""
+        if self.circuit_open:
+            self.skipped += 1
+            return default
+        try:
+            return call(self.client)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self._record_error(e)
+            # The server is unreachable (or the connection broke): stop trying for a while
+            self._unavailable_until = self.clock() + self.retry_after
+        except redis.RedisError as e:
+            self._record_error(e)
+        return default
+
+    def _encode_items(self, items: Dict[str, object]) -> Dict[str, bytes]:
+        encoded = {}
+        for key, value in items.items():
+            try:
+                encoded[self.prefix + key] = encode_value(value)
+            except TypeError as e:
+                self._record_error(e)
+        return encoded
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._run(lambda client: client.mget([self.prefix + key for key in keys]), None) or []
+        found = {}
+        for key, raw in zip(keys, values):
+            if raw is not None:
+                try:
+                    found[key] = decode_value(raw)
+                except ValueError:
+                    continue
+        return found
+
+    def set(self, key: str, value, ttl: float):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, object], ttl: float):
+        milliseconds = int(ttl * 1000)
+        if milliseconds <= 0 or not items:
+            return
+        encoded = self._encode_items(items)
+        if not encoded:
+            return
+
+        def write(client):
+            # MSET cannot carry a TTL, so the SETs are pipelined instead: one round trip
+            pipeline = client.pipeline(transaction=False)
+            for key, raw in encoded.items():
+                pipeline.set(key, raw, px=milliseconds)
+            pipeline.execute()
+
+        self._run(write, None)
+
+    def delete(self, *keys: str):
+        if keys:
+            self._run(lambda client: client.delete(*[self.prefix + key for key in keys]), None)
+
+    def clear(self, prefix: str = ""):
+        def clear_matching(client):
+            batch = []
+            for key in client.scan_iter(match=f"{self.prefix}{prefix}*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    client.delete(*batch)
+                    batch = []
+            if batch:
+                client.delete(*batch)
+
+        self._run(clear_matching, None)
+
+    def publish(self, channel: str, message: dict):
+        payload = orjson.dumps({**message, "origin": self.origin})
+        self._run(lambda client: client.publish(self.prefix + channel, payload), None)
+
+    def subscribe(self, channel: str, callback: Callable[[dict], None]):
+        """Call `callback(message)` for messages other processes publish on `channel`"""
+        self._subscribers.setdefault(self.prefix + channel, []).append(callback)
+
+    def start(self):
+        if self._listener is None and self._subscribers:
+            self._listener = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+            self._listener.start()
+
+    def _deliver(self, message: dict):
+        payload = orjson.loads(message["data"])
+        if payload.get("origin") == self.origin:
+            return
+        channel = message["channel"]
+        for callback in self._subscribers.get(channel.decode() if isinstance(channel, bytes) else channel, []):
+            callback(payload)
+
+    def _listen(self):
+        backoff = 0.5
+        while not self._closed.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(*self._subscribers)
+                backoff = 0.5
+                while not self._closed.is_set():
+                    # Wake up every second to notice close()
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._deliver(message)
+            except (redis.RedisError, ValueError) as e:
+                if self._closed.is_set():
+                    return
+                self._record_error(e)
+                # Messages published while disconnected are lost; local TTLs bound the staleness
+                self._closed.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                pubsub.close()
+
+    def ping(self) -> bool:
+        return bool(self._run(lambda client: client.ping(), False))
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "server": self.server,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "circuit_open": self.circuit_open,
+            "last_error": self.last_error,
+            "listening": self._listener is not None and self._listener.is_alive(),
+        }
+
+    def close(self):
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.join(timeout=2)
+        self.client.close()
+
+
+class TieredCache(CacheBackend):
+    """A process-local MemoryBackend in front of a shared RedisBackend.
+
+    Local copies live at most `local_ttl` seconds, which bounds staleness if an
+    invalidation message is missed.
+    """
+
+    name = "tiered"
+    CHANNEL = "invalidate"
+
+    def __init__(self, local: MemoryBackend, shared: RedisBackend, local_ttl: float = 30.0):
+        self.local = local
+        self.shared = shared
+        self.local_ttl = local_ttl
+        shared.subscribe(self.CHANNEL, self._on_invalidate)
+
+    def _on_invalidate(self, message: dict):
+        if "prefix" in message:
+            self.local.clear(message["prefix"])
+        else:
+            self.local.delete(*message.get("keys", []))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        keys = list(keys)
+        found = self.local.get_many(keys)
+        remaining = [key for key in keys if key not in found]
+        if remaining:
+            shared = self.shared.get_many(remaining)
+            for key, value in shared.items():
+                self.local.set(key, value, self.local_ttl)
+            found.update(shared)
+        return found
+
+    def set(self, key: str, value, ttl: float):
+        self.local.set(key, value, min(ttl, self.local_ttl))
+        self.shared.set(key, value, ttl)
+
+    def set_many(self, items: Dict[str, object], ttl: float):
+        self.local.set_many(items, min(ttl, self.local_ttl))
+        self.shared.set_many(items, ttl)
+
+    def delete(self, *keys: str):
+        if not keys:
+            return
+        self.local.delete(*keys)
+        self.shared.delete(*keys)
+        self.shared.publish(self.CHANNEL, {"keys": list(keys)})
+
+    def clear(self, prefix: str = ""):
+        self.local.clear(prefix)
+        self.shared.clear(prefix)
+        self.shared.publish(self.CHANNEL, {"prefix": prefix})
+
+    def stats(self) -> dict:
+        return {**self.local.stats(), "backend": self.name, "shared": self.shared.stats()}
+
+    def start(self):
+        self.shared.start()
+
+    def close(self):
+        self.shared.close()
+
+
+def build_cache_backend(kind: str, maxsize: int, shared: Optional[RedisBackend] = None, local_ttl: float = 30.0,
+                        clock=time.monotonic) -> CacheBackend:
+    """A MemoryBackend, or a TieredCache over `shared` when kind is "redis" """
+    local = MemoryBackend(maxsize, clock)
+    if kind == "redis" and shared is not None:
+        return TieredCache(local, shared, local_ttl)
+    return local
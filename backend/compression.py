@@ -0,0 +1,173 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+CompressionMiddleware compresses JSON and other text bodies with Brotli (when
+the `brotli` package is installed) or gzip. Bodies under `minimum_size` bytes
+are sent as-is since the framing overhead outweighs the saving. Streaming
+responses are compressed chunk by chunk and flushed after every chunk, so
+clients still receive each chunk as soon as it is produced.
+"""
+import zlib
+from typing import Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+
+def available_encodings(preferred: Iterable[str]) -> tuple:
+    return tuple(name for name in preferred if name == "gzip" or (name == "br" and brotli is not None))
+
+
+def choose_encoding(accept_encoding: str, supported: Iterable[str]) -> Optional[str]:
+    """Pick the first of `supported` (server preference order) the client accepts"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    for name in supported:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > 0:
+            return name
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """Pure ASGI compression middleware; see the module docstring"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        encodings: Iterable[str] = ("br", "gzip"),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = available_encodings(encodings)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding, self.encodings) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        def compressible(start) -> bool:
+            headers = {key.lower(): value for key, value in start.get("headers", [])}
+            if b"content-encoding" in headers or start["status"] in (204, 304):
+                return False
+            content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+            return content_type.startswith(COMPRESSIBLE_TYPES)
+
+        def compressed_headers(start, length: Optional[int]):
+            headers = []
+            vary = None
+            for key, value in start.get("headers", []):
+                name = key.lower()
+                if name == b"content-length":
+                    continue
+                if name == b"etag" and not value.startswith(b"W/"):
+                    # The compressed bytes differ from the identity ones, so the
+                    # validator is downgraded to weak; If-None-Match still matches it
+                    value = b"W/" + value
+                if name == b"vary":
+                    vary = value
+                    continue
+                headers.append((key, value))
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            if vary is None:
+                headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                headers.append((b"vary", vary + b", Accept-Encoding"))
+            else:
+                headers.append((b"vary", vary))
+            if length is not None:
+                headers.append((b"content-length", str(length).encode("latin-1")))
+            return {**start, "headers": headers}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                state["passthrough"] = not compressible(message)
+                if state["passthrough"]:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            compressor = state["compressor"]
+            if compressor is None:
+                start = state["start"]
+                if not more_body:
+                    # Whole body in one message: compress only if it is worth it
+                    if len(body) < self.minimum_size:
+                        await send(start)
+                        await send(message)
+                        return
+                    payload = _Compressor(encoding, self.gzip_level, self.brotli_quality).finish(body)
+                    await send(compressed_headers(start, len(payload)))
+                    await send({"type": "http.response.body", "body": payload})
+                    return
+                compressor = state["compressor"] = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                await send(compressed_headers(start, None))
+            if more_body:
+                await send({"type": "http.response.body", "body": compressor.compress(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body)})
+
+        await self.app(scope, receive, send_compressed)
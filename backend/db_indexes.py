@@ -0,0 +1,194 @@
+"""
+MongoDB index declarations and schema migrations.
+
+Applied automatically at app startup and available as a CLI:
+
+    python db_indexes.py apply    # create missing indexes and run pending migrations
+    python db_indexes.py verify   # exit with status 1 if a declared index is missing
+    python db_indexes.py report   # explain the hot queries and flag collection scans
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient
+from pymongo.errors import OperationFailure
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# Every index the backend relies on, keyed by collection name
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "cart": [
+        IndexModel([("user_email", ASCENDING)], name="user_email_unique", unique=True),
+        # Finds the carts to reprice when a product's price changes
+        IndexModel([("items.product_id", ASCENDING)], name="items_product_id"),
+    ],
+    "wishlist": [
+        IndexModel([("user_email", ASCENDING)], name="user_email_unique", unique=True),
+    ],
+    "orders": [
+        IndexModel([("order_id", ASCENDING)], name="order_id_unique", unique=True),
+        IndexModel(
+            [("user_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_email_created_at",
+        ),
+        # Date-range scans of /export/orders
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at"),
+    ],
+    "discounts": [
+        IndexModel([("rule_id", ASCENDING)], name="rule_id_unique", unique=True),
+    ],
+    "selling_products": [
+        IndexModel([("status", ASCENDING), ("quantity", ASCENDING)], name="status_quantity"),
+    ],
+}
+
+# Representative queries issued by the API, used by `report` to spot collection scans
+HOT_QUERIES = [
+    ("users", {"email": "someone@example.com"}, None),
+    ("users", {"email": {"$regex": "^some"}}, [("email", ASCENDING)]),
+    ("cart", {"user_email": "someone@example.com"}, None),
+    ("cart", {"items.product_id": "000000000000000000000000"}, None),
+    ("wishlist", {"user_email": "someone@example.com"}, None),
+    ("orders", {"order_id": "ORD0"}, None),
+    ("orders", {"user_email": "someone@example.com"}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("orders", {"created_at": {"$gte": datetime(2024, 1, 1)}}, [("created_at", ASCENDING), ("_id", ASCENDING)]),
+    ("selling_products", {"status": {"$ne": "sold"}, "quantity": {"$gt": 0}}, None),
+]
+
+
+def _backfill_product_timestamps(db):
+    """Give products inserted by hand a created_at/updated_at taken from their ObjectId"""
+    updated = 0
+    for doc in db["products"].find(
+        {"$or": [{"created_at": {"$exists": False}}, {"updated_at": {"$exists": False}}]},
+        {"created_at": 1, "updated_at": 1},
+    ):
+        created_at = doc.get("created_at") or doc["_id"].generation_time.replace(tzinfo=None)
+        db["products"].update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"created_at": created_at, "updated_at": doc.get("updated_at") or created_at}},
+        )
+        updated += 1
+    return updated
+
+
+# Ordered (id, function) pairs; ids are recorded in schema_migrations once applied
+MIGRATIONS = [
+    ("0001_backfill_product_timestamps", _backfill_product_timestamps),
+]
+
+
+def apply_indexes(db):
+    """Create every declared index. Existing indexes are left untouched.
+
+    Returns a list of (collection, index name, error) for indexes that could not
+    be built, e.g. a unique index over data that already contains duplicates.
+    """
+    failures = []
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                failures.append((collection_name, index.document["name"], str(e)))
+    return failures
+
+
+def run_migrations(db):
+    """Run pending migrations in order and return the ids that were applied"""
+    applied = {doc["_id"] for doc in db[MIGRATIONS_COLLECTION].find({}, {"_id": 1})}
+    ran = []
+    for migration_id, migration in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        result = migration(db)
+        db[MIGRATIONS_COLLECTION].insert_one(
+            {"_id": migration_id, "applied_at": datetime.utcnow(), "result": result}
+        )
+        ran.append(migration_id)
+    return ran
+
+
+def missing_indexes(db):
+    """Return (collection, index name) for every declared index that does not exist"""
+    missing = []
+    for collection_name, indexes in INDEXES.items():
+        existing = db[collection_name].index_information()
+        for index in indexes:
+            if index.document["name"] not in existing:
+                missing.append((collection_name, index.document["name"]))
+    return missing
+
+
+def _plan_stages(plan):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def collection_scan_queries(db):
+    """Explain each hot query and return the ones whose winning plan is a COLLSCAN"""
+    scans = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(plan):
+            scans.append((collection_name, query, sort))
+    return scans
+
+
+def bootstrap(db):
+    """Startup hook: build indexes and run pending migrations, logging any problems"""
+    for collection_name, name, error in apply_indexes(db):
+        print(f"Could not create index {collection_name}.{name}: {error}")
+    for migration_id in run_migrations(db):
+        print(f"Applied migration {migration_id}")
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes and migrations")
+    parser.add_argument("command", choices=["apply", "verify", "report"])
+    parser.add_argument("--url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default=os.getenv("DATABASE_NAME", "e-commerce-app"))
+    args = parser.parse_args(argv)
+
+    db = MongoClient(args.url, serverSelectionTimeoutMS=10000)[args.database]
+
+    if args.command == "apply":
+        failures = apply_indexes(db)
+        for collection_name, name, error in failures:
+            print(f"FAILED {collection_name}.{name}: {error}")
+        for migration_id in run_migrations(db):
+            print(f"Applied migration {migration_id}")
+        return 1 if failures else 0
+
+    if args.command == "verify":
+        missing = missing_indexes(db)
+        for collection_name, name in missing:
+            print(f"MISSING {collection_name}.{name}")
+        if not missing:
+            print("All declared indexes are present")
+        return 1 if missing else 0
+
+    scans = collection_scan_queries(db)
+    for collection_name, query, sort in scans:
+        print(f"COLLSCAN {collection_name} query={query} sort={sort}")
+    if not scans:
+        print("No hot query uses a collection scan")
+    return 1 if scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
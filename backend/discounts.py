@@ -0,0 +1,298 @@
+"""
+Discount strategies and the cart discount rule engine.
+
+Rules live in the `discounts` collection and are compiled once into lookup
+tables keyed by code, product id and category, so pricing a cart is a single
+pass over its lines. Legacy codes such as TENOFF, 10PERCENT, FLAT50 and
+BUY2GET1 keep working without a stored rule.
+
+A rule document looks like:
+
+    {
+        "rule_id": "summer-books",      # unique; defaults to the code
+        "code": "SUMMER",               # omit for an automatic promotion
+        "type": "percentage",           # percentage | flat | buy_x_get_y
+        "value": 15,                    # percent, or amount for flat
+        "scope": "category",            # cart | item | category
+        "target": "Books",              # product id or category; omit for every item
+        "buy_x": 2, "get_y": 1,         # buy_x_get_y only
+        "stackable": false,
+        "priority": 10,                 # lower runs first
+        "min_subtotal": 0,              # cart scope only
+        "starts_at": null, "ends_at": null,
+        "active": true
+    }
+
+Line rules run before cart rules, each in priority order. On any one line, or
+on the cart, at most one non-stackable rule applies (the first to give a
+discount); stackable rules always apply to whatever amount is left.
+"""
+import re
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+RULE_TYPES = ("percentage", "flat", "buy_x_get_y")
+RULE_SCOPES = ("cart", "item", "category")
+
+_PERCENT_CODE = re.compile(r"^(\d+(?:\.\d+)?)PERCENT$")
+_FLAT_CODE = re.compile(r"^FLAT(\d+(?:\.\d+)?)$")
+_BUY_X_GET_Y_CODE = re.compile(r"^BUY(\d+)GET(\d+)$")
+
+
+class DiscountStrategy:
+    def apply(self, total: float, quantity: int = 1) -> float:
+        return total
+
+class TenPercentOff(DiscountStrategy):
+    def apply(self, total: float, quantity: int = 1) -> float:
+        return total * 0.9
+
+class FlatDiscount(DiscountStrategy):
+    def __init__(self, amount: float):
+        self.amount = amount
+    def apply(self, total: float, quantity: int = 1) -> float:
+        return max(0, total - self.amount)
+
+class PercentageDiscount(DiscountStrategy):
+    def __init__(self, percentage: float):
+        self.percentage = percentage
+    def apply(self, total: float, quantity: int = 1) -> float:
+        return max(0.0, total * (1 - self.percentage / 100))
+
+class BuyXGetYDiscount(DiscountStrategy):
+    """For every buy_x + get_y units, get_y of them are discounted by discount_percentage"""
+    def __init__(self, buy_x: int, get_y: int, discount_percentage: float = 100):
+        self.buy_x = buy_x
+        self.get_y = get_y
+        self.discount_percentage = discount_percentage
+    def apply(self, total: float, quantity: int = 1) -> float:
+        if quantity <= 0 or self.buy_x + self.get_y <= 0:
+            return total
+        discounted_units = (quantity // (self.buy_x + self.get_y)) * self.get_y
+        unit_price = total / quantity
+        return max(0.0, total - discounted_units * unit_price * self.discount_percentage / 100)
+
+
+@lru_cache(maxsize=256)
+def get_discount_strategy(discount_code: Optional[str]) -> Optional[DiscountStrategy]:
+    """Strategy for a legacy code (TENOFF, 10PERCENT, FLAT50, BUY2GET1), parsed once per code"""
+    if not discount_code:
+        return None
+
+    discount_code = discount_code.upper()
+
+    if discount_code == "TENOFF":
+        return TenPercentOff()
+    match = _PERCENT_CODE.match(discount_code)
+    if match:
+        return PercentageDiscount(float(match.group(1)))
+    match = _FLAT_CODE.match(discount_code)
+    if match:
+        return FlatDiscount(float(match.group(1)))
+    match = _BUY_X_GET_Y_CODE.match(discount_code)
+    if match:
+        return BuyXGetYDiscount(int(match.group(1)), int(match.group(2)))
+    return None
+
+
+def strategy_from_rule(doc: dict) -> DiscountStrategy:
+    rule_type = doc.get("type", "percentage")
+    if rule_type == "percentage":
+        return PercentageDiscount(float(doc["value"]))
+    if rule_type == "flat":
+        return FlatDiscount(float(doc["value"]))
+    if rule_type == "buy_x_get_y":
+        return BuyXGetYDiscount(int(doc["buy_x"]), int(doc["get_y"]), float(doc.get("value", 100)))
+    raise ValueError(f"Unknown discount type {rule_type!r}")
+
+
+class DiscountRule:
+    """One compiled rule; `strategy` does the arithmetic"""
+
+    def __init__(
+        self,
+        rule_id: str,
+        strategy: DiscountStrategy,
+        scope: str = "cart",
+        code: Optional[str] = None,
+        target: Optional[str] = None,
+        stackable: bool = False,
+        priority: int = 0,
+        min_subtotal: float = 0.0,
+        starts_at: Optional[datetime] = None,
+        ends_at: Optional[datetime] = None,
+    ):
+        if scope not in RULE_SCOPES:
+            raise ValueError(f"Unknown discount scope {scope!r}")
+        self.rule_id = rule_id
+        self.strategy = strategy
+        self.scope = scope
+        self.code = code.upper() if code else None
+        self.target = target
+        self.stackable = stackable
+        self.priority = priority
+        self.min_subtotal = min_subtotal
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "DiscountRule":
+        return cls(
+            rule_id=str(doc.get("rule_id") or doc.get("code") or doc["_id"]),
+            strategy=strategy_from_rule(doc),
+            scope=doc.get("scope", "cart"),
+            code=doc.get("code"),
+            target=doc.get("target"),
+            stackable=bool(doc.get("stackable", False)),
+            priority=int(doc.get("priority", 0)),
+            min_subtotal=float(doc.get("min_subtotal", 0.0)),
+            starts_at=doc.get("starts_at"),
+            ends_at=doc.get("ends_at"),
+        )
+
+    def is_live(self, now: datetime) -> bool:
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or now < self.ends_at)
+
+
+class CartLine(NamedTuple):
+    product_id: str
+    category: Optional[str]
+    unit_price: float
+    quantity: int
+
+
+class _RuleTable:
+    """Rules of one group (automatic, or one code) indexed by what they apply to"""
+
+    def __init__(self):
+        self.every_item: List[DiscountRule] = []
+        self.by_product: Dict[str, List[DiscountRule]] = {}
+        self.by_category: Dict[str, List[DiscountRule]] = {}
+        self.cart: List[DiscountRule] = []
+
+    def add(self, rule: DiscountRule):
+        if rule.scope == "cart":
+            self.cart.append(rule)
+        elif rule.target is None:
+            self.every_item.append(rule)
+        elif rule.scope == "item":
+            self.by_product.setdefault(str(rule.target), []).append(rule)
+        else:
+            self.by_category.setdefault(str(rule.target), []).append(rule)
+
+    def line_rules(self, line: CartLine) -> List[DiscountRule]:
+        return (
+            self.every_item
+            + self.by_product.get(line.product_id, [])
+            + self.by_category.get(line.category, [])
+        )
+
+
+def _apply_rules(rules: Iterable[DiscountRule], amount: float, quantity: int, now: datetime, applied: Dict[str, float]):
+    """Run rules in priority order over `amount`; return what is left to pay"""
+    exclusive_used = False
+    for rule in sorted(rules, key=lambda rule: (rule.priority, rule.rule_id)):
+        if not rule.is_live(now) or (exclusive_used and not rule.stackable):
+            continue
+        remaining = rule.strategy.apply(amount, quantity=quantity)
+        saved = amount - remaining
+        if saved <= 0:
+            continue
+        applied[rule.rule_id] = applied.get(rule.rule_id, 0.0) + saved
+        amount = remaining
+        if not rule.stackable:
+            exclusive_used = True
+    return amount
+
+
+class DiscountEngine:
+    """Compiled discount rules, swapped atomically when the rule set changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._automatic = _RuleTable()
+        self._by_code: Dict[str, _RuleTable] = {}
+        self.rule_count = 0
+        self.fingerprint = None
+        self.loaded_at: Optional[float] = None
+
+    def load(self, docs: Iterable[dict], fingerprint=None) -> List[str]:
+        """Compile rule documents, replacing the current rules.
+
+        Inactive or malformed rules are skipped; their ids and errors are returned.
+        """
+        automatic, by_code, count, errors = _RuleTable(), {}, 0, []
+        for doc in docs:
+            if doc.get("active", True) is False:
+                continue
+            try:
+                rule = DiscountRule.from_document(doc)
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append(f"{doc.get('rule_id') or doc.get('code') or doc.get('_id')}: {e}")
+                continue
+            table = by_code.setdefault(rule.code, _RuleTable()) if rule.code else automatic
+            table.add(rule)
+            count += 1
+        with self._lock:
+            self._automatic, self._by_code = automatic, by_code
+            self.rule_count = count
+            self.fingerprint = fingerprint
+            self.loaded_at = time.monotonic()
+        return errors
+
+    def _tables(self, code: Optional[str]) -> List[_RuleTable]:
+        with self._lock:
+            tables = [self._automatic]
+            if not code:
+                return tables
+            table = self._by_code.get(code.upper())
+        if table is not None:
+            tables.append(table)
+            return tables
+        # Codes without a stored rule fall back to the legacy code formats
+        strategy = get_discount_strategy(code)
+        if strategy is not None:
+            legacy = _RuleTable()
+            scope = "item" if isinstance(strategy, BuyXGetYDiscount) else "cart"
+            legacy.add(DiscountRule(code.upper(), strategy, scope=scope, code=code))
+            tables.append(legacy)
+        return tables
+
+    def evaluate(self, lines: Iterable[CartLine], code: Optional[str] = None, now: Optional[datetime] = None) -> dict:
+        """Price a cart: subtotal, discount, total and the amount saved per rule"""
+        now = now or datetime.utcnow()
+        tables = self._tables(code)
+        applied: Dict[str, float] = {}
+        subtotal = 0.0
+        after_lines = 0.0
+        for line in lines:
+            amount = line.unit_price * line.quantity
+            subtotal += amount
+            rules = [rule for table in tables for rule in table.line_rules(line)]
+            after_lines += _apply_rules(rules, amount, line.quantity, now, applied) if rules else amount
+
+        cart_rules = [
+            rule for table in tables for rule in table.cart if after_lines >= rule.min_subtotal
+        ]
+        total = _apply_rules(cart_rules, after_lines, 1, now, applied) if cart_rules else after_lines
+        total = round(max(total, 0.0), 2)
+        return {
+            "subtotal": round(subtotal, 2),
+            "discount": round(subtotal - total, 2),
+            "total": total,
+            "applied": [
+                {"rule_id": rule_id, "amount": round(amount, 2)} for rule_id, amount in applied.items()
+            ],
+            "code_accepted": not code or len(tables) > 1,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rules": self.rule_count,
+                "codes": sorted(self._by_code),
+                "loaded_seconds_ago": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at else None,
+            }
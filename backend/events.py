@@ -0,0 +1,99 @@
+"""
+Change events for products and stock.
+
+Write paths publish ChangeEvents once their database write has succeeded and
+subscribers keep everything derived from products in step: the product cache,
+the search index, the catalog version and the prices stored on carts. Events
+published together (e.g. every line of an order) reach each subscriber as one
+batch.
+
+With a relay (the shared Redis backend) every batch is also forwarded to the
+other workers. Subscribers that only refresh process-local state receive those
+relayed events too; subscribers that write to the database are registered with
+local_only=True so each change is applied exactly once.
+"""
+import threading
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+PRODUCT_CREATED = "product.created"
+PRODUCT_UPDATED = "product.updated"
+PRODUCT_DELETED = "product.deleted"
+STOCK_CHANGED = "stock.changed"
+
+
+class ChangeEvent(NamedTuple):
+    kind: str
+    product_id: str
+    source: str = "catalog"             # "catalog" or "selling_products"
+    fields: Tuple[str, ...] = ()        # fields the write changed
+    document: Optional[dict] = None     # the written document when the publisher has it; never relayed
+    remote: bool = False                # True when published by another worker
+
+
+class EventBus:
+    """Synchronous publish/subscribe; a failing subscriber is logged and never fails the write"""
+
+    CHANNEL = "events"
+
+    def __init__(self, relay=None):
+        self.relay = relay
+        self._subscribers: List[tuple] = []
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        if relay is not None:
+            relay.subscribe(self.CHANNEL, self._on_relayed)
+
+    def subscribe(self, handler: Callable[[List[ChangeEvent]], None], kinds: Optional[Iterable[str]] = None,
+                  local_only: bool = False):
+        """Call handler(events) with the events of `kinds` (all kinds by default) in each published batch"""
+        with self._lock:
+            self._subscribers.append((frozenset(kinds) if kinds else None, handler, local_only))
+
+    def publish(self, *events: ChangeEvent):
+        if not events:
+            return
+        self.published += len(events)
+        self._dispatch(list(events))
+        if self.relay is not None:
+            self.relay.publish(self.CHANNEL, {"events": [
+                {"kind": e.kind, "product_id": e.product_id, "source": e.source, "fields": list(e.fields)}
+                for e in events
+            ]})
+
+    def _on_relayed(self, message: dict):
+        events = [
+            ChangeEvent(e["kind"], e["product_id"], e.get("source", "catalog"), tuple(e.get("fields", ())), remote=True)
+            for e in message.get("events", [])
+        ]
+        self.received += len(events)
+        self._dispatch(events)
+
+    def _dispatch(self, events: List[ChangeEvent]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        remote = events[0].remote if events else False
+        for kinds, handler, local_only in subscribers:
+            if remote and local_only:
+                continue
+            batch = events if kinds is None else [event for event in events if event.kind in kinds]
+            if not batch:
+                continue
+            try:
+                handler(batch)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{getattr(handler, '__name__', handler)}: {type(e).__name__}: {e}"
+                print(f"Warning: change event subscriber failed: {self.last_error}")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "received": self.received,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "relay": self.relay is not None,
+        }
@@ -0,0 +1,61 @@
+"""
+Streaming NDJSON exports.
+
+Documents are read from a server-side cursor `batch_size` at a time and
+written out as one JSON object per line, a batch per chunk, so an export of
+any size is served in constant memory. If the database fails mid-export the
+connection is dropped instead of the response being completed, so a client
+never mistakes a truncated export for a whole one.
+"""
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+
+import orjson
+from fastapi import HTTPException
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def validate_batch_size(batch_size: int, maximum: int) -> int:
+    if not 1 <= batch_size <= maximum:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {maximum}")
+    return batch_size
+
+
+def to_naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert aware query parameters to match"""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def date_range(field: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """Filter for start <= field < end; either bound may be omitted"""
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lt"] = end
+    return {field: bounds} if bounds else {}
+
+
+def ndjson_batches(cursor, batch_size: int, serialize: Optional[Callable[[dict], dict]] = None,
+                   default=None) -> Iterator[bytes]:
+    """Yield the cursor's documents as NDJSON, `batch_size` lines per chunk; always closes the cursor"""
+    try:
+        lines = []
+        for doc in cursor:
+            lines.append(orjson.dumps(serialize(doc) if serialize else doc, default=default))
+            if len(lines) >= batch_size:
+                yield b"\n".join(lines) + b"\n"
+                lines = []
+        if lines:
+            yield b"\n".join(lines) + b"\n"
+    except Exception as e:
+        print(f"Export aborted: {type(e).__name__}: {e}")
+        raise
+    finally:
+        cursor.close()
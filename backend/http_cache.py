@@ -0,0 +1,79 @@
+"""
+Conditional GET helpers: strong ETags, Last-Modified and 304 responses.
+
+Product endpoints derive their validators from product updated_at values and
+the shared catalog version, so a request carrying a matching If-None-Match
+(or a fresh If-Modified-Since) is answered before the payload is built.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from starlette.responses import Response
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the given parts, e.g. ("products", version, limit)"""
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def http_date(moment: datetime) -> str:
+    """Format a naive-UTC or aware datetime as an IMF-fixdate"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        # If-None-Match uses the weak comparison, so W/"x" matches "x"
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: Optional[datetime]) -> bool:
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(request, etag: str, last_modified: Optional[datetime], cache_control: str) -> Optional[Response]:
+    """A 304 when the request's validators match, otherwise None.
+
+    If-Modified-Since is only consulted when there is no If-None-Match, as
+    RFC 9110 requires.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, etag)
+    else:
+        fresh = not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    if not fresh:
+        return None
+    return Response(status_code=304, headers=validator_headers(etag, last_modified, cache_control))
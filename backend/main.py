@@ -1,17 +1,53 @@
-from fastapi import FastAPI, HTTPException, Depends, Body
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi import FastAPI, HTTPException, Depends, Body, Request
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from passlib.context import CryptContext
 from jose import JWTError, jwt
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from contextlib import asynccontextmanager
+import asyncio
+import threading
+import time
+import anyio
+import orjson
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from bson import ObjectId
+from bson.errors import InvalidId
 import os
 import razorpay
 import hmac
+import heapq
+import itertools
+import json
+import base64
+import binascii
 import hashlib
+import re
 from dotenv import load_dotenv
+import db_indexes
+from search_index import ProductSearchIndex
+from password_hashing import PasswordHasher, PoolSaturated
+from metrics import MetricsMiddleware, MetricsRegistry
+from compression import CompressionMiddleware
+from cache_backends import RedisBackend, build_cache_backend
+from exports import NDJSON_MEDIA_TYPE, date_range, ndjson_batches, validate_batch_size
+from events import PRODUCT_CREATED, PRODUCT_DELETED, PRODUCT_UPDATED, STOCK_CHANGED, ChangeEvent, EventBus
+from http_cache import make_etag, not_modified_response, validator_headers
+from discounts import CartLine, DiscountEngine, DiscountRule
+# The strategies moved to discounts.py; re-exported because callers (test_discounts.py) import them from main
+from discounts import (  # noqa: F401
+    BuyXGetYDiscount,
+    DiscountStrategy,
+    FlatDiscount,
+    PercentageDiscount,
+    TenPercentOff,
+    get_discount_strategy,
+)
+from mongo_profiler import MongoProfiler
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,68 +61,194 @@ MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "e-commerce-app")
 COLLECTION_NAME = "users"
 
-# Global MongoDB connection variables
-client = None
-db = None
-users_collection = None
-products_collection = None
-cart_collection = None
-wishlist_collection = None
-orders_collection = None
-selling_products_collection = None
+# Connection pool sizing. Sync route handlers run on anyio's worker threads, so the
+# threadpool is sized to match the Mongo pool instead of anyio's default of 40.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+API_THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", str(MONGO_MAX_POOL_SIZE)))
+
+# Background health monitor: ping interval and backoff ceiling while pings fail (seconds)
+MONGO_HEALTH_CHECK_INTERVAL = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL", "15"))
+MONGO_RECONNECT_BACKOFF_MAX = float(os.getenv("MONGO_RECONNECT_BACKOFF_MAX", "60"))
+
+class MongoConnectionManager:
+    """Owns the shared MongoClient, cached collection handles and health state.
+
+    Requests never ping the server. Liveness is checked by the background
+    monitor task, which records the last result for /health and backs off
+    exponentially while pings keep failing. The client is never replaced while
+    the app runs: PyMongo re-establishes pooled connections itself, and closing
+    it would break requests still holding its collection handles.
+    """
+
+    def __init__(self, url: str, database_name: str, client_factory=MongoClient, **client_options):
+        self.url = url
+        self.database_name = database_name
+        self.client_factory = client_factory
+        self.client_options = client_options
+        self.client = None
+        self.db = None
+        self._collections = {}
+        self._lock = threading.Lock()
+        self.health = {
+            "status": "unknown",
+            "last_checked": None,
+            "latency_ms": None,
+            "error": None,
+            "consecutive_failures": 0,
+        }
+
+    def connect(self):
+        """Create the client on first use; PyMongo reconnects pooled sockets on its own"""
+        if self.client is None:
+            with self._lock:
+                if self.client is None:
+                    print(f"Connecting to MongoDB at {self.url}...")
+                    client = self.client_factory(self.url, **self.client_options)
+                    self.db = client[self.database_name]
+                    self._collections = {}
+                    self.client = client
+        return self.client
+
+    def collection(self, name: str):
+        handle = self._collections.get(name)
+        if handle is None:
+            self.connect()
+            handle = self._collections.setdefault(name, self.db[name])
+        return handle
+
+    def handles(self):
+        client = self.connect()
+        return (
+            client,
+            self.db,
+            self.collection(COLLECTION_NAME),
+            self.collection("products"),
+            self.collection("cart"),
+            self.collection("wishlist"),
+            self.collection("orders"),
+        )
+
+    def close(self):
+        with self._lock:
+            client, self.client, self.db, self._collections = self.client, None, None, {}
+        if client is not None:
+            client.close()
+
+    def ping(self) -> bool:
+        """Ping the server once and record the outcome in self.health"""
+        started = time.perf_counter()
+        try:
+            self.connect().admin.command("ping")
+        except Exception as e:
+            self.health = {
+                "status": "unhealthy",
+                "last_checked": datetime.utcnow(),
+                "latency_ms": None,
+                "error": str(e),
+                "consecutive_failures": self.health["consecutive_failures"] + 1,
+            }
+            return False
+        self.health = {
+            "status": "healthy",
+            "last_checked": datetime.utcnow(),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "error": None,
+            "consecutive_failures": 0,
+        }
+        return True
+
+    def next_check_delay(self) -> float:
+        """Regular interval while healthy, exponential backoff while failing"""
+        failures = self.health["consecutive_failures"]
+        if failures == 0:
+            return MONGO_HEALTH_CHECK_INTERVAL
+        return min(2 ** (failures - 1), MONGO_RECONNECT_BACKOFF_MAX)
+
+    async def monitor(self):
+        while True:
+            if not await anyio.to_thread.run_sync(self.ping):
+                print(f"MongoDB health check failed: {self.health['error']}")
+            await anyio.sleep(self.next_check_delay())
+
+# Requests issuing more than this many same-shaped MongoDB queries are reported as N+1
+MONGO_N_PLUS_ONE_THRESHOLD = int(os.getenv("MONGO_N_PLUS_ONE_THRESHOLD", "10"))
+mongo_profiler = MongoProfiler(MONGO_N_PLUS_ONE_THRESHOLD)
+
+mongo = MongoConnectionManager(
+    MONGO_URL,
+    DATABASE_NAME,
+    serverSelectionTimeoutMS=10000,
+    connectTimeoutMS=10000,
+    socketTimeoutMS=10000,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    event_listeners=[mongo_profiler],
+)
+
+# Cache tier: "memory" keeps every cache in-process; "redis" adds a shared
+# Redis tier behind each in-process cache, with pub/sub invalidation between workers
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "ecommerce:")
+# Longest an in-process copy of a shared entry is used without re-reading Redis
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "30"))
+
+shared_cache = RedisBackend(REDIS_URL, prefix=CACHE_KEY_PREFIX) if CACHE_BACKEND == "redis" else None
+
+# Product and stock writes are published here; see the subscribers after the cart endpoints.
+# With the Redis tier the events also reach the other workers.
+change_events = EventBus(relay=shared_cache)
 
 def get_mongo_client():
-    """Get or create MongoDB client with retry logic"""
-    global client, db, users_collection, products_collection, cart_collection, wishlist_collection, orders_collection, selling_products_collection
-    
+    """Return the shared client, database and cached collection handles"""
+    return mongo.handles()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the MongoDB pool once at startup, monitor it, and close it on shutdown"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
+    if await anyio.to_thread.run_sync(mongo.ping):
+        print("MongoDB connection successful!")
+    else:
+        print(f"Initial MongoDB connection failed: {mongo.health['error']}")
+        print("Health monitor will keep retrying in the background.")
+    await anyio.to_thread.run_sync(insert_sample_products)
+    await anyio.to_thread.run_sync(apply_database_migrations)
     try:
-        if client is None:
-            print(f"Connecting to MongoDB at {MONGO_URL}...")
-            client = MongoClient(
-                MONGO_URL, 
-                serverSelectionTimeoutMS=10000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=10000
-            )
-        
-        # Test connection
-        client.admin.command('ping')
-        
-        # Initialize database and collections
-        if db is None:
-            db = client[DATABASE_NAME]
-            users_collection = db[COLLECTION_NAME]
-            products_collection = db["products"]
-            cart_collection = db["cart"]
-            wishlist_collection = db["wishlist"]
-            orders_collection = db["orders"]
-            selling_products_collection = db["selling_products"]
-        
-        return client, db, users_collection, products_collection, cart_collection, wishlist_collection, orders_collection
+        await anyio.to_thread.run_sync(rebuild_search_index)
     except Exception as e:
-        print(f"MongoDB connection error: {e}")
-        print(f"Connection string: {MONGO_URL}")
-        print("Attempting to reconnect on next request...")
-        # Reset connection to allow retry
-        client = None
-        db = None
-        users_collection = None
-        products_collection = None
-        cart_collection = None
-        wishlist_collection = None
-        orders_collection = None
-        selling_products_collection = None
-        raise
+        print(f"Could not build search index, will retry on first search: {e}")
+    try:
+        await anyio.to_thread.run_sync(load_discount_rules)
+    except Exception as e:
+        print(f"Could not load discount rules, will retry on first cart total: {e}")
+    if shared_cache is not None:
+        shared_cache.start()
+    monitor_task = asyncio.create_task(mongo.monitor())
+    yield
+    monitor_task.cancel()
+    password_hasher.shutdown()
+    if shared_cache is not None:
+        shared_cache.close()
+    mongo.close()
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
-# Try initial connection
-try:
-    get_mongo_client()
-    print("MongoDB connection successful!")
-except Exception as e:
-    print(f"Initial MongoDB connection failed: {e}")
-    print("Will attempt to connect when first request is made.")
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson.
 
-app = FastAPI()
+    List endpoints return one of these directly, which skips FastAPI's
+    jsonable_encoder pass over every item. ObjectIds are written as strings.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default)
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -97,13 +259,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Response compression: encodings in preference order (empty disables it),
+# smallest body worth compressing, and the gzip level / Brotli quality
+COMPRESSION_ENCODINGS = [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "br,gzip").split(",") if e.strip()]
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+if COMPRESSION_ENCODINGS:
+    # Added before MetricsMiddleware so response sizes are measured after compression
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MINIMUM_SIZE,
+        gzip_level=GZIP_LEVEL,
+        brotli_quality=BROTLI_QUALITY,
+        encodings=COMPRESSION_ENCODINGS,
+    )
+
+metrics_registry = MetricsRegistry()
+app.add_middleware(MetricsMiddleware, registry=metrics_registry, observers=[mongo_profiler])
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+@app.exception_handler(ConnectionFailure)
+async def mongo_connection_failure_handler(request, exc: ConnectionFailure):
+    return JSONResponse(status_code=500, content={"detail": f"Database connection failed: {str(exc)}"})
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# bcrypt runs on a bounded process pool so login storms can't starve request threads
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+@app.exception_handler(PoolSaturated)
+async def password_pool_saturated_handler(request, exc: PoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many sign-in requests, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -112,6 +305,82 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# When false (the default), requests without a bearer token are still served so
+# existing clients keep working; a token that is present is always verified.
+REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "false").lower() in ("1", "true", "yes")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+
+class DecodedTokenCache:
+    """Verified JWT claims keyed by the token's SHA-256, each kept until the token expires.
+
+    With CACHE_BACKEND=redis the claims are shared, so a token verified by one
+    worker is not decoded again by the others.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, clock=time.time, backend=None):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.backend = backend or build_cache_backend("memory", maxsize, clock=clock)
+
+    def get(self, key: bytes) -> Optional[dict]:
+        claims = self.backend.get(f"token:{key.hex()}")
+        if claims is None or claims["exp"] <= self.clock():
+            return None
+        return claims
+
+    def put(self, key: bytes, claims: dict):
+        if self.maxsize <= 0:
+            return
+        self.backend.set(f"token:{key.hex()}", claims, claims["exp"] - self.clock())
+
+token_cache = DecodedTokenCache(
+    backend=build_cache_backend(CACHE_BACKEND, TOKEN_CACHE_SIZE, shared_cache, CACHE_LOCAL_TTL, clock=time.time)
+)
+
+def decode_access_token(token: str) -> dict:
+    """Verify a token locally (signature and expiry) and return its claims; no database lookup"""
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        claims = None
+    if not claims or not claims.get("sub") or "exp" not in claims:
+        raise HTTPException(
+            status_code=401,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    token_cache.put(key, claims)
+    return claims
+
+def get_current_user(token: Optional[str] = Depends(oauth2_scheme)) -> Optional[str]:
+    """Email of the bearer-token user, or None for anonymous requests when REQUIRE_AUTH is off"""
+    if token is None:
+        if REQUIRE_AUTH:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    return decode_access_token(token)["sub"]
+
+def authorize_user(user_email: str, current_user: Optional[str]):
+    """Reject requests that act on another user's data"""
+    if current_user is not None and current_user != user_email:
+        raise HTTPException(status_code=403, detail="Not allowed to access another user's data")
+
+# Accounts allowed to read every user's data (e.g. the unfiltered exports), comma-separated emails
+ADMIN_EMAILS = {email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+def authorize_admin(current_user: Optional[str]):
+    """Require a bearer token for an ADMIN_EMAILS account, whatever REQUIRE_AUTH says"""
+    if current_user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if current_user not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
 class UserCreate(BaseModel):
     username: str
     email: str
@@ -159,58 +428,316 @@ class ProductUpdate(BaseModel):
 PRODUCTS_COLLECTION_NAME = "products"
 SELLER_PRODUCT_PREFIX = "seller_"
 
+# Fields read by convert_product_to_dict / convert_listing_to_dict; list queries
+# fetch only these so large unused fields never leave MongoDB
+PRODUCT_PROJECTION = dict.fromkeys(
+    ("name", "description", "price", "category", "in_stock", "quantity", "image_url", "imageUrl", "image",
+     "created_at", "updated_at", "seller_email", "status"),
+    1,
+)
+LISTING_PROJECTION = dict.fromkeys(
+    ("name", "description", "price", "category", "quantity", "image_url", "seller_email"), 1
+)
+
 def convert_product_to_dict(product_doc, source: str = "catalog"):
-    """Convert MongoDB product document to a proper dictionary"""
+    """Convert a MongoDB product document to the dict the API returns.
+
+    Runs for every product in every list response, so the document is read
+    in place and each field is looked up once.
+    """
     if product_doc is None:
         return None
-    
-    # MongoDB documents from PyMongo are already dict-like, but ensure proper conversion
-    # Handle both dict and BSON document types
-    if isinstance(product_doc, dict):
-        product_dict = product_doc
-    else:
-        # Convert BSON document to dict
-        try:
-            product_dict = dict(product_doc)
-        except (TypeError, AttributeError):
-            # Fallback: try to access as dict
-            product_dict = {k: getattr(product_doc, k, None) for k in dir(product_doc) if not k.startswith('_')}
-    
-    # Get image_url - try multiple possible field names and handle None
-    image_url = (
-        product_dict.get("image_url") or 
-        product_dict.get("imageUrl") or 
-        product_dict.get("image") or 
-        ""
-    )
-    # Ensure it's a string, not None
-    if image_url is None:
-        image_url = ""
-    
-    # Build the result dictionary, ensuring all values are JSON-serializable
-    product_id = str(product_dict.get("_id", ""))
+    if not isinstance(product_doc, dict):
+        # e.g. RawBSONDocument
+        product_doc = dict(product_doc)
+    get = product_doc.get
+
+    product_id = str(get("_id", ""))
     if source == "seller":
-        product_id = f"{SELLER_PRODUCT_PREFIX}{product_id}"
-        stock_value = int(product_dict.get("quantity", product_dict.get("in_stock", 0)))
+        product_id = SELLER_PRODUCT_PREFIX + product_id
+        stock_value = get("quantity", get("in_stock", 0))
+        status = get("status", "unsold")
     else:
-        stock_value = int(product_dict.get("in_stock", product_dict.get("quantity", 0)))
-    
-    result = {
+        stock_value = get("in_stock", get("quantity", 0))
+        status = get("status", "active")
+    # Older documents use imageUrl or image instead of image_url
+    image_url = get("image_url") or get("imageUrl") or get("image") or ""
+
+    return {
         "_id": product_id,
-        "name": str(product_dict.get("name", "")),
-        "description": str(product_dict.get("description", "")),
-        "price": float(product_dict.get("price", 0.0)),
-        "category": str(product_dict.get("category", "")),
-        "in_stock": stock_value,
-        "image_url": str(image_url),  # Explicitly convert to string
-        "created_at": product_dict.get("created_at"),
-        "updated_at": product_dict.get("updated_at"),
+        "name": str(get("name", "")),
+        "description": str(get("description", "")),
+        "price": float(get("price", 0.0)),
+        "category": str(get("category", "")),
+        "in_stock": int(stock_value),
+        "image_url": str(image_url),
+        "created_at": get("created_at"),
+        "updated_at": get("updated_at"),
         "source": source,
-        "seller_email": product_dict.get("seller_email"),
-        "status": product_dict.get("status", "unsold" if source == "seller" else product_dict.get("status", "active")),
+        "seller_email": get("seller_email"),
+        "status": status,
     }
-    
-    return result
+
+# User listings that are still for sale and appear alongside the catalog in /products
+AVAILABLE_LISTING_FILTER = {"quantity": {"$gt": 0}, "status": {"$ne": "sold"}}
+
+def convert_listing_to_dict(listing_doc):
+    """Convert a selling_products document to the shape /products returns for user listings"""
+    return {
+        "_id": str(listing_doc.get("_id")),
+        "name": listing_doc.get("name", ""),
+        "description": listing_doc.get("description", ""),
+        "price": float(listing_doc.get("price", 0)),
+        "category": listing_doc.get("category", "User Listings"),
+        "in_stock": int(listing_doc.get("quantity", 0)),
+        "image_url": listing_doc.get("image_url", ""),
+        "seller_email": listing_doc.get("seller_email", ""),
+        "is_user_listing": True,
+        "source": "selling_products",
+    }
+
+# Product cache sizing: max entries and seconds before an entry is re-read
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "5000"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "300"))
+
+class ProductCache:
+    """Converted product dicts keyed by ObjectId, held in a cache backend.
+
+    Entries expire after `ttl` seconds so writes made outside this process are
+    eventually picked up; writes made here invalidate the affected ids directly
+    (and, with a shared backend, in every other worker too).
+    """
+
+    def __init__(self, maxsize: int = PRODUCT_CACHE_SIZE, ttl: float = PRODUCT_CACHE_TTL, clock=time.monotonic,
+                 backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend or build_cache_backend("memory", maxsize, clock=clock)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(product_id) -> str:
+        return f"product:{product_id}"
+
+    def get(self, product_id: ObjectId) -> Optional[dict]:
+        return self.get_many([product_id]).get(product_id)
+
+    def get_many(self, product_ids) -> Dict[ObjectId, dict]:
+        """Look up many ids at once; a shared backend answers them in one round trip"""
+        product_ids = list(product_ids)
+        if not product_ids or self.maxsize <= 0:
+            return {}
+        stored = self.backend.get_many([self._key(pid) for pid in product_ids])
+        found = {}
+        for product_id in product_ids:
+            product = stored.get(self._key(product_id))
+            if product is not None:
+                found[product_id] = dict(product)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(product_ids) - len(found)
+        return found
+
+    def put(self, product_id: ObjectId, product: dict):
+        self.put_many({product_id: product})
+
+    def put_many(self, products: Dict[ObjectId, dict]):
+        """Store many products in one backend call (one pipelined round trip with Redis)"""
+        if self.maxsize <= 0 or not products:
+            return
+        self.backend.set_many({self._key(pid): dict(product) for pid, product in products.items()}, self.ttl)
+
+    def invalidate(self, *product_ids):
+        self.backend.delete(*[self._key(pid) for pid in product_ids])
+
+    def clear(self):
+        self.backend.clear("product:")
+
+    def stats(self) -> dict:
+        backend = self.backend.stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": backend.get("size", 0),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": backend.get("evictions", 0),
+                "expirations": backend.get("expirations", 0),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "backend": backend,
+            }
+
+product_cache = ProductCache(
+    backend=build_cache_backend(CACHE_BACKEND, PRODUCT_CACHE_SIZE, shared_cache, CACHE_LOCAL_TTL)
+)
+
+# Cache-Control max-age, in seconds, for product responses; clients revalidate
+# with If-None-Match afterwards and usually get a 304
+PRODUCT_HTTP_MAX_AGE = int(os.getenv("PRODUCT_HTTP_MAX_AGE", "60"))
+PRODUCT_CACHE_CONTROL = f"public, max-age={PRODUCT_HTTP_MAX_AGE}"
+# How long a worker trusts its last read of the shared catalog version
+CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", "1"))
+
+class CatalogVersion:
+    """Counter bumped by every write that can change a product response.
+
+    The value lives in the catalog_meta collection so all workers share it.
+    Each worker re-reads it at most once per `ttl` seconds; its own bumps are
+    visible immediately. List and search ETags are derived from it.
+    """
+
+    def __init__(self, ttl: float = CATALOG_VERSION_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._version = 0
+        self._modified_at: Optional[datetime] = None
+        self._read_at: Optional[float] = None
+
+    def _store(self, doc):
+        with self._lock:
+            self._version = doc.get("version", 0) if doc else 0
+            self._modified_at = doc.get("updated_at") if doc else None
+            self._read_at = self.clock()
+
+    def current(self) -> Tuple[int, Optional[datetime]]:
+        read_at = self._read_at
+        if read_at is None or self.clock() - read_at > self.ttl:
+            _, db, _, _, _, _, _ = get_mongo_client()
+            self._store(db["catalog_meta"].find_one({"_id": "catalog"}))
+        return self._version, self._modified_at
+
+    def bump(self):
+        try:
+            _, db, _, _, _, _, _ = get_mongo_client()
+            doc = db["catalog_meta"].find_one_and_update(
+                {"_id": "catalog"},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            # The write itself succeeded; only HTTP revalidation is affected
+            print(f"Could not bump catalog version: {e}")
+            self._read_at = None
+            return
+        self._store(doc)
+
+catalog_version = CatalogVersion()
+
+# Seconds before the search index is rebuilt from the database, which picks up
+# writes made by other workers; writes made in this process (and, with the Redis
+# tier, relayed ones) are indexed directly by the change event subscribers
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "300"))
+SEARCH_INDEX_FIELDS = {"name": 1, "description": 1, "category": 1, "price": 1}
+
+search_index = ProductSearchIndex()
+_search_index_rebuild_lock = threading.Lock()
+
+def rebuild_search_index():
+    """Re-index every catalog product and available user listing"""
+    _, db, _, products_collection, _, _, _ = get_mongo_client()
+
+    def entries():
+        for doc in products_collection.find({}, SEARCH_INDEX_FIELDS):
+            yield doc["_id"], doc, "catalog"
+        for doc in db["selling_products"].find(AVAILABLE_LISTING_FILTER, SEARCH_INDEX_FIELDS):
+            yield doc["_id"], doc, "selling_products"
+
+    search_index.rebuild(entries())
+
+def ensure_search_index():
+    """Build the search index on first use and refresh it once it gets stale.
+
+    Only one request rebuilds at a time; the others keep searching the current
+    index unless there is none yet.
+    """
+    def is_stale():
+        built_at = search_index.built_at
+        return built_at is None or time.monotonic() - built_at > SEARCH_INDEX_REFRESH_SECONDS
+
+    if not is_stale():
+        return
+    if _search_index_rebuild_lock.acquire(blocking=not search_index.ready):
+        try:
+            if is_stale():
+                rebuild_search_index()
+        finally:
+            _search_index_rebuild_lock.release()
+
+def encode_cursor(payload: dict) -> str:
+    """Encode a keyset position as an opaque, URL-safe cursor token"""
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> dict:
+    """Decode a cursor produced by encode_cursor, rejecting anything malformed with a 400"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(payload, dict):
+            raise ValueError("cursor payload must be an object")
+        payload["id"] = ObjectId(payload["id"])
+        if "created_at" in payload:
+            payload["created_at"] = datetime.fromisoformat(payload["created_at"])
+        return payload
+    except (ValueError, TypeError, KeyError, InvalidId, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _to_object_id(product_id: str) -> Optional[ObjectId]:
+    """Parse a cart/wishlist product id (optionally seller-prefixed) into an ObjectId"""
+    raw_id = str(product_id)
+    if raw_id.startswith(SELLER_PRODUCT_PREFIX):
+        raw_id = raw_id[len(SELLER_PRODUCT_PREFIX):]
+    try:
+        return ObjectId(raw_id)
+    except (InvalidId, TypeError):
+        return None
+
+def hydrate_products(product_ids: List[str], fresh: bool = False):
+    """Resolve product ids to converted product dicts in as few round trips as possible.
+
+    All ids are looked up with a single $in query against the catalog; only the ids
+    that were not found there are looked up (again with one $in query) in
+    selling_products. Returns a tuple (products, missing) where products maps each
+    requested id to its converted dict and missing lists the unresolved ids in
+    request order.
+
+    With fresh=True the product cache is neither read nor written. Prices that get
+    stored (cart line snapshots) must use it: another worker may have changed a
+    price this worker still has cached.
+    """
+    _, db, _, products_collection, _, _, _ = get_mongo_client()
+
+    object_ids = {pid: _to_object_id(pid) for pid in product_ids}
+    wanted = {oid for oid in object_ids.values() if oid is not None}
+
+    found = {} if fresh else product_cache.get_many(wanted)
+    remaining = wanted - found.keys()
+    if remaining:
+        loaded = {}
+        for doc in products_collection.find({"_id": {"$in": list(remaining)}}, PRODUCT_PROJECTION):
+            loaded[doc["_id"]] = convert_product_to_dict(doc)
+        remaining -= loaded.keys()
+        if remaining:
+            for doc in db["selling_products"].find({"_id": {"$in": list(remaining)}}, LISTING_PROJECTION):
+                loaded[doc["_id"]] = convert_listing_to_dict(doc)
+        if not fresh:
+            product_cache.put_many(loaded)
+        found.update(loaded)
+
+    products = {}
+    missing = []
+    for pid in product_ids:
+        product = found.get(object_ids[pid])
+        if product is None:
+            missing.append(pid)
+        else:
+            products[pid] = product
+    return products, missing
 
 def insert_sample_products():
     try:
@@ -299,10 +826,19 @@ def insert_sample_products():
                 },
             ]
             products_collection.insert_many(sample_products)
+            change_events.publish(*(
+                ChangeEvent(PRODUCT_CREATED, str(doc["_id"]), document=doc) for doc in sample_products
+            ))
     except Exception as e:
         print(f"Could not insert sample products: {e}")
 
-insert_sample_products()
+def apply_database_migrations():
+    """Create declared indexes and run pending migrations (see db_indexes.py)"""
+    try:
+        _, db, _, _, _, _, _ = get_mongo_client()
+        db_indexes.bootstrap(db)
+    except Exception as e:
+        print(f"Could not apply indexes and migrations: {e}")
 
 class CartItem(BaseModel):
     product_id: str
@@ -316,6 +852,24 @@ class Wishlist(BaseModel):
     user_email: str
     product_ids: list[str] = []
 
+class CartOperation(BaseModel):
+    op: str  # add (increment), set (quantity <= 0 removes), remove
+    product_id: str
+    quantity: int = 1
+
+class CartBulkUpdate(BaseModel):
+    user_email: str
+    operations: List[CartOperation]
+
+class WishlistBulkUpdate(BaseModel):
+    user_email: str
+    add: List[str] = []
+    remove: List[str] = []
+
+class WishlistMoveToCart(BaseModel):
+    user_email: str
+    product_ids: Optional[List[str]] = None  # None moves the whole wishlist
+
 class ShippingAddress(BaseModel):
     full_name: str
     phone: str
@@ -364,165 +918,419 @@ if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
 else:
     print("Warning: Razorpay keys not found. Payment features will not work.")
 
-class DiscountStrategy:
-    def apply(self, total: float) -> float:
-        return total
-
-class TenPercentOff(DiscountStrategy):
-    def apply(self, total: float) -> float:
-        return total * 0.9
-
-class FlatDiscount(DiscountStrategy):
-    def __init__(self, amount: float):
-        self.amount = amount
-    def apply(self, total: float) -> float:
-        return max(0, total - self.amount)
-
-def get_discount_strategy(discount_code: Optional[str]) -> Optional[DiscountStrategy]:
-    """Factory function to get discount strategy based on discount code"""
-    if not discount_code:
-        return None
-    
-    discount_code = discount_code.upper()
-    
-    if discount_code == "10PERCENT" or discount_code == "TENOFF":
-        return TenPercentOff()
-    elif discount_code.startswith("FLAT"):
-        # Extract amount from code like "FLAT50"
-        try:
-            amount = float(discount_code.replace("FLAT", ""))
-            return FlatDiscount(amount)
-        except ValueError:
-            return None
-    else:
-        return None
+# Seconds between checks of the discounts collection for rules changed by other
+# workers; changes made through this process's /discounts routes apply at once
+DISCOUNT_RULES_REFRESH_SECONDS = float(os.getenv("DISCOUNT_RULES_REFRESH_SECONDS", "30"))
+
+discount_engine = DiscountEngine()
+_discount_rules_lock = threading.Lock()
+_discount_rules_checked_at = None
+
+class DiscountRuleIn(BaseModel):
+    code: Optional[str] = None
+    type: str = "percentage"
+    value: float = 0.0
+    scope: str = "cart"
+    target: Optional[str] = None
+    buy_x: Optional[int] = None
+    get_y: Optional[int] = None
+    stackable: bool = False
+    priority: int = 0
+    min_subtotal: float = 0.0
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    active: bool = True
+
+def _discount_rules_fingerprint(discounts_collection):
+    latest = discounts_collection.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    return discounts_collection.count_documents({}), latest.get("updated_at") if latest else None
+
+def load_discount_rules():
+    """Compile the discounts collection into the in-memory rule tables"""
+    global _discount_rules_checked_at
+    _, db, _, _, _, _, _ = get_mongo_client()
+    discounts_collection = db["discounts"]
+    fingerprint = _discount_rules_fingerprint(discounts_collection)
+    for error in discount_engine.load(discounts_collection.find({}), fingerprint):
+        print(f"Skipping invalid discount rule {error}")
+    _discount_rules_checked_at = time.monotonic()
+
+def ensure_discount_rules():
+    """Recompile the rules when the collection changed since the last check.
+
+    The check is a count plus the newest updated_at, made at most once every
+    DISCOUNT_RULES_REFRESH_SECONDS; unchanged rules are not recompiled.
+    """
+    global _discount_rules_checked_at
+    checked_at = _discount_rules_checked_at
+    if checked_at is not None and time.monotonic() - checked_at < DISCOUNT_RULES_REFRESH_SECONDS:
+        return
+    if not _discount_rules_lock.acquire(blocking=checked_at is None):
+        return
+    try:
+        _, db, _, _, _, _, _ = get_mongo_client()
+        if discount_engine.loaded_at is None or _discount_rules_fingerprint(db["discounts"]) != discount_engine.fingerprint:
+            load_discount_rules()
+        else:
+            _discount_rules_checked_at = time.monotonic()
+    finally:
+        _discount_rules_lock.release()
 
 @app.get("/cart", response_model=dict)
-def get_cart(user_email: str):
+def get_cart(user_email: str, current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, cart_collection, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     cart = cart_collection.find_one({"user_email": user_email})
-    items = cart["items"] if cart else []
-    return {"items": items}
+    return {"items": _cart_items(cart)}
+
+# Cached /cart/total results, one entry per user holding a total per discount code.
+# Every cart write drops the entry; catalog and discount changes are caught by the
+# stamp stored with it. The TTL bounds a total computed concurrently with a write.
+CART_TOTAL_CACHE_SIZE = int(os.getenv("CART_TOTAL_CACHE_SIZE", "10000"))
+CART_TOTAL_CACHE_TTL = float(os.getenv("CART_TOTAL_CACHE_TTL", "30"))
+cart_total_cache = build_cache_backend(CACHE_BACKEND, CART_TOTAL_CACHE_SIZE, shared_cache, CACHE_LOCAL_TTL)
+
+def invalidate_cart_total(user_email: str):
+    cart_total_cache.delete(f"cart_total:{user_email}")
+
+# Cart documents are materialized for /cart/total: every line stores the
+# unit_price and category it was priced at (unit_price is None for unknown
+# products), so pricing a cart needs no product lookups. A product price change
+# only sets "stale_since" on the carts holding it; the next /cart/total
+# reprices those carts (and carts written before this format) and stores the
+# result.
+def _cart_lines(items) -> list:
+    """Cart lines as returned by the API, without the stored price snapshot"""
+    return [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in items]
+
+def _cart_items_raw(cart) -> list:
+    return cart.get("items", []) if cart else []
+
+def _cart_items(cart) -> list:
+    return _cart_lines(_cart_items_raw(cart))
+
+def _price_snapshot(products: dict, product_id: str) -> dict:
+    product = products.get(product_id)
+    if product is None:
+        return {"unit_price": None, "category": None}
+    return {"unit_price": float(product["price"]), "category": product.get("category")}
+
+def _cart_needs_repricing(cart) -> bool:
+    return (
+        cart.get("stale_since") is not None
+        or any("unit_price" not in item for item in cart.get("items", []))
+    )
+
+def _reprice_cart(cart_collection, cart):
+    """Re-snapshot every line at current prices and store the result.
+
+    The write only lands if neither the lines nor the stale marker changed since
+    `cart` was read; otherwise the next read simply reprices again. Prices come
+    from the database, not the product cache.
+    """
+    items = cart.get("items", [])
+    products, _ = hydrate_products([item["product_id"] for item in items], fresh=True)
+    repriced = [
+        {"product_id": item["product_id"], "quantity": item["quantity"], **_price_snapshot(products, item["product_id"])}
+        for item in items
+    ]
+    cart_collection.update_one(
+        {"_id": cart["_id"], "items": items, "stale_since": cart.get("stale_since")},
+        {"$set": {"items": repriced}, "$unset": {"stale_since": ""}},
+    )
+    return {**cart, "items": repriced}
+
+def mark_carts_stale(product_ids: List[str]):
+    """Flag carts holding any of `product_ids` for repricing on their next /cart/total"""
+    _, _, _, _, cart_collection, _, _ = get_mongo_client()
+    cart_collection.update_many(
+        {"items.product_id": {"$in": list(product_ids)}}, {"$set": {"stale_since": datetime.utcnow()}}
+    )
+
+# --- Change event subscribers ---
+# Fields that, when written, change a product's search entry or listing availability
+_REINDEX_FIELDS = set(SEARCH_INDEX_FIELDS) | {"quantity", "status"}
+# Fields cart lines are priced from
+_CART_PRICE_FIELDS = {"price", "category"}
+
+def _listing_available(doc) -> bool:
+    return doc.get("quantity", 0) > 0 and doc.get("status") != "sold"
+
+def _refresh_product_views(events: List[ChangeEvent]):
+    """Bring this worker's product cache and search index up to date; also runs for other workers' events"""
+    _, db, _, products_collection, _, _, _ = get_mongo_client()
+    for event in events:
+        oid = ObjectId(event.product_id)
+        document = event.document
+        if event.kind == PRODUCT_UPDATED and event.source == "catalog" and document is not None:
+            product_cache.put(oid, convert_product_to_dict(document))
+        else:
+            product_cache.invalidate(oid)
+        if event.kind == PRODUCT_DELETED:
+            search_index.remove(oid)
+            continue
+        if event.kind != PRODUCT_CREATED and not _REINDEX_FIELDS.intersection(event.fields):
+            continue
+        if event.kind == STOCK_CHANGED and event.source == "catalog":
+            continue
+        if document is None:
+            collection = products_collection if event.source == "catalog" else db["selling_products"]
+            document = collection.find_one({"_id": oid}, {**SEARCH_INDEX_FIELDS, "quantity": 1, "status": 1})
+        if document is None or (event.source == "selling_products" and not _listing_available(document)):
+            search_index.remove(oid)
+        else:
+            search_index.add(oid, document, event.source)
+
+def _bump_catalog_version(events: List[ChangeEvent]):
+    catalog_version.bump()
+
+def _reprice_carts(events: List[ChangeEvent]):
+    product_ids = [
+        event.product_id for event in events
+        if event.kind == PRODUCT_DELETED or _CART_PRICE_FIELDS.intersection(event.fields)
+    ]
+    if product_ids:
+        mark_carts_stale(product_ids)
+
+change_events.subscribe(_refresh_product_views)
+# These write shared state, so only the worker that made the change runs them
+change_events.subscribe(_bump_catalog_version, local_only=True)
+change_events.subscribe(_reprice_carts, kinds=(PRODUCT_UPDATED, PRODUCT_DELETED), local_only=True)
+
+def _increment_cart_item(cart_collection, user_email: str, product_id: str, quantity: int, snapshot: dict):
+    """Atomically add `quantity` to a cart line, creating the line or the cart if needed.
+
+    The common case (line already present) is a single $inc of the quantity. A
+    new line is $push-ed with a filter that only matches carts
+    without it; if another request wins that race, the upsert hits the unique
+    user_email index and the $inc is retried.
+    """
+    for _ in range(3):
+        cart = cart_collection.find_one_and_update(
+            {"user_email": user_email, "items.product_id": product_id},
+            {"$inc": {"items.$.quantity": quantity}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if cart is not None:
+            return cart
+        try:
+            return cart_collection.find_one_and_update(
+                {"user_email": user_email, "items.product_id": {"$ne": product_id}},
+                {"$push": {"items": {"product_id": product_id, "quantity": quantity, **snapshot}}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            continue
+    raise HTTPException(status_code=409, detail="Cart was modified concurrently, please retry")
 
 @app.post("/cart/add", response_model=dict)
-def add_to_cart(user_email: str = Body(...), product_id: str = Body(...), quantity: int = Body(1)):
+def add_to_cart(user_email: str = Body(...), product_id: str = Body(...), quantity: int = Body(1), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
+    if quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity to add must be positive")
     try:
         _, _, _, _, cart_collection, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    cart = cart_collection.find_one({"user_email": user_email})
-    items = cart["items"] if cart else []
-    found = False
-    for item in items:
-        if item["product_id"] == product_id:
-            item["quantity"] += quantity
-            found = True
-            break
-    if not found:
-        items.append({"product_id": product_id, "quantity": quantity})
-    cart_collection.update_one(
-        {"user_email": user_email},
-        {"$set": {"items": items}},
-        upsert=True
-    )
-    return {"message": "Added to cart", "cart": items}
+    products, _ = hydrate_products([product_id], fresh=True)
+    cart = _increment_cart_item(cart_collection, user_email, product_id, quantity, _price_snapshot(products, product_id))
+    invalidate_cart_total(user_email)
+    return {"message": "Added to cart", "cart": _cart_items(cart)}
 
 @app.put("/cart/update", response_model=dict)
-def update_cart(user_email: str = Body(...), product_id: str = Body(...), quantity: int = Body(...)):
+def update_cart(user_email: str = Body(...), product_id: str = Body(...), quantity: int = Body(...), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, cart_collection, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    cart = cart_collection.find_one({"user_email": user_email})
-    items = cart["items"] if cart else []
-    for item in items:
-        if item["product_id"] == product_id:
-            if quantity > 0:
-                item["quantity"] = quantity
-            else:
-                items.remove(item)
-            break
-    cart_collection.update_one(
-        {"user_email": user_email},
-        {"$set": {"items": items}},
-        upsert=True
-    )
-    return {"message": "Cart updated", "cart": items}
+    if quantity > 0:
+        cart = cart_collection.find_one_and_update(
+            {"user_email": user_email, "items.product_id": product_id},
+            {"$set": {"items.$.quantity": quantity}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if cart is None:
+            # Product is not in the cart: nothing to update
+            cart = cart_collection.find_one({"user_email": user_email})
+    else:
+        cart = cart_collection.find_one_and_update(
+            {"user_email": user_email},
+            {"$pull": {"items": {"product_id": product_id}}},
+            return_document=ReturnDocument.AFTER,
+        )
+    invalidate_cart_total(user_email)
+    return {"message": "Cart updated", "cart": _cart_items(cart)}
 
 @app.delete("/cart/remove", response_model=dict)
-def remove_from_cart(user_email: str = Body(...), product_id: str = Body(...)):
+def remove_from_cart(user_email: str = Body(...), product_id: str = Body(...), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, cart_collection, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    cart = cart_collection.find_one({"user_email": user_email})
-    items = cart["items"] if cart else []
-    items = [item for item in items if item["product_id"] != product_id]
-    cart_collection.update_one(
+    cart = cart_collection.find_one_and_update(
         {"user_email": user_email},
-        {"$set": {"items": items}},
-        upsert=True
+        {"$pull": {"items": {"product_id": product_id}}},
+        return_document=ReturnDocument.AFTER,
     )
-    return {"message": "Removed from cart", "cart": items}
+    invalidate_cart_total(user_email)
+    return {"message": "Removed from cart", "cart": _cart_items(cart)}
 
 @app.post("/cart/clear", response_model=dict)
-def clear_cart(user_email: str = Body(...)):
+def clear_cart(user_email: str = Body(...), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, cart_collection, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     cart_collection.update_one(
         {"user_email": user_email},
-        {"$set": {"items": []}},
+        {"$set": {"items": []}, "$unset": {"stale_since": ""}},
         upsert=True
     )
+    invalidate_cart_total(user_email)
     return {"message": "Cart cleared"}
 
+# Most operations one bulk cart/wishlist request may carry
+BULK_MAX_OPERATIONS = int(os.getenv("BULK_MAX_OPERATIONS", "100"))
+
+def _replace_list_atomically(collection, user_email: str, field: str, mutate):
+    """Apply mutate(old list) -> new list to one user's document in a single write.
+
+    The write only matches if the list is still what was read (a compare-and-set
+    on the whole array), so concurrent single-item calls are never lost; on a
+    conflict the read and mutate are retried.
+    """
+    for _ in range(3):
+        doc = collection.find_one({"user_email": user_email})
+        current = doc.get(field) if doc else None
+        updated = mutate(list(current or []))
+        if doc is None:
+            try:
+                collection.insert_one({"user_email": user_email, field: updated})
+                return updated
+            except DuplicateKeyError:
+                continue
+        guard = {field: current} if current is not None else {field: {"$exists": False}}
+        if collection.update_one({"_id": doc["_id"], **guard}, {"$set": {field: updated}}).matched_count:
+            return updated
+    raise HTTPException(status_code=409, detail=f"{collection.name.capitalize()} was modified concurrently, please retry")
+
+def _require_products(product_ids: List[str], fresh: bool = False):
+    """Resolve the ids with hydrate_products (see `fresh` there); 404 on any unknown id"""
+    found, missing = hydrate_products(list(dict.fromkeys(product_ids)), fresh)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Products not found: {', '.join(missing)}")
+    return found
+
+def _apply_cart_operations(items: list, operations: List[CartOperation], products: dict) -> list:
+    """New lines are snapshotted from `products`; existing lines keep the price they were added at"""
+    lines = {item["product_id"]: item for item in items}
+    for operation in operations:
+        line = lines.get(operation.product_id)
+        if line is None and operation.op != "remove":
+            line = {"product_id": operation.product_id, "quantity": 0, **_price_snapshot(products, operation.product_id)}
+        if operation.op == "add":
+            lines[operation.product_id] = {**line, "quantity": line["quantity"] + operation.quantity}
+        elif operation.op == "set" and operation.quantity > 0:
+            lines[operation.product_id] = {**line, "quantity": operation.quantity}
+        else:
+            lines.pop(operation.product_id, None)
+    return list(lines.values())
+
+@app.post("/cart/bulk", response_model=dict)
+def bulk_update_cart(update: CartBulkUpdate, current_user: Optional[str] = Depends(get_current_user)):
+    """Apply a list of add/set/remove operations to a cart in one atomic write.
+
+    Every product that is added or set is validated up front; if any is
+    unknown nothing is changed.
+    """
+    authorize_user(update.user_email, current_user)
+    if len(update.operations) > BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_OPERATIONS} operations per request")
+    for operation in update.operations:
+        if operation.op not in ("add", "set", "remove"):
+            raise HTTPException(status_code=400, detail=f"Unknown cart operation {operation.op!r}")
+        if operation.op == "add" and operation.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity to add must be positive")
+    try:
+        _, _, _, _, cart_collection, _, _ = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    products = _require_products([operation.product_id for operation in update.operations if operation.op != "remove"], fresh=True)
+    items = _replace_list_atomically(
+        cart_collection, update.user_email, "items",
+        lambda items: _apply_cart_operations(items, update.operations, products),
+    )
+    invalidate_cart_total(update.user_email)
+    return {"message": "Cart updated", "cart": _cart_lines(items), "applied": len(update.operations)}
+
 @app.get("/cart/total", response_model=dict)
-def cart_total(user_email: str, discount: str = None):
+def cart_total(user_email: str, discount: str = None, current_user: Optional[str] = Depends(get_current_user)):
+    """Price the cart from its stored line prices, reusing a cached result until the cart, catalog or discount rules change.
+
+    Only carts flagged stale by a price change (or never priced) have their
+    products looked up.
+    """
+    authorize_user(user_email, current_user)
     try:
-        _, _, _, products_collection, cart_collection, _, _ = get_mongo_client()
+        _, _, _, _, cart_collection, _, _ = get_mongo_client()
+        version, _ = catalog_version.current()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    ensure_discount_rules()
+    stamp = [version, repr(discount_engine.fingerprint)]
+    code = (discount or "").upper()
+    key = f"cart_total:{user_email}"
+    entry = cart_total_cache.get(key)
+    if entry is None or entry["stamp"] != stamp:
+        entry = {"stamp": stamp, "totals": {}}
+    elif code in entry["totals"]:
+        return entry["totals"][code]
+
     cart = cart_collection.find_one({"user_email": user_email})
-    items = cart["items"] if cart else []
-    total = 0.0
-    for item in items:
-        product = products_collection.find_one({"_id": __import__('bson').ObjectId(item["product_id"])})
-        if product:
-            total += product['price'] * item['quantity']
-    strategy = get_discount_strategy(discount) if discount else None
-    if strategy:
-        total = strategy.apply(total)
-    return {"total": total}
-
-@app.get("/cart/detailed", response_model=dict)
-def get_cart_detailed(user_email: str):
+    if cart is not None and _cart_needs_repricing(cart):
+        cart = _reprice_cart(cart_collection, cart)
+    items = _cart_items_raw(cart)
+    lines = [
+        CartLine(item["product_id"], item.get("category"), item["unit_price"], int(item["quantity"]))
+        for item in items
+        if item.get("unit_price") is not None
+    ]
+    missing = [item["product_id"] for item in items if item.get("unit_price") is None]
+    priced = discount_engine.evaluate(lines, discount)
+    result = {**priced, "missing": missing}
+    entry["totals"][code] = result
+    cart_total_cache.set(key, entry, CART_TOTAL_CACHE_TTL)
+    return result
+
+@app.get("/cart/detailed", response_model=dict, response_class=FastJSONResponse)
+def get_cart_detailed(user_email: str, current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
-        _, _, _, products_collection, cart_collection, _, _ = get_mongo_client()
+        _, _, _, _, cart_collection, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     cart = cart_collection.find_one({"user_email": user_email})
     items = cart["items"] if cart else []
-    detailed_items = []
-    from bson import ObjectId
-    for item in items:
-        try:
-            prod = products_collection.find_one({"_id": ObjectId(item["product_id"])})
-        except Exception:
-            prod = None
-        if prod:
-            # Convert MongoDB document to proper dictionary with all fields
-            product_dict = convert_product_to_dict(prod)
-            detailed_items.append({"product": product_dict, "quantity": item["quantity"]})
-    return {"items": detailed_items}
+    products, missing = hydrate_products([item["product_id"] for item in items])
+    # Keep the cart order; items whose product no longer exists are reported in "missing"
+    detailed_items = [
+        {"product": products[item["product_id"]], "quantity": item["quantity"]}
+        for item in items
+        if item["product_id"] in products
+    ]
+    return FastJSONResponse({"items": detailed_items, "missing": missing})
 
 # --- Wishlist Endpoints ---
 @app.get("/wishlist", response_model=dict)
-def get_wishlist(user_email: str):
+def get_wishlist(user_email: str, current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, _, wishlist_collection, _ = get_mongo_client()
     except Exception as e:
@@ -532,7 +1340,8 @@ def get_wishlist(user_email: str):
     return {"products": product_ids}
 
 @app.post("/wishlist/add", response_model=dict)
-def add_to_wishlist(user_email: str = Body(...), product_id: str = Body(...)):
+def add_to_wishlist(user_email: str = Body(...), product_id: str = Body(...), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, _, wishlist_collection, _ = get_mongo_client()
     except Exception as e:
@@ -549,7 +1358,8 @@ def add_to_wishlist(user_email: str = Body(...), product_id: str = Body(...)):
     return {"message": "Added to wishlist", "wishlist": product_ids}
 
 @app.delete("/wishlist/remove", response_model=dict)
-def remove_from_wishlist(user_email: str = Body(...), product_id: str = Body(...)):
+def remove_from_wishlist(user_email: str = Body(...), product_id: str = Body(...), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, _, wishlist_collection, _ = get_mongo_client()
     except Exception as e:
@@ -565,7 +1375,8 @@ def remove_from_wishlist(user_email: str = Body(...), product_id: str = Body(...
     return {"message": "Removed from wishlist", "wishlist": product_ids}
 
 @app.post("/wishlist/clear", response_model=dict)
-def clear_wishlist(user_email: str = Body(...)):
+def clear_wishlist(user_email: str = Body(...), current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
         _, _, _, _, _, wishlist_collection, _ = get_mongo_client()
     except Exception as e:
@@ -577,26 +1388,72 @@ def clear_wishlist(user_email: str = Body(...)):
     )
     return {"message": "Wishlist cleared"}
 
-@app.get("/wishlist/detailed", response_model=dict)
-def get_wishlist_detailed(user_email: str):
+@app.post("/wishlist/bulk", response_model=dict)
+def bulk_update_wishlist(update: WishlistBulkUpdate, current_user: Optional[str] = Depends(get_current_user)):
+    """Add and remove many wishlist products in one atomic write; added ids are validated first"""
+    authorize_user(update.user_email, current_user)
+    if len(update.add) + len(update.remove) > BULK_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_OPERATIONS} operations per request")
+    try:
+        _, _, _, _, _, wishlist_collection, _ = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    _require_products(update.add)
+    removed = set(update.remove)
+
+    def mutate(product_ids):
+        kept = [pid for pid in product_ids if pid not in removed]
+        return kept + [pid for pid in dict.fromkeys(update.add) if pid not in kept]
+
+    product_ids = _replace_list_atomically(wishlist_collection, update.user_email, "product_ids", mutate)
+    return {"message": "Wishlist updated", "wishlist": product_ids}
+
+@app.post("/wishlist/move-to-cart", response_model=dict)
+def move_wishlist_to_cart(move: WishlistMoveToCart, current_user: Optional[str] = Depends(get_current_user)):
+    """Add wishlist products to the cart (one of each) and drop them from the wishlist.
+
+    Products that no longer exist are removed from the wishlist and reported in
+    "missing". The cart is written before the wishlist, so a failure in between
+    leaves the products in both rather than in neither.
+    """
+    authorize_user(move.user_email, current_user)
+    try:
+        _, _, _, _, cart_collection, wishlist_collection, _ = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    if move.product_ids is None:
+        wishlist = wishlist_collection.find_one({"user_email": move.user_email})
+        product_ids = wishlist["product_ids"] if wishlist else []
+    else:
+        product_ids = move.product_ids
+    product_ids = list(dict.fromkeys(product_ids))[:BULK_MAX_OPERATIONS]
+    found, missing = hydrate_products(product_ids, fresh=True)
+    moving = [pid for pid in product_ids if pid in found]
+
+    operations = [CartOperation(op="add", product_id=pid, quantity=1) for pid in moving]
+    items = _replace_list_atomically(
+        cart_collection, move.user_email, "items",
+        lambda items: _apply_cart_operations(items, operations, found),
+    )
+    invalidate_cart_total(move.user_email)
+    dropped = set(product_ids)
+    remaining = _replace_list_atomically(
+        wishlist_collection, move.user_email, "product_ids", lambda ids: [pid for pid in ids if pid not in dropped]
+    )
+    return {"message": f"Moved {len(moving)} products to cart", "cart": _cart_lines(items), "wishlist": remaining, "missing": missing}
+
+@app.get("/wishlist/detailed", response_model=dict, response_class=FastJSONResponse)
+def get_wishlist_detailed(user_email: str, current_user: Optional[str] = Depends(get_current_user)):
+    authorize_user(user_email, current_user)
     try:
-        _, _, _, products_collection, _, wishlist_collection, _ = get_mongo_client()
+        _, _, _, _, _, wishlist_collection, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     wishlist = wishlist_collection.find_one({"user_email": user_email})
     product_ids = wishlist["product_ids"] if wishlist else []
-    from bson import ObjectId
-    products = []
-    for pid in product_ids:
-        try:
-            prod = products_collection.find_one({"_id": ObjectId(pid)})
-        except Exception:
-            prod = None
-        if prod:
-            # Convert MongoDB document to proper dictionary with all fields
-            product_dict = convert_product_to_dict(prod)
-            products.append(product_dict)
-    return {"products": products}
+    found, missing = hydrate_products(product_ids)
+    products = [found[pid] for pid in product_ids if pid in found]
+    return FastJSONResponse({"products": products, "missing": missing})
 
 
 @app.get("/")
@@ -605,32 +1462,80 @@ def read_root():
 
 @app.get("/health")
 def health_check():
+    """Report the last state recorded by the background MongoDB health monitor"""
+    health = mongo.health
+    result = {
+        "status": health["status"],
+        "database": "MongoDB connected" if health["status"] == "healthy" else "MongoDB disconnected",
+        "last_checked": health["last_checked"],
+        "latency_ms": health["latency_ms"],
+        "consecutive_failures": health["consecutive_failures"],
+    }
+    if health["error"]:
+        result["error"] = health["error"]
+    result["password_hashing"] = password_hasher.stats()
+    return result
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Per-route latency, response size and MongoDB usage in Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss/eviction counters for the product, cart total and token caches, and the change events that keep them fresh"""
+    return {
+        "products": product_cache.stats(),
+        "cart_totals": cart_total_cache.stats(),
+        "tokens": token_cache.backend.stats(),
+        "events": change_events.stats(),
+    }
+
+@app.get("/discounts")
+def list_discount_rules():
+    """Stored discount rules and what the engine has compiled"""
     try:
-        client, _, _, _, _, _, _ = get_mongo_client()
-        client.admin.command('ping')
-        return {"status": "healthy", "database": "MongoDB connected"}
+        _, db, _, _, _, _, _ = get_mongo_client()
     except Exception as e:
-        return {"status": "unhealthy", "database": "MongoDB disconnected", "error": str(e)}
-
-@app.get("/debug/products")
-def debug_products():
-    """Debug endpoint to see raw product data"""
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    rules = list(db["discounts"].find({}, {"_id": 0}).sort("rule_id", 1))
+    return {"rules": rules, "engine": discount_engine.stats()}
+
+@app.put("/discounts/{rule_id}")
+def save_discount_rule(rule_id: str, rule: DiscountRuleIn, current_user: Optional[str] = Depends(get_current_user)):
+    """Create or replace a discount rule and recompile the rule tables; admins only"""
+    authorize_admin(current_user)
+    doc = {**rule.dict(), "rule_id": rule_id, "code": rule.code.upper() if rule.code else None}
     try:
-        _, _, _, products_collection, _, _, _ = get_mongo_client()
-        products = list(products_collection.find().limit(2))
-        result = []
-        for p in products:
-            # Get raw document
-            raw_doc = dict(p) if hasattr(p, '__dict__') else p
-            # Get converted version
-            converted = convert_product_to_dict(p)
-            result.append({
-                "raw": {k: str(v) for k, v in raw_doc.items()},
-                "converted": converted
-            })
-        return {"debug": result, "count": len(products)}
+        DiscountRule.from_document(doc)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid discount rule: {e}")
+    try:
+        _, db, _, _, _, _, _ = get_mongo_client()
     except Exception as e:
-        return {"error": str(e)}
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    doc["updated_at"] = datetime.utcnow()
+    db["discounts"].replace_one({"rule_id": rule_id}, doc, upsert=True)
+    load_discount_rules()
+    doc.pop("_id", None)
+    return {"rule": doc, "message": "Discount rule saved"}
+
+@app.delete("/discounts/{rule_id}")
+def delete_discount_rule(rule_id: str, current_user: Optional[str] = Depends(get_current_user)):
+    authorize_admin(current_user)
+    try:
+        _, db, _, _, _, _, _ = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    if db["discounts"].delete_one({"rule_id": rule_id}).deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Discount rule not found")
+    load_discount_rules()
+    return {"message": "Discount rule deleted"}
+
+@app.get("/debug/profile")
+def debug_profile():
+    """MongoDB commands per route and recent N+1 query patterns seen by the profiler"""
+    return mongo_profiler.snapshot()
 
 @app.post("/products/fix-images")
 def fix_broken_image_urls():
@@ -663,9 +1568,13 @@ def fix_broken_image_urls():
             
             products_collection.update_one(
                 {"_id": product["_id"]},
-                {"$set": {"image_url": new_image_url}}
+                {"$set": {"image_url": new_image_url, "updated_at": datetime.utcnow()}}
             )
             updated_count += 1
+        change_events.publish(*(
+            ChangeEvent(PRODUCT_UPDATED, str(product["_id"]), fields=("image_url", "updated_at"))
+            for product in broken_products
+        ))
         
         return {
             "message": f"Updated {updated_count} products with broken image URLs",
@@ -676,13 +1585,13 @@ def fix_broken_image_urls():
         raise HTTPException(status_code=500, detail=f"Error fixing images: {str(e)}")
 
 @app.post("/signup", response_model=Token)
-def signup(user: UserCreate):
+async def signup(user: UserCreate):
     try:
         _, _, users_collection, _, _, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     
-    existing_user = users_collection.find_one({"email": user.email})
+    existing_user = await run_in_threadpool(users_collection.find_one, {"email": user.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -690,13 +1599,13 @@ def signup(user: UserCreate):
     user_doc = {
         "username": user.username,
         "email": user.email,
-        "hashed_password": get_password_hash(user.password),
+        "hashed_password": await password_hasher.hash(user.password),
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
     
    
-    result = users_collection.insert_one(user_doc)
+    result = await run_in_threadpool(users_collection.insert_one, user_doc)
     
     if result.inserted_id:
         access_token = create_access_token(data={"sub": user.email})
@@ -705,33 +1614,95 @@ def signup(user: UserCreate):
         raise HTTPException(status_code=500, detail="Failed to create user")
 
 @app.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     try:
         _, _, users_collection, _, _, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     
-    user = users_collection.find_one({"email": form_data.username})
-    
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    user = await run_in_threadpool(users_collection.find_one, {"email": form_data.username})
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+
+    valid, new_hash = await password_hasher.verify(form_data.password, user["hashed_password"])
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if new_hash:
+        # Stored hash used a different bcrypt cost; upgrade it transparently
+        await run_in_threadpool(
+            users_collection.update_one, {"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}}
+        )
     
     access_token = create_access_token(data={"sub": user["email"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/users")
-def get_users():
+# Fields the admin user listing may return; "fields" selects among them
+USER_LIST_FIELDS = ("email", "username", "full_name", "phone_number", "address", "profile_photo_url",
+                    "created_at", "updated_at")
+USER_LIST_DEFAULT_FIELDS = ("email", "username", "full_name", "created_at")
+USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", "200"))
+# Filtered counts stop at this many matches; the unfiltered count comes from collection metadata
+USERS_COUNT_LIMIT = int(os.getenv("USERS_COUNT_LIMIT", "10000"))
+
+def convert_user_to_dict(user_doc):
+    """Serialize a user document for responses; the password hash is never included"""
+    user = {key: value for key, value in user_doc.items() if key != "hashed_password"}
+    user["_id"] = str(user_doc["_id"])
+    return user
+
+@app.get("/users", response_class=FastJSONResponse)
+def get_users(limit: int = 50, cursor: Optional[str] = None, email_prefix: Optional[str] = None,
+              fields: Optional[str] = None, current_user: Optional[str] = Depends(get_current_user)):
+    """List users in email order, one page at a time; admins only.
+
+    Pass the previous response's next_cursor as `cursor` for the next page.
+    `email_prefix` is an anchored match, so it is served by the unique email
+    index; `fields` is a comma-separated subset of USER_LIST_FIELDS. The
+    total is an estimate: exact up to USERS_COUNT_LIMIT when filtering, and
+    taken from collection metadata otherwise.
+    """
+    authorize_admin(current_user)
+    if not 1 <= limit <= USERS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {USERS_PAGE_MAX}")
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else list(USER_LIST_DEFAULT_FIELDS)
+    unknown = [field for field in selected if field not in USER_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown user fields: {', '.join(unknown)}")
     try:
         _, _, users_collection, _, _, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    
-    users = list(users_collection.find({}, {"hashed_password": 0})) 
-    return {"users": users, "count": len(users)}
+
+    filter_query = {"email": {"$regex": f"^{re.escape(email_prefix)}"}} if email_prefix else {}
+    query = {"email": dict(filter_query.get("email", {}))}
+    if cursor:
+        position = decode_cursor(cursor)
+        if "email" not in position:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["email"]["$gt"] = position["email"]
+    if not query["email"]:
+        del query["email"]
+    projection = dict.fromkeys(["email", *selected], 1)
+    users = list(users_collection.find(query, projection).sort("email", 1).limit(limit))
+
+    next_cursor = None
+    if users and len(users) == limit:
+        next_cursor = encode_cursor({"id": str(users[-1]["_id"]), "email": users[-1]["email"]})
+    if filter_query:
+        total = users_collection.count_documents(filter_query, limit=USERS_COUNT_LIMIT)
+    else:
+        total = users_collection.estimated_document_count()
+    return FastJSONResponse({
+        "users": [convert_user_to_dict(user) for user in users],
+        "count": len(users),
+        "next_cursor": next_cursor,
+        "total_estimate": total,
+    })
 
 @app.get("/users/profile")
-def get_user_profile(email: str):
+def get_user_profile(email: str, current_user: Optional[str] = Depends(get_current_user)):
     """Get user profile by email"""
+    authorize_user(email, current_user)
     try:
         _, _, users_collection, _, _, _, _ = get_mongo_client()
     except Exception as e:
@@ -740,14 +1711,12 @@ def get_user_profile(email: str):
     user = users_collection.find_one({"email": email}, {"hashed_password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    # Convert ObjectId to string
-    user["_id"] = str(user["_id"])
-    return user
+    return convert_user_to_dict(user)
 
 @app.put("/users/profile")
-def update_user_profile(email: str, profile_data: dict = Body(...)):
+def update_user_profile(email: str, profile_data: dict = Body(...), current_user: Optional[str] = Depends(get_current_user)):
     """Update user profile"""
+    authorize_user(email, current_user)
     try:
         _, _, users_collection, _, _, _, _ = get_mongo_client()
     except Exception as e:
@@ -781,8 +1750,7 @@ def update_user_profile(email: str, profile_data: dict = Body(...)):
     
     # Return updated user
     updated_user = users_collection.find_one({"email": email}, {"hashed_password": 0})
-    updated_user["_id"] = str(updated_user["_id"])
-    return {"message": "Profile updated successfully", "user": updated_user}
+    return {"message": "Profile updated successfully", "user": convert_user_to_dict(updated_user)}
 
 @app.post("/products", response_model=dict)
 def create_product(product: Product):
@@ -796,52 +1764,87 @@ def create_product(product: Product):
     product_dict["updated_at"] = now
     result = products_collection.insert_one(product_dict)
     if result.inserted_id:
+        change_events.publish(ChangeEvent(PRODUCT_CREATED, str(result.inserted_id), document=product_dict))
         product_dict["_id"] = str(result.inserted_id)
         return {"product": product_dict}
     else:
         raise HTTPException(status_code=500, detail="Failed to create product")
 
-@app.get("/products", response_model=dict)
-def list_products(skip: int = 0, limit: int = 20):
+# Largest `limit` accepted by /products; the app loads its catalog with limit=1000
+PRODUCTS_PAGE_MAX = int(os.getenv("PRODUCTS_PAGE_MAX", "1000"))
+ORDERS_PAGE_MAX = int(os.getenv("ORDERS_PAGE_MAX", "200"))
+
+def validate_page(skip: int, limit: int, maximum: int):
+    """Reject skip/limit that MongoDB would misread (limit=0 means no limit) or refuse with a 500"""
+    if skip < 0:
+        raise HTTPException(status_code=400, detail="skip must not be negative")
+    if not 1 <= limit <= maximum:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {maximum}")
+
+@app.get("/products", response_model=dict, response_class=FastJSONResponse)
+def list_products(request: Request, skip: int = 0, limit: int = 20, cursor: Optional[str] = None):
+    """List catalog products and available user listings as one feed in _id order.
+
+    Both collections are read in _id order and k-way merged, so a page holds at
+    most `limit` items drawn from either source. Pass the previous response's
+    next_cursor as `cursor` to page with a keyset query; skip/limit still works
+    for older clients but slows down on deep pages.
+
+    Responses carry an ETag derived from the catalog version; a matching
+    If-None-Match is answered with 304 before anything is read.
+    """
+    validate_page(skip, limit, PRODUCTS_PAGE_MAX)
     try:
         client, db, users_collection, products_collection, cart_collection, wishlist_collection, orders_collection = get_mongo_client()
+        version, modified_at = catalog_version.current()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    products = list(products_collection.find().skip(skip).limit(limit))
-    # Convert MongoDB documents to proper dictionaries with all fields
-    products_list = [convert_product_to_dict(p) for p in products]
+    etag = make_etag("products", version, skip, limit, cursor)
+    not_modified = not_modified_response(request, etag, modified_at, PRODUCT_CACHE_CONTROL)
+    if not_modified is not None:
+        return not_modified
+    query = {}
+    if cursor:
+        query["_id"] = {"$gt": decode_cursor(cursor)["id"]}
+        skip = 0
+    # Each source can contribute at most skip + limit items to the merged page
+    window = skip + limit
+    products = products_collection.find(query, PRODUCT_PROJECTION).sort("_id", 1).limit(window)
 
-    # Also include user-listed selling products that are still available
     try:
         selling_products_collection = db["selling_products"]
         selling_products = list(
-            selling_products_collection.find(
-                {
-                    "quantity": {"$gt": 0},
-                    "status": {"$ne": "sold"},
-                }
-            )
+            selling_products_collection.find({**AVAILABLE_LISTING_FILTER, **query}, LISTING_PROJECTION)
+            .sort("_id", 1)
+            .limit(window)
         )
-        for sp in selling_products:
-            products_list.append(
-                {
-                    "_id": str(sp.get("_id")),
-                    "name": sp.get("name", ""),
-                    "description": sp.get("description", ""),
-                    "price": float(sp.get("price", 0)),
-                    "category": sp.get("category", "User Listings"),
-                    "in_stock": int(sp.get("quantity", 0)),
-                    "image_url": sp.get("image_url", ""),
-                    "seller_email": sp.get("seller_email", ""),
-                    "is_user_listing": True,
-                    "source": "selling_products",
-                }
-            )
     except Exception as e:
         # Don't break main products listing if selling products fail
         print(f"Error including selling products: {e}")
+        selling_products = []
 
-    return {"products": products_list, "count": len(products_list)}
+    merged = heapq.merge(
+        ((doc["_id"], 0, doc) for doc in products),
+        ((doc["_id"], 1, doc) for doc in selling_products),
+    )
+    page = list(itertools.islice(merged, skip, window))
+
+    products_list = []
+    catalog_products = {}
+    for product_id, source, doc in page:
+        if source == 0:
+            # Convert MongoDB documents to proper dictionaries with all fields
+            product_dict = catalog_products[product_id] = convert_product_to_dict(doc)
+        else:
+            product_dict = convert_listing_to_dict(doc)
+        products_list.append(product_dict)
+    product_cache.put_many(catalog_products)
+
+    next_cursor = encode_cursor({"id": str(page[-1][0])}) if page and len(page) == limit else None
+    return FastJSONResponse(
+        {"products": products_list, "count": len(products_list), "next_cursor": next_cursor},
+        headers=validator_headers(etag, modified_at, PRODUCT_CACHE_CONTROL),
+    )
 
 
 @app.post("/selling-products", response_model=dict)
@@ -910,27 +1913,41 @@ def create_selling_product(product: SellingProduct):
     product_dict["updated_at"] = now
     result = selling_products_collection.insert_one(product_dict)
     if result.inserted_id:
+        change_events.publish(
+            ChangeEvent(PRODUCT_CREATED, str(result.inserted_id), "selling_products", document=product_dict)
+        )
         product_dict["_id"] = str(result.inserted_id)
         return {"product": product_dict}
     else:
         raise HTTPException(status_code=500, detail="Failed to create selling product")
 
-@app.get("/products/search", response_model=dict)
+@app.get("/products/search", response_model=dict, response_class=FastJSONResponse)
 def search_products(
+    request: Request,
     name: Optional[str] = None,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     skip: int = 0,
-    limit: int = 20
+    limit: int = 20,
+    cursor: Optional[str] = None
 ):
+    validate_page(skip, limit, PRODUCTS_PAGE_MAX)
     try:
         _, _, _, products_collection, _, _, _ = get_mongo_client()
+        version, modified_at = catalog_version.current()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    query = {}
+    etag = make_etag("search", version, name, category, min_price, max_price, skip, limit, cursor)
+    not_modified = not_modified_response(request, etag, modified_at, PRODUCT_CACHE_CONTROL)
+    if not_modified is not None:
+        return not_modified
+    headers = validator_headers(etag, modified_at, PRODUCT_CACHE_CONTROL)
     if name:
-        query["name"] = {"$regex": name, "$options": "i"}
+        return FastJSONResponse(
+            _search_products_by_text(name, category, min_price, max_price, skip, limit, cursor), headers=headers
+        )
+    query = {}
     if category:
         query["category"] = category
     if min_price is not None or max_price is not None:
@@ -940,24 +1957,61 @@ def search_products(
         if max_price is not None:
             price_query["$lte"] = max_price
         query["price"] = price_query
-    products = list(products_collection.find(query).skip(skip).limit(limit))
+    if cursor:
+        query["_id"] = {"$gt": decode_cursor(cursor)["id"]}
+        skip = 0
+    products = list(products_collection.find(query, PRODUCT_PROJECTION).sort("_id", 1).skip(skip).limit(limit))
     # Convert MongoDB documents to proper dictionaries with all fields
     products_list = [convert_product_to_dict(p) for p in products]
-    return {"products": products_list, "count": len(products_list)}
+    product_cache.put_many({doc["_id"]: product_dict for doc, product_dict in zip(products, products_list)})
+    next_cursor = encode_cursor({"id": str(products[-1]["_id"])}) if products and len(products) == limit else None
+    return FastJSONResponse(
+        {"products": products_list, "count": len(products_list), "next_cursor": next_cursor}, headers=headers
+    )
 
-@app.get("/products/{product_id}", response_model=dict)
-def get_product(product_id: str):
+def _search_products_by_text(name, category, min_price, max_price, skip, limit, cursor):
+    """Rank catalog products and user listings with the search index, best match first"""
+    ensure_search_index()
+    ranked = search_index.search(name, category=category, min_price=min_price, max_price=max_price)
+    if cursor:
+        position = decode_cursor(cursor)
+        if "score" not in position:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after = (-float(position["score"]), str(position["id"]))
+        ranked = [(pid, score) for pid, score in ranked if (-score, str(pid)) > after]
+        skip = 0
+    page = ranked[skip:skip + limit]
+    found, _ = hydrate_products([str(pid) for pid, _ in page])
+    products_list = [found[str(pid)] for pid, _ in page if str(pid) in found]
+    next_cursor = None
+    if page and len(ranked) > skip + limit:
+        next_cursor = encode_cursor({"id": str(page[-1][0]), "score": page[-1][1]})
+    return {"products": products_list, "count": len(products_list), "next_cursor": next_cursor}
+
+@app.get("/products/{product_id}", response_model=dict, response_class=FastJSONResponse)
+def get_product(product_id: str, request: Request):
+    """One catalog product, with an ETag and Last-Modified taken from its updated_at"""
     try:
         _, _, _, products_collection, _, _, _ = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     from bson import ObjectId
-    product = products_collection.find_one({"_id": ObjectId(product_id)})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    # Convert MongoDB document to proper dictionary with all fields
-    product_dict = convert_product_to_dict(product)
-    return {"product": product_dict}
+    oid = ObjectId(product_id)
+    product_dict = product_cache.get(oid)
+    if product_dict is None or product_dict["source"] != "catalog":
+        product = products_collection.find_one({"_id": oid}, PRODUCT_PROJECTION)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        # Convert MongoDB document to proper dictionary with all fields
+        product_dict = convert_product_to_dict(product)
+        product_cache.put(oid, product_dict)
+    updated_at = product_dict.get("updated_at")
+    # Every product write sets updated_at; documents without one fall back to the catalog version
+    etag = make_etag("product", product_id, updated_at.isoformat() if updated_at else catalog_version.current()[0])
+    not_modified = not_modified_response(request, etag, updated_at, PRODUCT_CACHE_CONTROL)
+    if not_modified is not None:
+        return not_modified
+    return FastJSONResponse({"product": product_dict}, headers=validator_headers(etag, updated_at, PRODUCT_CACHE_CONTROL))
 
 @app.put("/products/{product_id}", response_model=dict)
 def update_product(product_id: str, product: ProductUpdate):
@@ -968,13 +2022,17 @@ def update_product(product_id: str, product: ProductUpdate):
     from bson import ObjectId
     update_data = {k: v for k, v in product.dict().items() if v is not None}
     update_data["updated_at"] = datetime.utcnow()
-    result = products_collection.update_one({"_id": ObjectId(product_id)}, {"$set": update_data})
-    if result.matched_count == 0:
+    oid = ObjectId(product_id)
+    updated_product = products_collection.find_one_and_update(
+        {"_id": oid}, {"$set": update_data}, return_document=ReturnDocument.AFTER
+    )
+    if updated_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    updated_product = products_collection.find_one({"_id": ObjectId(product_id)})
+    change_events.publish(
+        ChangeEvent(PRODUCT_UPDATED, product_id, fields=tuple(update_data), document=updated_product)
+    )
     # Convert MongoDB document to proper dictionary with all fields
-    product_dict = convert_product_to_dict(updated_product)
-    return {"product": product_dict}
+    return {"product": convert_product_to_dict(updated_product)}
 
 @app.delete("/products/{product_id}", response_model=dict)
 def delete_product(product_id: str):
@@ -986,6 +2044,7 @@ def delete_product(product_id: str):
     result = products_collection.delete_one({"_id": ObjectId(product_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    change_events.publish(ChangeEvent(PRODUCT_DELETED, product_id))
     return {"message": "Product deleted"}
 
 # ========== ORDER & PAYMENT ENDPOINTS ==========
@@ -1033,29 +2092,127 @@ def create_razorpay_order(order_data: dict = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create Razorpay order: {str(e)}")
 
+# Stock counter field per collection
+STOCK_FIELDS = {"products": "in_stock", "selling_products": "quantity"}
+
+class StockReservation:
+    """Quantity of one product to take from (or return to) its stock counter"""
+
+    def __init__(self, source: str, product_id: ObjectId, quantity: int, product_name: str = ""):
+        self.source = source
+        self.product_id = product_id
+        self.quantity = quantity
+        self.product_name = product_name
+
+def _check_reservation_quantities(reservations: List[StockReservation]):
+    """A non-positive quantity would turn a reservation into a restock (and a release into a take)"""
+    for reservation in reservations:
+        if reservation.quantity <= 0:
+            raise HTTPException(status_code=400, detail=f"Quantity for {reservation.product_name or reservation.product_id} must be positive")
+
+def reserve_stock(db, reservations: List[StockReservation]) -> List[StockReservation]:
+    """Atomically take stock for every reservation, or for none of them.
+
+    Each decrement is a conditional $inc guarded by {stock: {$gte: quantity}},
+    so concurrent orders can never drive stock negative. When a guard fails (a
+    400) or a write raises, the reservations already taken are released before
+    the error propagates. A listing whose
+    quantity reaches zero is marked sold. Non-positive quantities are rejected
+    with a 400 before anything is taken.
+    """
+    _check_reservation_quantities(reservations)
+    taken = []
+    events = []
+    try:
+        for reservation in reservations:
+            stock_field = STOCK_FIELDS[reservation.source]
+            updated = db[reservation.source].find_one_and_update(
+                {"_id": reservation.product_id, stock_field: {"$gte": reservation.quantity}},
+                {"$inc": {stock_field: -reservation.quantity}, "$set": {"updated_at": datetime.utcnow()}},
+                projection={stock_field: 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if updated is None:
+                raise HTTPException(status_code=400, detail=f"Insufficient stock for {reservation.product_name}")
+            taken.append(reservation)
+            if reservation.source == "selling_products" and updated[stock_field] <= 0:
+                db["selling_products"].update_one(
+                    {"_id": reservation.product_id, stock_field: {"$lte": 0}},
+                    {"$set": {"status": "sold"}},
+                )
+                events.append(ChangeEvent(
+                    STOCK_CHANGED, str(reservation.product_id), reservation.source, (stock_field, "status"),
+                    document={stock_field: updated[stock_field], "status": "sold"},
+                ))
+            else:
+                events.append(ChangeEvent(STOCK_CHANGED, str(reservation.product_id), reservation.source, (stock_field,)))
+    except BaseException:
+        # Whatever stopped the loop (a failed guard, a lost connection), give back what was taken
+        release_stock(db, taken)
+        raise
+    change_events.publish(*events)
+    return taken
+
+def release_stock(db, reservations: List[StockReservation]):
+    """Return previously reserved stock, reopening listings that had sold out"""
+    _check_reservation_quantities(reservations)
+    events = []
+    for reservation in reservations:
+        stock_field = STOCK_FIELDS[reservation.source]
+        if reservation.source == "selling_products":
+            listing = db["selling_products"].find_one_and_update(
+                {"_id": reservation.product_id},
+                {"$inc": {stock_field: reservation.quantity}, "$set": {"status": "unsold", "updated_at": datetime.utcnow()}},
+                projection={**SEARCH_INDEX_FIELDS, stock_field: 1, "status": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if listing is not None:
+                events.append(ChangeEvent(
+                    STOCK_CHANGED, str(reservation.product_id), reservation.source, (stock_field, "status"), listing
+                ))
+        else:
+            db["products"].update_one(
+                {"_id": reservation.product_id},
+                {"$inc": {stock_field: reservation.quantity}, "$set": {"updated_at": datetime.utcnow()}},
+            )
+            events.append(ChangeEvent(STOCK_CHANGED, str(reservation.product_id), reservation.source, (stock_field,)))
+    change_events.publish(*events)
+
 @app.post("/orders/create")
-def create_order(order: OrderCreate):
+def create_order(order: OrderCreate, current_user: Optional[str] = Depends(get_current_user)):
     """Create an order in the database"""
+    authorize_user(order.user_email, current_user)
+    for item in order.items:
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail=f"Quantity for {item.product_name} must be positive")
     try:
         client, db, users_collection, products_collection, cart_collection, wishlist_collection, orders_collection = get_mongo_client()
         selling_products_collection = db["selling_products"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     
-    from bson import ObjectId
-
     shipping_pincode = (order.shipping_address.postal_code or "").strip()
 
+    # Load every ordered product with one $in query per collection
+    object_ids = {item.product_id: _to_object_id(item.product_id) for item in order.items}
+    wanted = [oid for oid in object_ids.values() if oid is not None]
+    catalog_docs = {doc["_id"]: doc for doc in products_collection.find({"_id": {"$in": wanted}})}
+    remaining = [oid for oid in wanted if oid not in catalog_docs]
+    listing_docs = {}
+    if remaining:
+        listing_docs = {doc["_id"]: doc for doc in selling_products_collection.find({"_id": {"$in": remaining}})}
+
     # Validate products and check stock (supports both catalog and user-listed products,
     # and apply safe-selling pincode rules when needed)
-    validated_items = []
+    reservations = {}
     for item in order.items:
-        product = products_collection.find_one({"_id": ObjectId(item.product_id)})
+        oid = object_ids[item.product_id]
+        product = catalog_docs.get(oid)
         source = "products"
         stock_field = "in_stock"
 
         if not product:
-            product = selling_products_collection.find_one({"_id": ObjectId(item.product_id)})
+            product = listing_docs.get(oid)
             source = "selling_products"
             stock_field = "quantity"
 
@@ -1088,15 +2245,14 @@ def create_order(order: OrderCreate):
                         ),
                     )
 
-        validated_items.append(
-            {
-                "item": item,
-                "product": product,
-                "source": source,
-                "stock_field": stock_field,
-                "available": available,
-            }
-        )
+        # Several lines for the same product are reserved together
+        if oid in reservations:
+            reservations[oid].quantity += item.quantity
+        else:
+            reservations[oid] = StockReservation(source, oid, item.quantity, item.product_name)
+
+    # Reserve stock before the order exists; any shortfall releases what was taken
+    reserved = reserve_stock(db, list(reservations.values()))
     
     # Generate order ID
     order_id = f"ORD{datetime.utcnow().strftime('%Y%m%d%H%M%S')}{os.urandom(4).hex().upper()}"
@@ -1112,53 +2268,28 @@ def create_order(order: OrderCreate):
         "status": "pending",
         "payment_id": None,
         "razorpay_order_id": None,
+        "stock_reserved": True,
         "created_at": now,
         "updated_at": now
     }
     
-    result = orders_collection.insert_one(order_doc)
+    try:
+        result = orders_collection.insert_one(order_doc)
+    except Exception:
+        release_stock(db, reserved)
+        raise
     if not result.inserted_id:
+        release_stock(db, reserved)
         raise HTTPException(status_code=500, detail="Failed to create order")
 
-    # Update stock for each item after successful order creation
-    for entry in validated_items:
-        item = entry["item"]
-        product = entry["product"]
-        source = entry["source"]
-        stock_field = entry["stock_field"]
-        available = entry["available"]
-
-        new_quantity = max(available - item.quantity, 0)
-
-        if source == "products":
-            products_collection.update_one(
-                {"_id": product["_id"]},
-                {"$set": {stock_field: new_quantity, "updated_at": datetime.utcnow()}},
-            )
-        else:
-            status = "unsold"
-            if new_quantity <= 0:
-                status = "sold"
-
-            selling_products_collection.update_one(
-                {"_id": product["_id"]},
-                {
-                    "$set": {
-                        stock_field: new_quantity,
-                        "status": status,
-                        "updated_at": datetime.utcnow(),
-                    }
-                },
-            )
-
     order_doc["_id"] = str(result.inserted_id)
     return {"order": order_doc, "message": "Order created successfully"}
 
 @app.post("/orders/verify-payment")
-def verify_payment(payment_data: dict = Body(...)):
+def verify_payment(payment_data: dict = Body(...), current_user: Optional[str] = Depends(get_current_user)):
     """Verify Razorpay payment and update order status"""
     try:
-        _, _, _, products_collection, _, _, orders_collection = get_mongo_client()
+        _, _, _, _, _, _, orders_collection = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     
@@ -1170,24 +2301,15 @@ def verify_payment(payment_data: dict = Body(...)):
     if not all([razorpay_order_id, razorpay_payment_id, razorpay_signature, order_id]):
         raise HTTPException(status_code=400, detail="Missing payment verification data")
     
+    # Only the order's owner may confirm it
+    order = orders_collection.find_one({"order_id": order_id})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    authorize_user(order["user_email"], current_user)
+    
     # Demo mode: Skip Razorpay verification if not configured
     if razorpay_client is None:
-        # In demo mode, just verify the order exists and update it
-        order = orders_collection.find_one({"order_id": order_id})
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
-        
-        # Update stock
-        from bson import ObjectId
-        for item in order["items"]:
-            product = products_collection.find_one({"_id": ObjectId(item["product_id"])})
-            if product:
-                new_stock = product.get("in_stock", 0) - item["quantity"]
-                products_collection.update_one(
-                    {"_id": ObjectId(item["product_id"])},
-                    {"$set": {"in_stock": max(0, new_stock), "updated_at": datetime.utcnow()}}
-                )
-        
+        # Stock was reserved once, by create_order; payment only confirms the order
         # Update order status
         orders_collection.update_one(
             {"order_id": order_id},
@@ -1230,22 +2352,7 @@ def verify_payment(payment_data: dict = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Payment verification failed: {str(e)}")
     
-    # Update order in database
-    order = orders_collection.find_one({"order_id": order_id})
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    # Update stock
-    from bson import ObjectId
-    for item in order["items"]:
-        product = products_collection.find_one({"_id": ObjectId(item["product_id"])})
-        if product:
-            new_stock = product.get("in_stock", 0) - item["quantity"]
-            products_collection.update_one(
-                {"_id": ObjectId(item["product_id"])},
-                {"$set": {"in_stock": max(0, new_stock), "updated_at": datetime.utcnow()}}
-            )
-    
+    # Stock was reserved once, by create_order; payment only confirms the order
     # Update order status
     orders_collection.update_one(
         {"order_id": order_id},
@@ -1268,15 +2375,34 @@ def verify_payment(payment_data: dict = Body(...)):
         "order": updated_order
     }
 
-@app.get("/orders")
-def get_orders(user_email: str):
-    """Get all orders for a user"""
+@app.get("/orders", response_class=FastJSONResponse)
+def get_orders(user_email: str, limit: int = 50, skip: int = 0, cursor: Optional[str] = None, current_user: Optional[str] = Depends(get_current_user)):
+    """Get a user's orders, newest first, one page at a time"""
+    authorize_user(user_email, current_user)
+    validate_page(skip, limit, ORDERS_PAGE_MAX)
     try:
         _, _, _, _, _, _, orders_collection = get_mongo_client()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
     
-    orders = list(orders_collection.find({"user_email": user_email}).sort("created_at", -1))
+    query = {"user_email": user_email}
+    if cursor:
+        position = decode_cursor(cursor)
+        if "created_at" not in position:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"created_at": {"$lt": position["created_at"]}},
+            {"created_at": position["created_at"], "_id": {"$lt": position["id"]}},
+        ]
+        skip = 0
+    orders = list(
+        orders_collection.find(query).sort([("created_at", -1), ("_id", -1)]).skip(skip).limit(limit)
+    )
+    next_cursor = None
+    if orders and len(orders) == limit:
+        next_cursor = encode_cursor(
+            {"id": str(orders[-1]["_id"]), "created_at": orders[-1]["created_at"].isoformat()}
+        )
     
     # Convert to list of dicts
     orders_list = []
@@ -1285,10 +2411,87 @@ def get_orders(user_email: str):
         order_dict["_id"] = str(order_dict["_id"])
         orders_list.append(order_dict)
     
-    return {"orders": orders_list, "count": len(orders_list)}
+    return FastJSONResponse({"orders": orders_list, "count": len(orders_list), "next_cursor": next_cursor})
+
+# --- Analytics exports ---
+# Largest batch_size the /export endpoints accept; a batch is both the cursor
+# batch fetched from MongoDB and the number of lines sent per chunk
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("EXPORT_MAX_BATCH_SIZE", "5000"))
+
+def _ndjson_response(chunks, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'},
+    )
+
+@app.get("/export/orders")
+def export_orders(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+    user_email: Optional[str] = None,
+    batch_size: int = 1000,
+    current_user: Optional[str] = Depends(get_current_user),
+):
+    """Stream orders created in [start, end) as NDJSON, oldest first.
+
+    `status` takes a comma-separated list, e.g. status=paid,shipped. Users may
+    export their own orders; exporting everyone's requires an admin.
+    """
+    if current_user is None or current_user != user_email:
+        # Anonymous callers get no export even with REQUIRE_AUTH off
+        authorize_admin(current_user)
+    validate_batch_size(batch_size, EXPORT_MAX_BATCH_SIZE)
+    try:
+        _, _, _, _, _, _, orders_collection = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    query = date_range("created_at", start, end)
+    if status:
+        query["status"] = {"$in": [value.strip() for value in status.split(",") if value.strip()]}
+    if user_email:
+        query["user_email"] = user_email
+    cursor = orders_collection.find(query, batch_size=batch_size).sort([("created_at", 1), ("_id", 1)])
+    return _ndjson_response(ndjson_batches(cursor, batch_size, default=_json_default), "orders")
+
+@app.get("/export/products")
+def export_products(source: str = "all", batch_size: int = 1000,
+                    current_user: Optional[str] = Depends(get_current_user)):
+    """Stream catalog products and/or every user listing (sold ones included) as NDJSON; admin only"""
+    authorize_admin(current_user)
+    validate_batch_size(batch_size, EXPORT_MAX_BATCH_SIZE)
+    if source not in ("all", "catalog", "selling_products"):
+        raise HTTPException(status_code=400, detail="source must be one of all, catalog, selling_products")
+    try:
+        _, db, _, products_collection, _, _, _ = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+
+    def chunks():
+        if source in ("all", "catalog"):
+            cursor = products_collection.find({}, PRODUCT_PROJECTION, batch_size=batch_size).sort("_id", 1)
+            yield from ndjson_batches(cursor, batch_size, convert_product_to_dict, _json_default)
+        if source in ("all", "selling_products"):
+            cursor = db["selling_products"].find({}, LISTING_PROJECTION, batch_size=batch_size).sort("_id", 1)
+            yield from ndjson_batches(cursor, batch_size, convert_listing_to_dict, _json_default)
+
+    return _ndjson_response(chunks(), "products")
+
+@app.get("/export/users")
+def export_users(batch_size: int = 1000, current_user: Optional[str] = Depends(get_current_user)):
+    """Stream every user, without password hashes, as NDJSON; admin only"""
+    authorize_admin(current_user)
+    validate_batch_size(batch_size, EXPORT_MAX_BATCH_SIZE)
+    try:
+        _, _, users_collection, _, _, _, _ = get_mongo_client()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    cursor = users_collection.find({}, {"hashed_password": 0}, batch_size=batch_size).sort("_id", 1)
+    return _ndjson_response(ndjson_batches(cursor, batch_size, convert_user_to_dict, _json_default), "users")
 
 @app.get("/orders/{order_id}")
-def get_order(order_id: str):
+def get_order(order_id: str, current_user: Optional[str] = Depends(get_current_user)):
     """Get a specific order by ID"""
     try:
         _, _, _, _, _, _, orders_collection = get_mongo_client()
@@ -1298,6 +2501,7 @@ def get_order(order_id: str):
     order = orders_collection.find_one({"order_id": order_id})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    authorize_user(order["user_email"], current_user)
     
     order_dict = dict(order)
     order_dict["_id"] = str(order_dict["_id"])
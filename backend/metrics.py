@@ -0,0 +1,199 @@
+"""
+Per-route request metrics exposed in the Prometheus text format.
+
+MetricsMiddleware times every HTTP request and records its status and
+response size under the matched route template (e.g. /products/{product_id}).
+MongoCommandMetrics is a PyMongo command listener that charges each database
+command to the request that issued it, so the MongoDB calls and time per
+request show up next to the latency.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MONGO_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; callers hold the registry lock"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class RequestStats:
+    """MongoDB work done on behalf of the request currently being served"""
+
+    def __init__(self):
+        self.mongo_calls = 0
+        self.mongo_seconds = 0.0
+        # Filled in by mongo_profiler.MongoProfiler when it is the registered listener
+        self.commands: Dict[Tuple[str, str], list] = {}
+        self.shapes: Dict[tuple, int] = {}
+        self.in_progress: Dict[tuple, Tuple[str, str]] = {}
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current_request.get()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Adds each command's duration to the request that issued it.
+
+    Commands run outside a request (health pings, startup) are ignored.
+    """
+
+    def started(self, event):
+        pass
+
+    def _record(self, event):
+        stats = _current_request.get()
+        if stats is not None:
+            stats.mongo_calls += 1
+            stats.mongo_seconds += event.duration_micros / 1_000_000
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.mongo_calls = Histogram(MONGO_CALL_BUCKETS)
+        self.mongo_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.in_flight = 0
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: float, size: int, stats: RequestStats):
+        with self._lock:
+            self.in_flight -= 1
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.response_size.observe(size)
+            metrics.mongo_calls.observe(stats.mongo_calls)
+            metrics.mongo_seconds += stats.mongo_seconds
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def route_metrics(self, method: str, route: str) -> Optional[RouteMetrics]:
+        return self._routes.get((method, route))
+
+    def render(self) -> str:
+        """Serialise every metric in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+
+        def histogram(name, help_text, attribute):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), metrics in sorted(self._routes.items()):
+                hist = getattr(metrics, attribute)
+                labels = f'method="{method}",route="{_escape(route)}"'
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        with self._lock:
+            lines.append("# HELP http_requests_in_flight Requests currently being served")
+            lines.append("# TYPE http_requests_in_flight gauge")
+            lines.append(f"http_requests_in_flight {self.in_flight}")
+
+            lines.append("# HELP http_requests_total Requests served by route and status")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route), metrics in sorted(self._routes.items()):
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}'
+                    )
+
+            histogram("http_request_duration_seconds", "Request latency in seconds", "latency")
+            histogram("http_response_size_bytes", "Response body size in bytes", "response_size")
+            histogram("http_request_mongo_commands", "MongoDB commands issued per request", "mongo_calls")
+
+            lines.append("# HELP http_request_mongo_seconds_total Time spent in MongoDB commands")
+            lines.append("# TYPE http_request_mongo_seconds_total counter")
+            for (method, route), metrics in sorted(self._routes.items()):
+                lines.append(
+                    f'http_request_mongo_seconds_total{{method="{method}",route="{_escape(route)}"}} {metrics.mongo_seconds}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding a MetricsRegistry.
+
+    Each of `observers` gets request_finished(method, route, stats) once a
+    request completes.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, observers=()):
+        self.app = app
+        self.registry = registry
+        self.observers = observers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        response = {"status": 500, "size": 0}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        self.registry.request_started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.registry.request_finished(
+                scope["method"], route, response["status"], time.perf_counter() - started, response["size"], stats
+            )
+            for observer in self.observers:
+                observer.request_finished(scope["method"], route, stats)
+            _current_request.reset(token)
@@ -0,0 +1,127 @@
+"""
+Per-request MongoDB command profiler with N+1 detection.
+
+MongoProfiler is a PyMongo command listener. Every command issued while a
+request is being served is charged to that request by collection and
+operation, and its filter is reduced to a shape (field names kept, values
+dropped). When one request issues more than `threshold` commands of the same
+shape, which is the signature of a per-item lookup loop, a warning is printed
+and the offending shape is kept for the /debug/profile endpoint.
+"""
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+from metrics import MongoCommandMetrics, RequestStats, current_request_stats
+
+# Where each command keeps the filter that identifies its shape
+_FILTER_KEYS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+
+
+def query_shape(value):
+    """Replace every literal in a query with '?' so similar queries compare equal"""
+    if isinstance(value, dict):
+        return tuple((key, query_shape(item)) for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return ("[...]",)
+    return "?"
+
+
+def describe_command(command_name: str, command: dict) -> Tuple[str, tuple]:
+    """Return (collection, filter shape) for a command document"""
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        collection = command.get("collection", "")
+    if command_name in _FILTER_KEYS:
+        query = command.get(_FILTER_KEYS[command_name]) or {}
+    elif command_name in ("update", "delete"):
+        statements = command.get(command_name + "s") or [{}]
+        query = statements[0].get("q") or {}
+    elif command_name == "aggregate":
+        first_stage = (command.get("pipeline") or [{}])[0]
+        query = first_stage.get("$match") or {}
+    else:
+        query = {}
+    return collection, query_shape(query)
+
+
+class MongoProfiler(MongoCommandMetrics):
+    """Command listener that profiles MongoDB usage per route"""
+
+    def __init__(self, threshold: int = 10, recent: int = 50):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._routes: Dict[str, dict] = {}
+        self.recent_n_plus_one = deque(maxlen=recent)
+
+    def started(self, event):
+        stats = current_request_stats()
+        if stats is None:
+            return
+        collection, shape = describe_command(event.command_name, event.command)
+        stats.in_progress[(event.connection_id, event.request_id)] = (collection, event.command_name)
+        key = (event.command_name, collection, shape)
+        stats.shapes[key] = stats.shapes.get(key, 0) + 1
+
+    def _record(self, event):
+        super()._record(event)
+        stats = current_request_stats()
+        if stats is None:
+            return
+        operation = stats.in_progress.pop((event.connection_id, event.request_id), None)
+        if operation is None:
+            return
+        entry = stats.commands.setdefault(operation, [0, 0.0])
+        entry[0] += 1
+        entry[1] += event.duration_micros / 1_000_000
+
+    def request_finished(self, method: str, route: str, stats: RequestStats):
+        route_key = f"{method} {route}"
+        repeated = [(key, count) for key, count in stats.shapes.items() if count > self.threshold]
+        with self._lock:
+            profile = self._routes.setdefault(route_key, {"requests": 0, "commands": {}})
+            profile["requests"] += 1
+            for (collection, operation), (count, seconds) in stats.commands.items():
+                totals = profile["commands"].setdefault(f"{collection}.{operation}", [0, 0.0])
+                totals[0] += count
+                totals[1] += seconds
+            for (operation, collection, shape), count in repeated:
+                self.recent_n_plus_one.append({
+                    "route": route_key,
+                    "collection": collection,
+                    "operation": operation,
+                    "shape": repr(shape),
+                    "count": count,
+                })
+        for (operation, collection, shape), count in repeated:
+            print(
+                f"Warning: possible N+1 query on {route_key}: {count} x {operation} "
+                f"on {collection} with shape {shape!r}"
+            )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {}
+            for route_key, profile in sorted(self._routes.items()):
+                requests = profile["requests"]
+                routes[route_key] = {
+                    "requests": requests,
+                    "commands": {
+                        name: {
+                            "count": count,
+                            "total_ms": round(seconds * 1000, 3),
+                            "per_request": round(count / requests, 2),
+                        }
+                        for name, (count, seconds) in sorted(profile["commands"].items())
+                    },
+                }
+            return {
+                "n_plus_one_threshold": self.threshold,
+                "routes": routes,
+                "recent_n_plus_one": list(self.recent_n_plus_one),
+            }
@@ -0,0 +1,118 @@
+"""
+Password hashing on a bounded pool of worker processes.
+
+bcrypt is deliberately slow, so signup and login hand it to a small process
+pool instead of running it on the request threads. The number of hashes
+waiting for a worker is capped; once the cap is reached new requests are
+rejected with PoolSaturated rather than queueing without bound.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import anyio
+from passlib.context import CryptContext
+
+
+@lru_cache(maxsize=None)
+def _context(rounds: int) -> CryptContext:
+    # Pinning min/max rounds to the configured cost makes verify_and_update
+    # return a new hash for any password stored with a different cost
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def hash_password(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def verify_password(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """Return (valid, new_hash); new_hash is set when the stored hash should be replaced"""
+    return _context(rounds).verify_and_update(password, hashed_password)
+
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on `workers` processes with at most `max_queue` hashes waiting.
+
+    With workers=0 hashing runs on the anyio threadpool instead, which is
+    handy for tests and single-core development machines.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_queue: int = 64):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn rather than fork: the server process already runs threads
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self.pending >= max(self.workers, 1) + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return await anyio.to_thread.run_sync(func, *args)
+            return await asyncio.wrap_future(self._get_executor().submit(func, *args))
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_password, password, hashed_password, self.rounds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self.pending,
+                "queued": max(self.pending - max(self.workers, 1), 0),
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_ms": round(self.total_seconds * 1000 / self.completed, 2) if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,145 @@
+"""
+In-process inverted index for product search.
+
+Products and user listings are tokenised on name, category and description.
+Queries match every term either exactly or as a prefix of an indexed token and
+are ranked by field-weighted relevance.
+"""
+import bisect
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Relevance weight of a term found in each field
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+
+# A term that only matches as a prefix scores this fraction of an exact match
+PREFIX_MATCH_FACTOR = 0.5
+
+
+def tokenize(text) -> List[str]:
+    return TOKEN_RE.findall(str(text or "").lower())
+
+
+class ProductSearchIndex:
+    """Thread-safe inverted index keyed by product id.
+
+    Each entry keeps the category, price and source next to the postings so
+    search filters can be applied without going back to the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[object, float]] = {}
+        self._terms: List[str] = []
+        self._docs: Dict[object, dict] = {}
+        self.built_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _term_weights(self, fields: dict) -> Dict[str, float]:
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field)):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        return weights
+
+    def add(self, product_id, fields: dict, source: str = "catalog"):
+        """Index (or re-index) one product from its name/description/category/price"""
+        weights = self._term_weights(fields)
+        with self._lock:
+            self._remove_locked(product_id)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._terms, token)
+                postings[product_id] = weight
+            self._docs[product_id] = {
+                "terms": list(weights),
+                "category": fields.get("category"),
+                "price": float(fields.get("price") or 0.0),
+                "source": source,
+            }
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def _remove_locked(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        for token in doc["terms"]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect.bisect_left(self._terms, token)
+                if index < len(self._terms) and self._terms[index] == token:
+                    del self._terms[index]
+
+    def rebuild(self, entries):
+        """Replace the whole index from an iterable of (product_id, fields, source)"""
+        fresh = ProductSearchIndex()
+        for product_id, fields, source in entries:
+            fresh.add(product_id, fields, source)
+        with self._lock:
+            self._postings = fresh._postings
+            self._terms = fresh._terms
+            self._docs = fresh._docs
+            self.built_at = time.monotonic()
+
+    def _term_matches(self, term: str) -> Dict[object, float]:
+        """Best score per product for one query term, counting prefix matches"""
+        scores = dict(self._postings.get(term, {}))
+        index = bisect.bisect_right(self._terms, term)
+        while index < len(self._terms) and self._terms[index].startswith(term):
+            for product_id, weight in self._postings[self._terms[index]].items():
+                scores[product_id] = max(scores.get(product_id, 0.0), weight * PREFIX_MATCH_FACTOR)
+            index += 1
+        return scores
+
+    def search(
+        self,
+        text: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> List[Tuple[object, float]]:
+        """Return (product_id, score) for products matching every query term, best first"""
+        terms = tokenize(text)
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            for term in terms:
+                matches = self._term_matches(term)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {pid: score + matches[pid] for pid, score in scores.items() if pid in matches}
+                if not scores:
+                    return []
+            results = []
+            for product_id, score in scores.items():
+                doc = self._docs[product_id]
+                if category is not None and doc["category"] != category:
+                    continue
+                if min_price is not None and doc["price"] < min_price:
+                    continue
+                if max_price is not None and doc["price"] > max_price:
+                    continue
+                results.append((product_id, score))
+        results.sort(key=lambda result: (-result[1], str(result[0])))
+        return results
@@ -0,0 +1,57 @@
+"""
+Tests for bearer-token verification on user-scoped routes
+"""
+import unittest
+import sys
+from datetime import timedelta
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+
+
+class TestCurrentUser(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.token_cache = main.DecodedTokenCache()
+        self.client = TestClient(main.app)
+        self.token = main.create_access_token({"sub": "a@example.com"})
+
+    def get_cart(self, email, token=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        return self.client.get("/cart", params={"user_email": email}, headers=headers)
+
+    def test_token_must_match_requested_user(self):
+        self.assertEqual(self.get_cart("a@example.com", self.token).status_code, 200)
+        self.assertEqual(self.get_cart("b@example.com", self.token).status_code, 403)
+
+    def test_invalid_and_expired_tokens_are_rejected(self):
+        expired = main.create_access_token({"sub": "a@example.com"}, expires_delta=timedelta(minutes=-1))
+        self.assertEqual(self.get_cart("a@example.com", "garbage").status_code, 401)
+        self.assertEqual(self.get_cart("a@example.com", expired).status_code, 401)
+
+    def test_anonymous_requests_depend_on_require_auth(self):
+        self.assertEqual(self.get_cart("a@example.com").status_code, 200)
+        with mock.patch.object(main, "REQUIRE_AUTH", True):
+            self.assertEqual(self.get_cart("a@example.com").status_code, 401)
+
+    def test_decoded_claims_are_cached(self):
+        with mock.patch.object(main.jwt, "decode", wraps=main.jwt.decode) as decode:
+            for _ in range(3):
+                self.assertEqual(self.get_cart("a@example.com", self.token).status_code, 200)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_cache_drops_expired_claims(self):
+        cache = main.DecodedTokenCache(maxsize=2, clock=lambda: 100)
+        cache.put(b"old", {"sub": "a", "exp": 100})
+        cache.put(b"new", {"sub": "b", "exp": 200})
+        self.assertIsNone(cache.get(b"old"))
+        self.assertEqual(cache.get(b"new")["sub"], "b")
+
+if __name__ == "__main__":
+    unittest.main()
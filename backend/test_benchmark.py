@@ -0,0 +1,48 @@
+"""
+Smoke tests for the benchmark harness
+"""
+import unittest
+import sys
+sys.path.insert(0, '.')
+
+import main
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        self.addCleanup(setattr, main, "razorpay_client", main.razorpay_client)
+
+    def test_percentile_uses_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(benchmark.percentile(values, 0.50), 50.0)
+        self.assertEqual(benchmark.percentile(values, 0.99), 99.0)
+        self.assertEqual(benchmark.percentile([], 0.95), 0.0)
+
+    def test_every_scenario_runs_without_errors(self):
+        report = benchmark.run_benchmark(users=5, products=30, listings=3, carts=2, iterations=2, warmup=0)
+        self.assertEqual(report["errors"], 0)
+        self.assertIn("POST /orders/verify-payment", report["endpoints"])
+        self.assertIn("GET /products/search", report["endpoints"])
+        for endpoint in report["endpoints"].values():
+            self.assertLessEqual(endpoint["p50_ms"], endpoint["p95_ms"])
+            self.assertLessEqual(endpoint["p95_ms"], endpoint["p99_ms"])
+
+    def test_serialization_paths_render_the_same_document(self):
+        result = benchmark.serialization_benchmark(items=5, rounds=2)
+        self.assertEqual(result["items"], 5)
+        self.assertGreater(result["current_us_per_response"], 0)
+
+    def test_compare_flags_p95_regressions(self):
+        baseline = {"endpoints": {"GET /cart": {"p50_ms": 1.0, "p95_ms": 2.0}}}
+        current = {"endpoints": {"GET /cart": {"p50_ms": 1.0, "p95_ms": 3.0}}}
+        lines, regressed = benchmark.compare_reports(baseline, current, tolerance=10.0)
+        self.assertTrue(regressed)
+        self.assertIn("REGRESSION", lines[0])
+        _, regressed = benchmark.compare_reports(baseline, baseline)
+        self.assertFalse(regressed)
+
+if __name__ == "__main__":
+    unittest.main()
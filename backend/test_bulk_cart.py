@@ -0,0 +1,93 @@
+"""
+Tests for the bulk cart and wishlist endpoints
+"""
+import unittest
+import sys
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+
+
+class TestBulkCartAndWishlist(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.product_cache.clear()
+        _, self.db, _, products, self.cart, self.wishlist, _ = main.get_mongo_client()
+        self.ids = [str(products.insert_one({"name": f"P{i}", "price": 1.0}).inserted_id) for i in range(3)]
+        self.client = TestClient(main.app)
+
+    def test_operations_apply_in_order(self):
+        self.cart.insert_one({"user_email": "a@example.com", "items": [{"product_id": self.ids[0], "quantity": 1}]})
+        response = self.client.post("/cart/bulk", json={"user_email": "a@example.com", "operations": [
+            {"op": "add", "product_id": self.ids[0], "quantity": 2},
+            {"op": "add", "product_id": self.ids[1]},
+            {"op": "set", "product_id": self.ids[2], "quantity": 4},
+            {"op": "remove", "product_id": self.ids[1]},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cart"], [
+            {"product_id": self.ids[0], "quantity": 3},
+            {"product_id": self.ids[2], "quantity": 4},
+        ])
+        stored = self.cart.find_one({"user_email": "a@example.com"})["items"]
+        self.assertEqual(main._cart_lines(stored), response.json()["cart"])
+        self.assertEqual(stored[1]["unit_price"], 1.0)
+
+    def test_unknown_product_rejects_the_whole_batch(self):
+        response = self.client.post("/cart/bulk", json={"user_email": "a@example.com", "operations": [
+            {"op": "add", "product_id": self.ids[0]},
+            {"op": "add", "product_id": "0" * 24},
+        ]})
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(self.cart.find_one({"user_email": "a@example.com"}))
+
+    def test_products_are_validated_with_one_query(self):
+        products = main.get_mongo_client()[3]
+        with mock.patch.object(products, "find", wraps=products.find) as find:
+            self.client.post("/cart/bulk", json={"user_email": "a@example.com", "operations": [
+                {"op": "add", "product_id": pid} for pid in self.ids
+            ]})
+        self.assertEqual(find.call_count, 1)
+
+    def test_conflicting_write_is_retried(self):
+        self.cart.insert_one({"user_email": "a@example.com", "items": []})
+        calls = []
+
+        def mutate(items):
+            if not calls:
+                # Another request adds a line between our read and our write
+                self.cart.update_one({"user_email": "a@example.com"},
+                                     {"$push": {"items": {"product_id": self.ids[2], "quantity": 1}}})
+            calls.append(list(items))
+            return items + [{"product_id": self.ids[0], "quantity": 1}]
+
+        items = main._replace_list_atomically(self.cart, "a@example.com", "items", mutate)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([item["product_id"] for item in items], [self.ids[2], self.ids[0]])
+
+    def test_too_many_operations(self):
+        operations = [{"op": "remove", "product_id": self.ids[0]}] * (main.BULK_MAX_OPERATIONS + 1)
+        response = self.client.post("/cart/bulk", json={"user_email": "a@example.com", "operations": operations})
+        self.assertEqual(response.status_code, 400)
+
+    def test_wishlist_bulk_and_move_to_cart(self):
+        response = self.client.post("/wishlist/bulk", json={
+            "user_email": "a@example.com", "add": [self.ids[0], self.ids[1], self.ids[0]], "remove": [],
+        })
+        self.assertEqual(response.json()["wishlist"], [self.ids[0], self.ids[1]])
+        self.wishlist.update_one({"user_email": "a@example.com"}, {"$push": {"product_ids": "0" * 24}})
+
+        response = self.client.post("/wishlist/move-to-cart", json={"user_email": "a@example.com"})
+        body = response.json()
+        self.assertEqual(body["wishlist"], [])
+        self.assertEqual(body["missing"], ["0" * 24])
+        self.assertEqual([item["product_id"] for item in body["cart"]], [self.ids[0], self.ids[1]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+"""
+Tests for the cache backends, using a minimal in-process Redis protocol server
+"""
+import unittest
+from unittest import mock
+import fnmatch
+import pickle
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime
+sys.path.insert(0, '.')
+
+import mongomock
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import main
+from cache_backends import MemoryBackend, RedisBackend, TieredCache
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Just enough of Redis for RedisBackend: strings with expiry, SCAN and pub/sub"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.data = {}
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.commands = []
+
+    @property
+    def url(self):
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+
+    def write(self, reply):
+        self.wfile.write(self.encode(reply))
+        self.wfile.flush()
+
+    def encode(self, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(self.encode(item) for item in reply)
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        server = self.server
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            name = args[0].upper().decode()
+            server.commands.append(name)
+            with server.lock:
+                now = time.monotonic()
+                for key in [k for k, (_, expires) in server.data.items() if expires and expires <= now]:
+                    del server.data[key]
+                if name == "PING":
+                    reply = "PONG"
+                elif name in ("SELECT", "AUTH"):
+                    reply = "OK"
+                elif name == "MGET":
+                    reply = [server.data.get(key, (None, 0))[0] for key in args[1:]]
+                elif name == "SET":
+                    expires = 0
+                    if len(args) == 5 and args[3].upper() == b"PX":
+                        expires = now + int(args[4]) / 1000
+                    server.data[args[1]] = (args[2], expires)
+                    reply = "OK"
+                elif name == "DEL":
+                    reply = sum(1 for key in args[1:] if server.data.pop(key, None) is not None)
+                elif name == "SCAN":
+                    pattern = args[args.index(b"MATCH") + 1].decode()
+                    reply = [b"0", [key for key in server.data if fnmatch.fnmatchcase(key.decode(), pattern)]]
+                elif name == "PUBLISH":
+                    listeners = list(server.subscribers.get(args[1], []))
+                    for listener in listeners:
+                        listener.write([b"message", args[1], args[2]])
+                    reply = len(listeners)
+                elif name == "SUBSCRIBE":
+                    for index, channel in enumerate(args[1:], 1):
+                        server.subscribers.setdefault(channel, []).append(self)
+                        self.write([b"subscribe", channel, index])
+                    continue
+                else:
+                    reply = None
+            self.write(reply)
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    def test_expiry_eviction_and_prefix_clear(self):
+        now = [0.0]
+        backend = MemoryBackend(maxsize=2, clock=lambda: now[0])
+        backend.set("product:1", 1, ttl=10)
+        backend.set("cart_total:a", 2, ttl=5)
+        now[0] = 6
+        self.assertEqual(backend.get_many(["product:1", "cart_total:a"]), {"product:1": 1})
+        backend.set("product:2", 2, ttl=10)
+        backend.set("product:3", 3, ttl=10)
+        self.assertIsNone(backend.get("product:1"))
+        backend.clear("product:")
+        self.assertEqual(backend.stats()["size"], 0)
+        self.assertEqual((backend.stats()["evictions"], backend.stats()["expirations"]), (1, 1))
+
+
+class TestRedisBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeRedisServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def backend(self):
+        backend = RedisBackend(self.server.url, prefix="test:")
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_round_trip_uses_one_mget(self):
+        backend = self.backend()
+        created = datetime(2024, 1, 2, 3, 4, 5, 600000)
+        backend.set("product:1", {"_id": "abc", "price": 5.0, "created_at": created, "tags": [created]}, ttl=60)
+        backend.set("product:2", {"price": 6.0}, ttl=60)
+        self.server.commands.clear()
+        found = backend.get_many(["product:1", "product:2", "product:3"])
+        self.assertEqual(found["product:1"], {"_id": "abc", "price": 5.0, "created_at": created, "tags": [created]})
+        self.assertNotIn("product:3", found)
+        self.assertEqual(self.server.commands, ["MGET"])
+        backend.clear("product:")
+        self.assertEqual(backend.get_many(["product:1"]), {})
+
+    def test_values_are_json_not_pickle(self):
+        backend = self.backend()
+        backend.set("product:1", {"price": 5.0}, ttl=60)
+        self.assertEqual(self.server.data[b"test:product:1"][0], b'{"price":5.0}')
+        # A pickle planted by anyone with write access is a miss, never loaded
+        self.server.data[b"test:product:2"] = (pickle.dumps({"price": 1.0}), 0)
+        self.assertEqual(backend.get_many(["product:2"]), {})
+        backend.set("product:3", {"_id": ObjectId()}, ttl=60)
+        self.assertNotIn(b"test:product:3", self.server.data)
+        self.assertEqual(backend.stats()["errors"], 1)
+
+    def test_unreachable_server_is_a_miss_and_trips_the_breaker(self):
+        now = [0.0]
+        backend = RedisBackend("redis://127.0.0.1:1/0", retry_after=5, clock=lambda: now[0])
+        pool = backend.client.connection_pool
+        with mock.patch.object(pool, "get_connection", wraps=pool.get_connection) as connect:
+            backend.set("product:1", 1, ttl=60)
+            self.assertEqual(backend.get_many(["product:1"]), {})
+            self.assertEqual(connect.call_count, 1)
+            now[0] = 6
+            backend.get_many(["product:1"])
+            self.assertEqual(connect.call_count, 2)
+        stats = backend.stats()
+        self.assertEqual((stats["errors"], stats["skipped"], stats["circuit_open"]), (2, 1, True))
+
+    def test_set_many_is_pipelined(self):
+        backend = self.backend()
+        pool = backend.client.connection_pool
+        with mock.patch.object(pool, "get_connection", wraps=pool.get_connection) as connect:
+            backend.set_many({f"product:{i}": {"price": i} for i in range(50)}, ttl=60)
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(self.server.commands.count("SET"), 50)
+        self.assertEqual(backend.get_many(["product:7", "product:49"]), {"product:7": {"price": 7}, "product:49": {"price": 49}})
+
+    def test_invalidation_reaches_other_workers(self):
+        first = TieredCache(MemoryBackend(), self.backend())
+        second = TieredCache(MemoryBackend(), self.backend())
+        second.start()
+        deadline = time.monotonic() + 2
+        while not self.server.subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        first.set("product:1", {"price": 5.0}, ttl=60)
+        self.assertEqual(second.get("product:1"), {"price": 5.0})
+        first.delete("product:1")
+        deadline = time.monotonic() + 2
+        while second.local.get("product:1") is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(second.local.get("product:1"))
+        self.assertIsNone(second.get("product:1"))
+
+    def test_product_cache_over_shared_tier(self):
+        shared = self.backend()
+        worker_a = main.ProductCache(backend=TieredCache(MemoryBackend(), shared))
+        worker_b = main.ProductCache(backend=TieredCache(MemoryBackend(), RedisBackend(self.server.url, prefix="test:")))
+        oid = ObjectId()
+        worker_a.put(oid, {"name": "Mug"})
+        self.assertEqual(worker_b.get_many([oid]), {oid: {"name": "Mug"}})
+        self.assertEqual(worker_b.stats()["hits"], 1)
+
+    def test_product_listing_writes_the_cache_in_one_batch(self):
+        shared = self.backend()
+        cache = main.ProductCache(backend=TieredCache(MemoryBackend(), shared))
+        with mock.patch.object(shared, "_run", wraps=shared._run) as run:
+            cache.put_many({ObjectId(): {"name": f"P{i}"} for i in range(20)})
+        self.assertEqual(run.call_count, 1)
+
+
+class TestCartTotalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.product_cache.clear()
+        main.cart_total_cache.clear()
+        products = main.get_mongo_client()[3]
+        self.product_id = str(products.insert_one({"name": "Mug", "price": 4.0}).inserted_id)
+        self.client = TestClient(main.app)
+
+    def test_total_is_cached_until_the_cart_changes(self):
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.product_id})
+        self.assertEqual(self.client.get("/cart/total", params={"user_email": "a@example.com"}).json()["total"], 4.0)
+        cart = main.get_mongo_client()[4]
+        with mock.patch.object(cart, "find_one", wraps=cart.find_one) as find_one:
+            self.assertEqual(self.client.get("/cart/total", params={"user_email": "a@example.com"}).json()["total"], 4.0)
+        self.assertEqual(find_one.call_count, 0)
+
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.product_id})
+        self.assertEqual(self.client.get("/cart/total", params={"user_email": "a@example.com"}).json()["total"], 8.0)
+
+if __name__ == "__main__":
+    unittest.main()
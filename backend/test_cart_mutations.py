@@ -0,0 +1,104 @@
+"""
+Tests for atomic cart mutations, including concurrent edits of one cart
+"""
+import threading
+import unittest
+import sys
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from pymongo import ReturnDocument
+
+import main
+
+
+class AtomicCollection:
+    """Wraps a mongomock collection so each operation runs atomically, like on a real server"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = threading.Lock()
+
+    def find_one_and_update(self, filter, update, upsert=False, return_document=ReturnDocument.AFTER):
+        # mongomock's find_one_and_update loses the positional ($) match, so apply
+        # the update with update_one and read the cart back under the same lock
+        with self._lock:
+            result = self._collection.update_one(filter, update, upsert=upsert)
+            if result.matched_count == 0 and result.upserted_id is None:
+                return None
+            return self._collection.find_one({"user_email": filter["user_email"]})
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked
+
+
+class TestCartMutations(unittest.TestCase):
+
+    def setUp(self):
+        db = mongomock.MongoClient()["test-db"]
+        db["cart"].create_index("user_email", unique=True)
+        self.cart = AtomicCollection(db["cart"])
+        handles = (None, db, db["users"], db["products"], self.cart, db["wishlist"], db["orders"])
+        patcher = mock.patch.object(main, "get_mongo_client", return_value=handles)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def items(self):
+        return {i["product_id"]: i["quantity"] for i in self.cart.find_one({"user_email": "a@example.com"})["items"]}
+
+    def test_add_update_remove(self):
+        main.add_to_cart("a@example.com", "p1", 2, current_user=None)
+        response = main.add_to_cart("a@example.com", "p1", 3, current_user=None)
+        self.assertEqual(response["cart"], [{"product_id": "p1", "quantity": 5}])
+        main.add_to_cart("a@example.com", "p2", 1, current_user=None)
+        main.update_cart("a@example.com", "p2", 4, current_user=None)
+        self.assertEqual(self.items(), {"p1": 5, "p2": 4})
+        main.update_cart("a@example.com", "p1", 0, current_user=None)
+        self.assertEqual(self.items(), {"p2": 4})
+        self.assertEqual(main.remove_from_cart("a@example.com", "p2", current_user=None)["cart"], [])
+
+    def test_update_of_missing_item_leaves_cart_alone(self):
+        main.add_to_cart("a@example.com", "p1", 1, current_user=None)
+        self.assertEqual(main.update_cart("a@example.com", "p9", 3, current_user=None)["cart"], [{"product_id": "p1", "quantity": 1}])
+
+    def test_non_positive_add_is_rejected(self):
+        main.add_to_cart("a@example.com", "p1", 2, current_user=None)
+        for quantity in (0, -5):
+            with self.assertRaises(main.HTTPException) as raised:
+                main.add_to_cart("a@example.com", "p1", quantity, current_user=None)
+            self.assertEqual(raised.exception.status_code, 400)
+            with self.assertRaises(main.HTTPException):
+                main.add_to_cart("a@example.com", "p2", quantity, current_user=None)
+        self.assertEqual(self.items(), {"p1": 2})
+
+    def test_concurrent_adds_are_not_lost(self):
+        threads_count, adds_per_thread = 8, 25
+        barrier = threading.Barrier(threads_count)
+
+        def worker(index):
+            barrier.wait()
+            for _ in range(adds_per_thread):
+                main.add_to_cart("a@example.com", f"p{index % 3}", 1, current_user=None)
+                main.add_to_cart("a@example.com", "shared", 1, current_user=None)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        items = self.items()
+        self.assertEqual(items["shared"], threads_count * adds_per_thread)
+        self.assertEqual(sum(items.values()), 2 * threads_count * adds_per_thread)
+        self.assertEqual(self.cart.count_documents({}), 1)
+
+if __name__ == "__main__":
+    unittest.main()
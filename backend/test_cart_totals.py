@@ -0,0 +1,110 @@
+"""
+Tests for the cart line price snapshots behind /cart/total
+"""
+import unittest
+import sys
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from test_cart_mutations import AtomicCollection
+
+
+class TestMaterializedCartTotals(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.product_cache.clear()
+        main.cart_total_cache.clear()
+        handles = list(main.get_mongo_client())
+        handles[4] = AtomicCollection(handles[4])
+        patcher = mock.patch.object(main, "get_mongo_client", return_value=tuple(handles))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        _, _, _, self.products, self.cart, _, _ = handles
+        self.mug = str(self.products.insert_one({"name": "Mug", "price": 4.0, "category": "Kitchen"}).inserted_id)
+        self.pen = str(self.products.insert_one({"name": "Pen", "price": 1.5, "category": "Office"}).inserted_id)
+        self.client = TestClient(main.app)
+
+    def stored(self):
+        return self.cart.find_one({"user_email": "a@example.com"})
+
+    def total(self):
+        main.cart_total_cache.clear()
+        return self.client.get("/cart/total", params={"user_email": "a@example.com"}).json()
+
+    def test_mutations_keep_line_snapshots(self):
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.mug, "quantity": 2})
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.pen})
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.mug})
+        self.assertEqual(self.total()["total"], 13.5)
+        self.client.put("/cart/update", json={"user_email": "a@example.com", "product_id": self.pen, "quantity": 3})
+        self.assertEqual(self.total()["total"], 16.5)
+        self.client.request("DELETE", "/cart/remove", json={"user_email": "a@example.com", "product_id": self.mug})
+        self.assertEqual(self.total()["total"], 4.5)
+        self.assertEqual(self.stored()["items"], [
+            {"product_id": self.pen, "quantity": 3, "unit_price": 1.5, "category": "Office"},
+        ])
+
+    def test_total_reads_only_the_cart(self):
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.mug, "quantity": 2})
+        with mock.patch.object(main, "hydrate_products", wraps=main.hydrate_products) as hydrate:
+            self.assertEqual(self.total()["total"], 8.0)
+        hydrate.assert_not_called()
+
+    def test_price_change_reprices_lazily(self):
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.mug, "quantity": 2})
+        self.client.put(f"/products/{self.mug}", json={"price": 5.0})
+        self.assertIsNotNone(self.stored()["stale_since"])
+        self.assertEqual(self.stored()["items"][0]["unit_price"], 4.0)
+
+        self.assertEqual(self.total()["total"], 10.0)
+        stored = self.stored()
+        self.assertEqual(stored["items"][0]["unit_price"], 5.0)
+        self.assertNotIn("stale_since", stored)
+
+    def test_repricing_ignores_a_stale_product_cache(self):
+        # Another worker changed the price; this worker still has the old one cached
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.mug, "quantity": 2})
+        main.hydrate_products([self.mug])
+        self.products.update_one({"name": "Mug"}, {"$set": {"price": 10.0}})
+        main.mark_carts_stale([self.mug])
+        self.assertEqual(self.total()["total"], 20.0)
+        self.assertEqual(self.stored()["items"][0]["unit_price"], 10.0)
+
+    def test_new_lines_are_snapshotted_from_the_database(self):
+        main.hydrate_products([self.mug, self.pen])
+        self.products.update_one({"name": "Mug"}, {"$set": {"price": 8.0}})
+        self.products.update_one({"name": "Pen"}, {"$set": {"price": 3.0}})
+        self.client.post("/cart/add", json={"user_email": "a@example.com", "product_id": self.mug})
+        self.client.post("/cart/bulk", json={"user_email": "a@example.com", "operations": [
+            {"op": "add", "product_id": self.pen, "quantity": 1},
+        ]})
+        self.assertEqual([item["unit_price"] for item in self.stored()["items"]], [8.0, 3.0])
+
+    def test_legacy_cart_is_priced_on_first_read(self):
+        self.cart.insert_one({"user_email": "a@example.com", "items": [
+            {"product_id": self.mug, "quantity": 1},
+            {"product_id": "0" * 24, "quantity": 1},
+        ]})
+        body = self.total()
+        self.assertEqual((body["total"], body["missing"]), (4.0, ["0" * 24]))
+        self.assertEqual([item["unit_price"] for item in self.stored()["items"]], [4.0, None])
+        with mock.patch.object(main, "hydrate_products", wraps=main.hydrate_products) as hydrate:
+            self.assertEqual(self.total()["missing"], ["0" * 24])
+        hydrate.assert_not_called()
+
+    def test_bulk_update_snapshots_new_lines(self):
+        self.client.post("/cart/bulk", json={"user_email": "a@example.com", "operations": [
+            {"op": "add", "product_id": self.mug, "quantity": 2},
+            {"op": "set", "product_id": self.pen, "quantity": 2},
+        ]})
+        self.assertEqual([item["unit_price"] for item in self.stored()["items"]], [4.0, 1.5])
+        self.assertEqual(self.total()["total"], 11.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Tests for the change event bus and the subscribers that keep product views fresh
+"""
+import unittest
+from unittest import mock
+import sys
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from events import PRODUCT_DELETED, PRODUCT_UPDATED, ChangeEvent, EventBus
+
+
+class LoopbackRelay:
+    """Stands in for the Redis backend: delivers every publish to the other buses"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        hub.append(self)
+        self.callbacks = []
+
+    def subscribe(self, channel, callback):
+        self.callbacks.append(callback)
+
+    def publish(self, channel, message):
+        for relay in self.hub:
+            if relay is not self:
+                for callback in relay.callbacks:
+                    callback(message)
+
+
+class TestEventBus(unittest.TestCase):
+
+    def test_batches_are_filtered_by_kind(self):
+        bus, seen = EventBus(), []
+        bus.subscribe(seen.append, kinds=(PRODUCT_DELETED,))
+        bus.publish(ChangeEvent(PRODUCT_UPDATED, "1"), ChangeEvent(PRODUCT_DELETED, "2"))
+        self.assertEqual([[event.product_id for event in batch] for batch in seen], [["2"]])
+
+    def test_failing_subscriber_does_not_stop_the_others(self):
+        bus, seen = EventBus(), []
+
+        def broken(events):
+            raise RuntimeError("boom")
+
+        bus.subscribe(broken)
+        bus.subscribe(seen.append)
+        bus.publish(ChangeEvent(PRODUCT_UPDATED, "1"))
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(bus.stats()["failures"], 1)
+
+    def test_relayed_events_skip_local_only_subscribers(self):
+        hub = []
+        first, second = EventBus(LoopbackRelay(hub)), EventBus(LoopbackRelay(hub))
+        everywhere, local = [], []
+        second.subscribe(everywhere.extend)
+        second.subscribe(local.extend, local_only=True)
+        first.publish(ChangeEvent(PRODUCT_UPDATED, "1", fields=("price",), document={"price": 2.0}))
+        self.assertEqual(everywhere, [ChangeEvent(PRODUCT_UPDATED, "1", fields=("price",), remote=True)])
+        self.assertEqual(local, [])
+        self.assertEqual(second.stats()["received"], 1)
+
+
+class TestProductEventSubscribers(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        self.addCleanup(setattr, main, "catalog_version", main.catalog_version)
+        main.catalog_version = main.CatalogVersion(ttl=0)
+        main.product_cache.clear()
+        main.rebuild_search_index()
+        self.addCleanup(main.rebuild_search_index)
+        _, self.db, _, self.products, self.cart, _, _ = main.get_mongo_client()
+        self.client = TestClient(main.app)
+
+    def test_price_update_refreshes_cache_index_and_carts(self):
+        oid = self.products.insert_one({"name": "Mug", "price": 4.0, "category": "Kitchen"}).inserted_id
+        self.cart.insert_one({"user_email": "a@example.com", "items": [
+            {"product_id": str(oid), "quantity": 1, "unit_price": 4.0, "category": "Kitchen"},
+        ]})
+        version, _ = main.catalog_version.current()
+
+        self.client.put(f"/products/{oid}", json={"name": "Tea Mug", "price": 5.0})
+        self.assertEqual(main.product_cache.get_many([oid])[oid]["price"], 5.0)
+        self.assertEqual([pid for pid, _ in main.search_index.search("tea")], [oid])
+        self.assertIsNotNone(self.cart.find_one({"user_email": "a@example.com"}).get("stale_since"))
+        self.assertGreater(main.catalog_version.current()[0], version)
+
+    def test_sold_out_listing_leaves_search(self):
+        listing = self.db["selling_products"].insert_one(
+            {"name": "Vintage Lamp", "price": 15.0, "quantity": 1, "status": "unsold"}
+        ).inserted_id
+        main.rebuild_search_index()
+        main.product_cache.put(listing, {"name": "Vintage Lamp", "quantity": 1})
+        main.reserve_stock(self.db, [main.StockReservation("selling_products", listing, 1, "Vintage Lamp")])
+        self.assertEqual(main.search_index.search("lamp"), [])
+        self.assertEqual(main.product_cache.get_many([listing]), {})
+
+        main.release_stock(self.db, [main.StockReservation("selling_products", listing, 1, "Vintage Lamp")])
+        self.assertEqual([pid for pid, _ in main.search_index.search("lamp")], [listing])
+
+    def test_stock_change_leaves_search_index_alone(self):
+        oid = self.products.insert_one({"name": "Mug", "price": 4.0, "in_stock": 3}).inserted_id
+        with mock.patch.object(main.search_index, "add") as add:
+            main.reserve_stock(self.db, [main.StockReservation("products", oid, 1, "Mug")])
+        add.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests for response compression
+"""
+import unittest
+import gzip
+import sys
+sys.path.insert(0, '.')
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding
+
+
+def make_app(minimum_size=100):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size, encodings=["gzip"])
+
+    @app.get("/big")
+    def big():
+        return JSONResponse({"items": ["https://images.example/product.jpg"] * 50}, headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((f'{{"line": {i}}}\n' for i in range(3)), media_type="application/x-ndjson")
+
+    return app
+
+
+class TestChooseEncoding(unittest.TestCase):
+
+    def test_server_preference_and_quality_values(self):
+        self.assertEqual(choose_encoding("gzip, br", ("br", "gzip")), "br")
+        self.assertEqual(choose_encoding("br;q=0, gzip;q=0.5", ("br", "gzip")), "gzip")
+        self.assertEqual(choose_encoding("*", ("gzip",)), "gzip")
+        self.assertIsNone(choose_encoding("identity", ("br", "gzip")))
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(make_app())
+
+    def raw_get(self, path, encoding="gzip"):
+        with self.client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+            return response, b"".join(response.iter_raw())
+
+    def test_large_body_is_gzipped_with_weak_etag(self):
+        response, raw = self.raw_get("/big")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.headers["etag"], 'W/"abc"')
+        self.assertEqual(int(response.headers["content-length"]), len(raw))
+        self.assertIn(b"images.example", gzip.decompress(raw))
+
+    def test_small_body_and_identity_requests_are_untouched(self):
+        response, raw = self.raw_get("/small")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(raw, b'{"ok":true}')
+        response, _ = self.raw_get("/big", encoding="identity")
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_streaming_body_is_compressed_incrementally(self):
+        response, raw = self.raw_get("/stream")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        self.assertEqual(gzip.decompress(raw).decode().splitlines(), [f'{{"line": {i}}}' for i in range(3)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Unit tests for the MongoDB connection manager and health monitor
+"""
+import unittest
+import sys
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from pymongo.errors import ServerSelectionTimeoutError
+
+import main
+
+
+class FlakyClient:
+    """mongomock-backed client whose pings fail while `down` is set"""
+    down = False
+
+    def __init__(self, url, **options):
+        self._client = mongomock.MongoClient(url)
+        self.admin = self
+
+    def __getitem__(self, name):
+        return self._client[name]
+
+    def command(self, name):
+        if FlakyClient.down:
+            raise ServerSelectionTimeoutError("no servers")
+        return {"ok": 1.0}
+
+    def close(self):
+        self._client.close()
+
+
+class TestMongoConnectionManager(unittest.TestCase):
+
+    def setUp(self):
+        FlakyClient.down = False
+        self.manager = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=FlakyClient)
+
+    def test_handles_are_cached_and_do_not_ping(self):
+        with mock.patch.object(self.manager, "ping") as ping:
+            first = self.manager.handles()
+            second = self.manager.handles()
+        ping.assert_not_called()
+        self.assertIs(first[0], second[0])
+        self.assertIs(first[3], second[3])
+        self.assertEqual(first[3].name, "products")
+
+    def test_ping_records_health(self):
+        self.assertTrue(self.manager.ping())
+        self.assertEqual(self.manager.health["status"], "healthy")
+        self.assertEqual(self.manager.next_check_delay(), main.MONGO_HEALTH_CHECK_INTERVAL)
+
+    def test_failures_back_off_exponentially(self):
+        FlakyClient.down = True
+        delays = []
+        for _ in range(10):
+            self.assertFalse(self.manager.ping())
+            delays.append(self.manager.next_check_delay())
+        self.assertEqual(self.manager.health["status"], "unhealthy")
+        self.assertEqual(delays[:4], [1, 2, 4, 8])
+        self.assertEqual(delays[-1], main.MONGO_RECONNECT_BACKOFF_MAX)
+
+        FlakyClient.down = False
+        self.assertTrue(self.manager.ping())
+        self.assertEqual(self.manager.health["consecutive_failures"], 0)
+
+    def test_failed_pings_keep_handles_usable(self):
+        handles = self.manager.handles()
+        FlakyClient.down = True
+        for _ in range(3):
+            self.manager.ping()
+        FlakyClient.down = False
+        self.assertIs(self.manager.handles()[0], handles[0])
+        handles[3].insert_one({"name": "Mug"})
+        self.assertEqual(handles[3].count_documents({}), 1)
+
+if __name__ == "__main__":
+    unittest.main()
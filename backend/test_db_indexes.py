@@ -0,0 +1,37 @@
+"""
+Unit tests for index bootstrap and migrations
+"""
+import unittest
+import sys
+sys.path.insert(0, '.')
+
+import mongomock
+
+import db_indexes
+
+
+class TestIndexBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mongomock.MongoClient()["test-db"]
+
+    def test_apply_is_idempotent(self):
+        self.assertEqual(len(db_indexes.missing_indexes(self.db)), 9)
+        self.assertEqual(db_indexes.apply_indexes(self.db), [])
+        self.assertEqual(db_indexes.apply_indexes(self.db), [])
+        self.assertEqual(db_indexes.missing_indexes(self.db), [])
+
+    def test_unique_index_over_duplicates_is_reported(self):
+        self.db["users"].insert_many([{"email": "a@example.com"}, {"email": "a@example.com"}])
+        failures = db_indexes.apply_indexes(self.db)
+        self.assertEqual([(c, n) for c, n, _ in failures], [("users", "email_unique")])
+
+    def test_migrations_run_once(self):
+        product_id = self.db["products"].insert_one({"name": "Mug"}).inserted_id
+        self.assertEqual(db_indexes.run_migrations(self.db), ["0001_backfill_product_timestamps"])
+        self.assertEqual(db_indexes.run_migrations(self.db), [])
+        product = self.db["products"].find_one({"_id": product_id})
+        self.assertEqual(product["created_at"], product["updated_at"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests for the compiled discount rule engine and /cart/total pricing
+"""
+import unittest
+from unittest import mock
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from discounts import CartLine, DiscountEngine
+
+
+class TestDiscountEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = DiscountEngine()
+        self.lines = [
+            CartLine("book-1", "Books", 10.0, 3),
+            CartLine("mug-1", "Home", 20.0, 1),
+        ]
+
+    def test_category_and_item_rules_apply_per_line(self):
+        self.engine.load([
+            {"rule_id": "books", "type": "percentage", "value": 50, "scope": "category", "target": "Books"},
+            {"rule_id": "mug", "type": "flat", "value": 5, "scope": "item", "target": "mug-1"},
+        ])
+        priced = self.engine.evaluate(self.lines)
+        self.assertEqual(priced["subtotal"], 50.0)
+        self.assertEqual(priced["total"], 30.0)
+        self.assertEqual({a["rule_id"]: a["amount"] for a in priced["applied"]}, {"books": 15.0, "mug": 5.0})
+
+    def test_only_first_non_stackable_rule_applies_but_stackable_ones_add_up(self):
+        self.engine.load([
+            {"rule_id": "a", "type": "percentage", "value": 10, "priority": 1},
+            {"rule_id": "b", "type": "percentage", "value": 50, "priority": 2},
+            {"rule_id": "c", "type": "flat", "value": 5, "priority": 3, "stackable": True},
+        ])
+        priced = self.engine.evaluate(self.lines)
+        self.assertEqual(priced["total"], 40.0)
+        self.assertEqual([a["rule_id"] for a in priced["applied"]], ["a", "c"])
+
+    def test_code_rules_only_apply_with_their_code(self):
+        self.engine.load([
+            {"rule_id": "bogo", "code": "bogo", "type": "buy_x_get_y", "buy_x": 2, "get_y": 1, "scope": "item",
+             "target": "book-1"},
+        ])
+        self.assertEqual(self.engine.evaluate(self.lines)["total"], 50.0)
+        priced = self.engine.evaluate(self.lines, "BOGO")
+        self.assertEqual(priced["total"], 40.0)
+        self.assertTrue(priced["code_accepted"])
+
+    def test_legacy_and_unknown_codes(self):
+        self.assertEqual(self.engine.evaluate(self.lines, "FLAT50")["total"], 0.0)
+        self.assertEqual(self.engine.evaluate(self.lines, "buy2get1")["total"], 40.0)
+        unknown = self.engine.evaluate(self.lines, "NOPE")
+        self.assertEqual(unknown["total"], 50.0)
+        self.assertFalse(unknown["code_accepted"])
+
+    def test_expired_inactive_and_invalid_rules_are_skipped(self):
+        now = datetime.utcnow()
+        errors = self.engine.load([
+            {"rule_id": "old", "type": "percentage", "value": 10, "ends_at": now - timedelta(days=1)},
+            {"rule_id": "off", "type": "percentage", "value": 10, "active": False},
+            {"rule_id": "broken", "type": "mystery", "value": 10},
+            {"rule_id": "big", "type": "flat", "value": 10, "min_subtotal": 100},
+        ])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.engine.evaluate(self.lines, now=now)["total"], 50.0)
+
+
+class TestCartTotalWithRules(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        self.addCleanup(main.discount_engine.load, [])
+        main.product_cache.clear()
+        main.cart_total_cache.clear()
+        _, self.db, _, products, cart, _, _ = main.get_mongo_client()
+        product_id = str(products.insert_one({"name": "Novel", "price": 10.0, "category": "Books"}).inserted_id)
+        cart.insert_one({"user_email": "a@example.com", "items": [{"product_id": product_id, "quantity": 2}]})
+        patcher = mock.patch.object(main, "ADMIN_EMAILS", {"admin@example.com"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = {"Authorization": f"Bearer {main.create_access_token({'sub': 'admin@example.com'})}"}
+        self.client = TestClient(main.app)
+
+    def test_saved_rule_applies_immediately(self):
+        response = self.client.put("/discounts/books", json={
+            "code": "read", "type": "percentage", "value": 25, "scope": "category", "target": "Books",
+        }, headers=self.admin)
+        self.assertEqual(response.status_code, 200)
+        body = self.client.get("/cart/total", params={"user_email": "a@example.com", "discount": "READ"}).json()
+        self.assertEqual(body["total"], 15.0)
+        self.assertEqual(body["subtotal"], 20.0)
+
+        self.assertEqual(self.client.delete("/discounts/books", headers=self.admin).status_code, 200)
+        body = self.client.get("/cart/total", params={"user_email": "a@example.com", "discount": "READ"}).json()
+        self.assertEqual(body["total"], 20.0)
+
+    def test_invalid_rule_is_rejected(self):
+        response = self.client.put("/discounts/bad", json={"type": "percentage", "scope": "galaxy"}, headers=self.admin)
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_admins_manage_rules(self):
+        rule = {"type": "percentage", "value": 100}
+        user = {"Authorization": f"Bearer {main.create_access_token({'sub': 'a@example.com'})}"}
+        self.assertEqual(self.client.put("/discounts/free", json=rule).status_code, 401)
+        self.assertEqual(self.client.put("/discounts/free", json=rule, headers=user).status_code, 403)
+        self.assertEqual(self.db["discounts"].count_documents({}), 0)
+        self.assertEqual(self.client.put("/discounts/free", json=rule, headers=self.admin).status_code, 200)
+        self.assertEqual(self.client.delete("/discounts/free", headers=user).status_code, 403)
+        self.assertEqual(self.db["discounts"].count_documents({}), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Tests for the streaming NDJSON export endpoints
+"""
+import json
+import unittest
+import sys
+from datetime import datetime
+sys.path.insert(0, '.')
+
+from unittest import mock
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from exports import ndjson_batches
+
+
+class CountingCursor:
+    """An iterable cursor that records how many documents have been pulled from it"""
+
+    def __init__(self, count):
+        self.count = count
+        self.pulled = 0
+        self.closed = False
+
+    def __iter__(self):
+        for i in range(self.count):
+            self.pulled += 1
+            yield {"n": i}
+
+    def close(self):
+        self.closed = True
+
+
+class TestNdjsonBatches(unittest.TestCase):
+
+    def test_reads_one_batch_ahead_at_most(self):
+        cursor = CountingCursor(5)
+        chunks = ndjson_batches(cursor, batch_size=2)
+        self.assertEqual(next(chunks), b'{"n":0}\n{"n":1}\n')
+        self.assertEqual(cursor.pulled, 2)
+        self.assertEqual(list(chunks), [b'{"n":2}\n{"n":3}\n', b'{"n":4}\n'])
+        self.assertTrue(cursor.closed)
+
+    def test_abandoned_export_closes_the_cursor(self):
+        cursor = CountingCursor(5)
+        chunks = ndjson_batches(cursor, batch_size=1)
+        next(chunks)
+        chunks.close()
+        self.assertTrue(cursor.closed)
+
+
+class TestExportEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        _, self.db, self.users, self.products, _, _, self.orders = main.get_mongo_client()
+        patcher = mock.patch.object(main, "ADMIN_EMAILS", {"admin@example.com"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(main.app)
+        self.client.headers["Authorization"] = self.bearer("admin@example.com")
+
+    def bearer(self, email):
+        return f"Bearer {main.create_access_token({'sub': email})}"
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_orders_are_filtered_by_date_and_status(self):
+        for day, status in [(1, "paid"), (2, "pending"), (3, "paid"), (4, "shipped"), (5, "paid")]:
+            self.orders.insert_one({"order_id": f"ORD{day}", "status": status, "created_at": datetime(2024, 1, day)})
+        response = self.client.get("/export/orders", params={
+            "start": "2024-01-02T00:00:00", "end": "2024-01-05T00:00:00+00:00", "status": "paid,shipped", "batch_size": 1,
+        })
+        orders = self.lines(response)
+        self.assertEqual([order["order_id"] for order in orders], ["ORD3", "ORD4"])
+        self.assertIsInstance(orders[0]["_id"], str)
+
+    def test_products_include_catalog_and_listings(self):
+        self.products.insert_one({"name": "Mug", "price": 4.0})
+        self.db["selling_products"].insert_one({"name": "Lamp", "price": 9.0, "quantity": 0, "status": "sold"})
+        products = self.lines(self.client.get("/export/products"))
+        self.assertEqual([product["name"] for product in products], ["Mug", "Lamp"])
+        catalog = self.lines(self.client.get("/export/products", params={"source": "catalog"}))
+        self.assertEqual([product["name"] for product in catalog], ["Mug"])
+
+    def test_users_never_include_password_hashes(self):
+        self.users.insert_one({"email": "a@example.com", "hashed_password": "secret"})
+        users = self.lines(self.client.get("/export/users"))
+        self.assertEqual([set(user) for user in users], [{"_id", "email"}])
+
+    def test_exports_require_an_admin_or_the_order_owner(self):
+        self.orders.insert_one({"order_id": "ORD1", "user_email": "a@example.com", "created_at": datetime(2024, 1, 1)})
+        self.orders.insert_one({"order_id": "ORD2", "user_email": "b@example.com", "created_at": datetime(2024, 1, 2)})
+        anonymous = TestClient(main.app)
+        for path in ("/export/orders", "/export/users", "/export/products"):
+            self.assertEqual(anonymous.get(path).status_code, 401)
+        self.assertEqual(anonymous.get("/export/orders", params={"user_email": "a@example.com"}).status_code, 401)
+
+        user = {"Authorization": self.bearer("a@example.com")}
+        self.assertEqual(self.client.get("/export/users", headers=user).status_code, 403)
+        self.assertEqual(self.client.get("/export/orders", headers=user).status_code, 403)
+        self.assertEqual(
+            self.client.get("/export/orders", params={"user_email": "b@example.com"}, headers=user).status_code, 403
+        )
+        own = self.lines(self.client.get("/export/orders", params={"user_email": "a@example.com"}, headers=user))
+        self.assertEqual([order["order_id"] for order in own], ["ORD1"])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.client.get("/export/orders", params={"batch_size": 0}).status_code, 400)
+        self.assertEqual(self.client.get("/export/products", params={"source": "orders"}).status_code, 400)
+        self.assertEqual(self.client.get("/export/orders", params={
+            "start": "2024-02-01T00:00:00", "end": "2024-01-01T00:00:00",
+        }).status_code, 400)
+
+if __name__ == "__main__":
+    unittest.main()
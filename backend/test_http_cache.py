@@ -0,0 +1,84 @@
+"""
+Tests for conditional GETs on product endpoints
+"""
+import unittest
+import sys
+from datetime import datetime
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from http_cache import etag_matches, http_date, make_etag, not_modified_since
+
+
+class TestValidators(unittest.TestCase):
+
+    def test_etag_comparison(self):
+        etag = make_etag("products", 3, 20)
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(f'"other", W/{etag}', etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches(make_etag("products", 4, 20), etag))
+        self.assertFalse(etag_matches(None, etag))
+
+    def test_if_modified_since_has_second_resolution(self):
+        modified = datetime(2024, 5, 1, 12, 0, 0, 500000)
+        self.assertTrue(not_modified_since(http_date(modified), modified))
+        self.assertFalse(not_modified_since(http_date(datetime(2024, 5, 1, 11, 59, 59)), modified))
+        self.assertFalse(not_modified_since("not a date", modified))
+
+
+class TestConditionalProductRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        self.addCleanup(setattr, main, "catalog_version", main.catalog_version)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.catalog_version = main.CatalogVersion(ttl=0)
+        main.product_cache.clear()
+        self.client = TestClient(main.app)
+        self.product = {"name": "Mug", "price": 5.0, "in_stock": 3, "category": "Home"}
+
+    def test_unchanged_listing_is_answered_with_304(self):
+        self.client.post("/products", json=self.product)
+        first = self.client.get("/products")
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("max-age", first.headers["cache-control"])
+        etag = first.headers["etag"]
+
+        again = self.client.get("/products", headers={"If-None-Match": etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        self.assertEqual(again.headers["etag"], etag)
+
+        self.client.post("/products", json={**self.product, "name": "Plate"})
+        changed = self.client.get("/products", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["etag"], etag)
+        self.assertEqual(changed.json()["count"], 2)
+
+    def test_search_etag_depends_on_the_query(self):
+        self.client.post("/products", json=self.product)
+        etag = self.client.get("/products/search", params={"category": "Home"}).headers["etag"]
+        other = self.client.get("/products/search", params={"category": "Toys"}, headers={"If-None-Match": etag})
+        self.assertEqual(other.status_code, 200)
+
+    def test_product_revalidates_on_updated_at(self):
+        product_id = self.client.post("/products", json=self.product).json()["product"]["_id"]
+        first = self.client.get(f"/products/{product_id}")
+        etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+        self.assertEqual(self.client.get(f"/products/{product_id}", headers={"If-None-Match": etag}).status_code, 304)
+        self.assertEqual(
+            self.client.get(f"/products/{product_id}", headers={"If-Modified-Since": last_modified}).status_code, 304
+        )
+
+        self.client.put(f"/products/{product_id}", json={"price": 6.0})
+        updated = self.client.get(f"/products/{product_id}", headers={"If-None-Match": etag})
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(updated.json()["product"]["price"], 6.0)
+
+if __name__ == "__main__":
+    unittest.main()
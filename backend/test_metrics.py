@@ -0,0 +1,62 @@
+"""
+Tests for the request metrics middleware and /metrics endpoint
+"""
+import unittest
+import sys
+from types import SimpleNamespace
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from metrics import MongoCommandMetrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        self.client = TestClient(main.app)
+
+    def test_routes_are_labelled_by_template(self):
+        route = main.metrics_registry.route_metrics("GET", "/products/{product_id}")
+        before = route.latency.count if route else 0
+        self.client.get("/products/0123456789abcdef01234567")
+        self.client.get("/products/76543210fedcba9876543210")
+        text = self.client.get("/metrics").text
+        self.assertIn(
+            f'http_request_duration_seconds_count{{method="GET",route="/products/{{product_id}}"}} {before + 2}', text
+        )
+        self.assertIn('http_requests_total{method="GET",route="/products/{product_id}",status="404"}', text)
+        self.assertIn("http_requests_in_flight 1", text)
+
+    def test_mongo_commands_are_charged_to_the_request(self):
+        listener = MongoCommandMetrics()
+        cart = main.get_mongo_client()[4]
+
+        def find_one(*args, **kwargs):
+            # Runs on the threadpool worker serving the sync handler
+            listener.succeeded(SimpleNamespace(duration_micros=2500))
+            listener.succeeded(SimpleNamespace(duration_micros=500))
+            return None
+
+        def snapshot():
+            route = main.metrics_registry.route_metrics("GET", "/cart")
+            if route is None:
+                return 0, 0, 0.0, 0
+            return route.latency.count, route.mongo_calls.sum, route.mongo_seconds, route.response_size.sum
+
+        before = snapshot()
+        with mock.patch.object(cart, "find_one", side_effect=find_one):
+            self.client.get("/cart", params={"user_email": "a@example.com"})
+        requests, calls, seconds, size = (after - prior for after, prior in zip(snapshot(), before))
+        self.assertEqual(requests, 1)
+        self.assertEqual(calls, 2)
+        self.assertAlmostEqual(seconds, 0.003)
+        self.assertEqual(size, len(b'{"items":[]}'))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Tests for the per-request MongoDB profiler and /debug/profile
+"""
+import unittest
+import sys
+from types import SimpleNamespace
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from metrics import RequestStats
+from mongo_profiler import MongoProfiler, describe_command
+
+
+def command_events(request_id, command_name, command, duration_micros=1000):
+    started = SimpleNamespace(command_name=command_name, command=command, connection_id=("db", 27017),
+                              request_id=request_id)
+    finished = SimpleNamespace(connection_id=("db", 27017), request_id=request_id,
+                               duration_micros=duration_micros)
+    return started, finished
+
+
+class TestDescribeCommand(unittest.TestCase):
+
+    def test_literals_do_not_change_the_shape(self):
+        first = describe_command("find", {"find": "products", "filter": {"_id": 1, "price": {"$gt": 5}}})
+        second = describe_command("find", {"find": "products", "filter": {"price": {"$gt": 9}, "_id": 2}})
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], "products")
+
+    def test_update_uses_first_statement_filter(self):
+        collection, shape = describe_command("update", {"update": "cart", "updates": [{"q": {"user_email": "a"}}]})
+        self.assertEqual(collection, "cart")
+        self.assertEqual(shape, (("user_email", "?"),))
+
+
+class TestMongoProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        self.client = TestClient(main.app)
+
+    def test_events_outside_a_request_are_ignored(self):
+        profiler = MongoProfiler(threshold=1)
+        started, finished = command_events(1, "find", {"find": "products", "filter": {}})
+        profiler.started(started)
+        profiler.succeeded(finished)
+        profiler.request_finished("GET", "/x", RequestStats())
+        self.assertEqual(profiler.snapshot()["routes"]["GET /x"]["commands"], {})
+
+    def test_repeated_lookups_are_flagged(self):
+        cart = main.get_mongo_client()[4]
+        threshold = main.mongo_profiler.threshold
+
+        def find_one(*args, **kwargs):
+            # One same-shaped product lookup per item, as an N+1 loop would issue
+            for request_id in range(threshold + 1):
+                started, finished = command_events(request_id, "find",
+                                                   {"find": "products", "filter": {"_id": request_id}})
+                main.mongo_profiler.started(started)
+                main.mongo_profiler.succeeded(finished)
+            return None
+
+        with mock.patch.object(cart, "find_one", side_effect=find_one), \
+                mock.patch("builtins.print") as printed:
+            self.client.get("/cart", params={"user_email": "a@example.com"})
+        self.assertTrue(any("N+1" in str(call) for call in printed.call_args_list))
+
+        profile = self.client.get("/debug/profile").json()
+        self.assertEqual(profile["recent_n_plus_one"][-1]["route"], "GET /cart")
+        self.assertEqual(profile["recent_n_plus_one"][-1]["count"], threshold + 1)
+        self.assertGreaterEqual(profile["routes"]["GET /cart"]["commands"]["products.find"]["count"], threshold + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests for cursor-based pagination on /products, /products/search and /orders
+"""
+import unittest
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+
+
+class TestCursorPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.product_cache.clear()
+        _, self.db, _, self.products, _, _, self.orders = main.get_mongo_client()
+        self.client = TestClient(main.app)
+
+    def _walk(self, path, params):
+        seen = []
+        cursor = None
+        while True:
+            query = dict(params, **({"cursor": cursor} if cursor else {}))
+            body = self.client.get(path, params=query).json()
+            key = "orders" if "orders" in body else "products"
+            seen.extend(item["order_id"] if key == "orders" else item["name"] for item in body[key])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return seen
+
+    def test_products_cursor_walks_every_product_once(self):
+        self.products.insert_many([{"name": f"P{i:02d}", "price": 1.0, "in_stock": 1} for i in range(25)])
+        seen = self._walk("/products", {"limit": 10})
+        self.assertEqual(seen, [f"P{i:02d}" for i in range(25)])
+
+    def test_products_merges_user_listings_into_pages(self):
+        selling = self.db["selling_products"]
+        for i in range(12):
+            self.products.insert_one({"name": f"P{i:02d}", "price": 1.0, "in_stock": 1})
+            selling.insert_one({"name": f"L{i:02d}", "price": 1.0, "quantity": 1, "status": "unsold"})
+        selling.insert_one({"name": "sold", "price": 1.0, "quantity": 0, "status": "sold"})
+
+        first = self.client.get("/products", params={"limit": 5}).json()
+        self.assertEqual(first["count"], 5)
+        self.assertEqual([p["name"] for p in first["products"]], ["P00", "L00", "P01", "L01", "P02"])
+
+        seen = self._walk("/products", {"limit": 5})
+        self.assertEqual(len(seen), 24)
+        self.assertEqual(len(set(seen)), 24)
+        self.assertNotIn("sold", seen)
+        self.assertEqual(self._walk("/products", {"limit": 7, "skip": 20})[:4], ["P10", "L10", "P11", "L11"])
+
+    def test_search_cursor_keeps_filters(self):
+        self.products.insert_many(
+            [{"name": f"P{i:02d}", "price": float(i), "category": "A" if i % 2 else "B"} for i in range(20)]
+        )
+        seen = self._walk("/products/search", {"category": "A", "limit": 3})
+        self.assertEqual(seen, [f"P{i:02d}" for i in range(1, 20, 2)])
+
+    def test_orders_cursor_is_newest_first_with_ties(self):
+        start = datetime(2024, 1, 1)
+        self.orders.insert_many([
+            {"order_id": f"ORD{i:02d}", "user_email": "a@example.com", "created_at": start + timedelta(minutes=i // 2)}
+            for i in range(9)
+        ])
+        seen = self._walk("/orders", {"user_email": "a@example.com", "limit": 2})
+        self.assertEqual(seen[0], "ORD08")
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(len(set(seen)), 9)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/products", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_products_rejects_out_of_range_skip_and_limit(self):
+        for params in ({"skip": -1}, {"limit": 0}, {"limit": -5}, {"limit": main.PRODUCTS_PAGE_MAX + 1}):
+            self.assertEqual(self.client.get("/products", params=params).status_code, 400, params)
+        self.assertEqual(self.client.get("/products", params={"limit": main.PRODUCTS_PAGE_MAX}).status_code, 200)
+
+    def test_orders_rejects_out_of_range_skip_and_limit(self):
+        self.orders.insert_many([
+            {"order_id": f"ORD{i:02d}", "user_email": "a@example.com", "created_at": datetime(2024, 1, 1)}
+            for i in range(3)
+        ])
+        for params in ({"skip": -1}, {"limit": 0}, {"limit": -1}, {"limit": main.ORDERS_PAGE_MAX + 1}):
+            response = self.client.get("/orders", params={"user_email": "a@example.com", **params})
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_search_rejects_out_of_range_skip_and_limit(self):
+        self.products.insert_one({"name": "Mug", "price": 1.0, "category": "A"})
+        for search in ({"category": "A"}, {"name": "mug"}):
+            for params in ({"skip": -1}, {"limit": 0}, {"limit": main.PRODUCTS_PAGE_MAX + 1}):
+                response = self.client.get("/products/search", params={**search, **params})
+                self.assertEqual(response.status_code, 400, (search, params))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests for pooled password hashing in signup and login
+"""
+import asyncio
+import unittest
+import sys
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from password_hashing import PasswordHasher, PoolSaturated
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def test_process_pool_round_trip(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=4)
+        self.addCleanup(hasher.shutdown)
+
+        async def scenario():
+            hashed = await hasher.hash("secret")
+            return hashed, await hasher.verify("secret", hashed), await hasher.verify("wrong", hashed)
+
+        hashed, good, bad = asyncio.run(scenario())
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertEqual(good, (True, None))
+        self.assertFalse(bad[0])
+        self.assertEqual(hasher.stats()["completed"], 3)
+
+    def test_rejects_when_queue_is_full(self):
+        hasher = PasswordHasher(rounds=4, workers=0, max_queue=1)
+
+        async def scenario():
+            return await asyncio.gather(*(hasher.hash("pw") for _ in range(4)), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertEqual(sum(isinstance(r, PoolSaturated) for r in results), 2)
+        self.assertEqual(hasher.stats()["rejected"], 2)
+        self.assertEqual(hasher.stats()["peak_pending"], 2)
+
+
+class TestSignupAndLogin(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        self.addCleanup(setattr, main, "password_hasher", main.password_hasher)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.password_hasher = PasswordHasher(rounds=4, workers=0)
+        _, _, self.users, _, _, _, _ = main.get_mongo_client()
+        self.client = TestClient(main.app)
+
+    def login(self, password):
+        return self.client.post("/login", data={"username": "a@example.com", "password": password})
+
+    def test_login_rehashes_when_cost_changes(self):
+        response = self.client.post("/signup", json={"username": "a", "email": "a@example.com", "password": "pw"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.login("nope").status_code, 400)
+
+        main.password_hasher = PasswordHasher(rounds=5, workers=0)
+        self.assertEqual(self.login("pw").status_code, 200)
+        self.assertTrue(self.users.find_one({"email": "a@example.com"})["hashed_password"].startswith("$2b$05$"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Unit tests for the in-process product cache
+"""
+import unittest
+import sys
+sys.path.insert(0, '.')
+
+from bson import ObjectId
+
+from main import ProductCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProductCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ProductCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_hit_and_miss_counters(self):
+        oid = ObjectId()
+        self.assertIsNone(self.cache.get(oid))
+        self.cache.put(oid, {"name": "Mug"})
+        self.assertEqual(self.cache.get(oid), {"name": "Mug"})
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_returns_copies(self):
+        oid = ObjectId()
+        self.cache.put(oid, {"name": "Mug"})
+        self.cache.get(oid)["name"] = "Changed"
+        self.assertEqual(self.cache.get(oid)["name"], "Mug")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        first, second, third = ObjectId(), ObjectId(), ObjectId()
+        self.cache.put(first, {"n": 1})
+        self.cache.put(second, {"n": 2})
+        self.cache.get(first)
+        self.cache.put(third, {"n": 3})
+        self.assertIsNone(self.cache.get(second))
+        self.assertIsNotNone(self.cache.get(first))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        oid = ObjectId()
+        self.cache.put(oid, {"n": 1})
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get(oid))
+        self.assertEqual(self.cache.stats()["expirations"], 1)
+
+    def test_invalidate(self):
+        oid = ObjectId()
+        self.cache.put(oid, {"n": 1})
+        self.cache.invalidate(oid)
+        self.assertIsNone(self.cache.get(oid))
+
+if __name__ == "__main__":
+    unittest.main()
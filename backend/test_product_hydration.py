@@ -0,0 +1,59 @@
+"""
+Unit tests for batched product hydration
+"""
+import unittest
+import sys
+from unittest import mock
+sys.path.insert(0, '.')
+
+import mongomock
+
+import main
+
+
+class TestHydrateProducts(unittest.TestCase):
+
+    def setUp(self):
+        self.db = mongomock.MongoClient()["test-db"]
+        self.products = self.db["products"]
+        self.selling = self.db["selling_products"]
+        handles = (None, self.db, self.db["users"], self.products, self.db["cart"],
+                   self.db["wishlist"], self.db["orders"])
+        patcher = mock.patch.object(main, "get_mongo_client", return_value=handles)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        main.product_cache.clear()
+
+    def test_preserves_order_and_reports_missing(self):
+        first = self.products.insert_one({"name": "Mug", "price": 5.0, "in_stock": 3}).inserted_id
+        second = self.products.insert_one({"name": "Mat", "price": 9.0, "in_stock": 1}).inserted_id
+        listing = self.selling.insert_one({"name": "Lamp", "price": 4.0, "quantity": 2}).inserted_id
+        ids = [str(second), "not-an-id", str(listing), str(first), "0" * 24]
+
+        products, missing = main.hydrate_products(ids)
+
+        self.assertEqual([pid for pid in ids if pid in products], [str(second), str(listing), str(first)])
+        self.assertEqual(missing, ["not-an-id", "0" * 24])
+        self.assertEqual(products[str(first)]["name"], "Mug")
+        self.assertEqual(products[str(listing)]["source"], "selling_products")
+
+    def test_single_query_per_collection(self):
+        ids = [str(self.products.insert_one({"name": f"P{i}", "price": 1.0}).inserted_id) for i in range(10)]
+        with mock.patch.object(self.products, "find", wraps=self.products.find) as find, \
+                mock.patch.object(self.selling, "find", wraps=self.selling.find) as selling_find:
+            products, missing = main.hydrate_products(ids)
+        self.assertEqual(len(products), 10)
+        self.assertEqual(missing, [])
+        self.assertEqual(find.call_count, 1)
+        self.assertEqual(selling_find.call_count, 0)
+
+    def test_second_lookup_is_served_from_cache(self):
+        ids = [str(self.products.insert_one({"name": f"P{i}", "price": 1.0}).inserted_id) for i in range(3)]
+        main.hydrate_products(ids)
+        with mock.patch.object(self.products, "find", wraps=self.products.find) as find:
+            products, missing = main.hydrate_products(ids)
+        self.assertEqual(len(products), 3)
+        find.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Unit tests for the product search index and /products/search
+"""
+import unittest
+import sys
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+from search_index import ProductSearchIndex
+
+
+class TestProductSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ProductSearchIndex()
+        self.index.add(1, {"name": "Wireless Mouse", "category": "Electronics", "price": 19.99})
+        self.index.add(2, {"name": "Mouse Pad", "description": "Pairs with any wireless mouse", "price": 5.0})
+        self.index.add(3, {"name": "Coffee Mug", "category": "Kitchen", "price": 7.99})
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual([pid for pid, _ in self.index.search("wireless")], [1, 2])
+
+    def test_prefix_matching_and_all_terms_required(self):
+        self.assertEqual([pid for pid, _ in self.index.search("wire mou")], [1, 2])
+        self.assertEqual(self.index.search("wireless mug"), [])
+
+    def test_exact_match_beats_prefix_match(self):
+        self.index.add(4, {"name": "Mousetrap"})
+        results = self.index.search("mouse")
+        self.assertEqual(results[-1][0], 4)
+
+    def test_filters(self):
+        self.assertEqual([pid for pid, _ in self.index.search("mouse", max_price=10)], [2])
+        self.assertEqual([pid for pid, _ in self.index.search("mouse", category="Electronics")], [1])
+
+    def test_update_and_remove(self):
+        self.index.add(3, {"name": "Tea Cup"})
+        self.assertEqual(self.index.search("coffee"), [])
+        self.index.remove(1)
+        self.assertEqual([pid for pid, _ in self.index.search("wireless")], [2])
+        self.assertEqual(self.index.search("electronics"), [])
+
+
+class TestSearchEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        self.addCleanup(setattr, main, "search_index", main.search_index)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.search_index = ProductSearchIndex()
+        main.product_cache.clear()
+        _, self.db, _, self.products, _, _, _ = main.get_mongo_client()
+        self.client = TestClient(main.app)
+
+    def test_search_covers_catalog_and_listings_and_tracks_writes(self):
+        self.products.insert_one({"name": "Desk Lamp", "price": 20.0, "in_stock": 3})
+        self.db["selling_products"].insert_one({"name": "Vintage Lamp", "price": 15.0, "quantity": 1, "status": "unsold"})
+        body = self.client.get("/products/search", params={"name": "lamp"}).json()
+        self.assertEqual(sorted(p["name"] for p in body["products"]), ["Desk Lamp", "Vintage Lamp"])
+
+        created = self.client.post("/products", json={"name": "Lamp Shade", "price": 4.0, "in_stock": 2}).json()
+        names = [p["name"] for p in self.client.get("/products/search", params={"name": "lamp sha"}).json()["products"]]
+        self.assertEqual(names, ["Lamp Shade"])
+
+        self.client.delete(f"/products/{created['product']['_id']}")
+        self.assertEqual(self.client.get("/products/search", params={"name": "shade"}).json()["products"], [])
+
+    def test_search_cursor_pages_through_ranked_results(self):
+        self.products.insert_many([{"name": f"Lamp {i}", "price": 1.0} for i in range(7)])
+        seen = []
+        params = {"name": "lamp", "limit": 3}
+        while True:
+            body = self.client.get("/products/search", params=params).json()
+            seen.extend(p["name"] for p in body["products"])
+            if body["next_cursor"] is None:
+                break
+            params["cursor"] = body["next_cursor"]
+        self.assertEqual(sorted(seen), sorted(f"Lamp {i}" for i in range(7)))
+
+if __name__ == "__main__":
+    unittest.main()
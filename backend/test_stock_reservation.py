@@ -0,0 +1,126 @@
+"""
+Tests for stock reservation in create_order and verify_payment
+"""
+import unittest
+from unittest import mock
+import sys
+sys.path.insert(0, '.')
+
+import mongomock
+from pymongo.errors import AutoReconnect
+from fastapi.testclient import TestClient
+
+import main
+
+SHIPPING = {
+    "full_name": "A Buyer", "phone": "9999999999", "address_line1": "1 Street",
+    "city": "Pune", "state": "MH", "postal_code": "411001",
+}
+
+
+class TestStockReservation(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        self.addCleanup(setattr, main, "razorpay_client", main.razorpay_client)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        main.razorpay_client = None
+        main.product_cache.clear()
+        _, self.db, _, self.products, _, _, self.orders = main.get_mongo_client()
+        self.client = TestClient(main.app)
+
+    def order(self, *lines):
+        items = [
+            {"product_id": str(pid), "product_name": "Item", "quantity": qty, "price": 1.0}
+            for pid, qty in lines
+        ]
+        return self.client.post("/orders/create", json={
+            "user_email": "a@example.com", "items": items, "shipping_address": SHIPPING, "total_amount": 1.0,
+        })
+
+    def stock(self, pid, collection="products", field="in_stock"):
+        return self.db[collection].find_one({"_id": pid})[field]
+
+    def test_stock_is_taken_once_per_order(self):
+        pid = self.products.insert_one({"name": "Mug", "price": 1.0, "in_stock": 5}).inserted_id
+        response = self.order((pid, 2))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(pid), 3)
+
+        order_id = response.json()["order"]["order_id"]
+        payment = {"order_id": order_id, "razorpay_order_id": "o", "razorpay_payment_id": "p", "razorpay_signature": "s"}
+        for _ in range(2):
+            self.assertEqual(self.client.post("/orders/verify-payment", json=payment).status_code, 200)
+        self.assertEqual(self.stock(pid), 3)
+
+    def test_only_the_owner_can_confirm_payment(self):
+        pid = self.products.insert_one({"name": "Mug", "price": 1.0, "in_stock": 5}).inserted_id
+        order_id = self.order((pid, 1)).json()["order"]["order_id"]
+        payment = {"order_id": order_id, "razorpay_order_id": "o", "razorpay_payment_id": "p", "razorpay_signature": "s"}
+
+        def verify(email):
+            headers = {"Authorization": f"Bearer {main.create_access_token({'sub': email})}"}
+            return self.client.post("/orders/verify-payment", json=payment, headers=headers)
+
+        self.assertEqual(verify("b@example.com").status_code, 403)
+        self.assertEqual(self.orders.find_one({"order_id": order_id})["status"], "pending")
+        self.assertEqual(verify("a@example.com").status_code, 200)
+
+    def test_does_not_oversell(self):
+        pid = self.products.insert_one({"name": "Mug", "price": 1.0, "in_stock": 3}).inserted_id
+        self.assertEqual(self.order((pid, 2)).status_code, 200)
+        self.assertEqual(self.order((pid, 2)).status_code, 400)
+        self.assertEqual(self.stock(pid), 1)
+
+    def test_shortfall_releases_earlier_reservations(self):
+        first = self.products.insert_one({"name": "Mug", "price": 1.0, "in_stock": 5}).inserted_id
+        second = self.products.insert_one({"name": "Mat", "price": 1.0, "in_stock": 1}).inserted_id
+        reservations = [
+            main.StockReservation("products", first, 2, "Mug"),
+            main.StockReservation("products", second, 2, "Mat"),
+        ]
+        with self.assertRaises(main.HTTPException):
+            main.reserve_stock(self.db, reservations)
+        self.assertEqual(self.stock(first), 5)
+        self.assertEqual(self.stock(second), 1)
+        self.assertEqual(self.orders.count_documents({}), 0)
+
+    def test_non_positive_quantities_are_rejected(self):
+        pid = self.products.insert_one({"name": "Mug", "price": 1.0, "in_stock": 5}).inserted_id
+        self.assertEqual(self.order((pid, -3)).status_code, 400)
+        self.assertEqual(self.order((pid, 2), (pid, -2)).status_code, 400)
+        self.assertEqual(self.order((pid, 0)).status_code, 400)
+        for call in (main.reserve_stock, main.release_stock):
+            with self.assertRaises(main.HTTPException):
+                call(self.db, [main.StockReservation("products", pid, -3, "Mug")])
+        self.assertEqual(self.stock(pid), 5)
+        self.assertEqual(self.orders.count_documents({}), 0)
+
+    def test_database_error_releases_earlier_reservations(self):
+        first = self.products.insert_one({"name": "Mug", "price": 1.0, "in_stock": 5}).inserted_id
+        second = self.products.insert_one({"name": "Mat", "price": 1.0, "in_stock": 5}).inserted_id
+        original = self.products.find_one_and_update
+
+        def flaky(filter, *args, **kwargs):
+            if filter["_id"] == second:
+                raise AutoReconnect("connection lost")
+            return original(filter, *args, **kwargs)
+
+        with mock.patch.object(self.products, "find_one_and_update", side_effect=flaky):
+            with self.assertRaises(AutoReconnect):
+                main.reserve_stock(self.db, [
+                    main.StockReservation("products", first, 2, "Mug"),
+                    main.StockReservation("products", second, 2, "Mat"),
+                ])
+        self.assertEqual((self.stock(first), self.stock(second)), (5, 5))
+
+    def test_listing_is_marked_sold_at_zero(self):
+        listing = self.db["selling_products"].insert_one(
+            {"name": "Lamp", "price": 1.0, "quantity": 2, "status": "unsold"}
+        ).inserted_id
+        self.assertEqual(self.order((listing, 1), (listing, 1)).status_code, 200)
+        doc = self.db["selling_products"].find_one({"_id": listing})
+        self.assertEqual((doc["quantity"], doc["status"]), (0, "sold"))
+
+if __name__ == "__main__":
+    unittest.main()
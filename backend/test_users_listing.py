@@ -0,0 +1,81 @@
+"""
+Tests for the paginated admin user listing
+"""
+import unittest
+from unittest import mock
+import sys
+from datetime import datetime
+sys.path.insert(0, '.')
+
+import mongomock
+from fastapi.testclient import TestClient
+
+import main
+
+
+class TestUsersListing(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, main, "mongo", main.mongo)
+        main.mongo = main.MongoConnectionManager("mongodb://test", "test-db", client_factory=mongomock.MongoClient)
+        users = main.get_mongo_client()[2]
+        for name in ["dave", "amy", "bob", "alan", "carl", "al.x"]:
+            users.insert_one({
+                "email": f"{name}@example.com", "username": name, "hashed_password": "hash",
+                "phone_number": "123", "created_at": datetime(2024, 1, 1),
+            })
+        patcher = mock.patch.object(main, "ADMIN_EMAILS", {"admin@example.com"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = TestClient(main.app)
+        self.client.headers["Authorization"] = self.bearer("admin@example.com")
+
+    def bearer(self, email):
+        return f"Bearer {main.create_access_token({'sub': email})}"
+
+    def get(self, **params):
+        response = self.client.get("/users", params=params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_email_order(self):
+        emails, cursor = [], None
+        while True:
+            page = self.get(limit=4, **({"cursor": cursor} if cursor else {}))
+            emails += [user["email"] for user in page["users"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(emails, sorted(emails))
+        self.assertEqual(len(emails), 6)
+        self.assertEqual(page["total_estimate"], 6)
+
+    def test_email_prefix_is_literal(self):
+        page = self.get(email_prefix="al.")
+        self.assertEqual([user["email"] for user in page["users"]], ["al.x@example.com"])
+        self.assertEqual(page["total_estimate"], 1)
+        page = self.get(email_prefix="a", limit=1)
+        self.assertEqual(page["total_estimate"], 3)
+        self.assertEqual([user["email"] for user in self.get(email_prefix="a", cursor=page["next_cursor"])["users"]],
+                         ["alan@example.com", "amy@example.com"])
+
+    def test_projection(self):
+        user = self.get(limit=1)["users"][0]
+        self.assertEqual(set(user), {"_id", "email", "username", "created_at"})
+        self.assertIsInstance(user["_id"], str)
+        user = self.get(limit=1, fields="phone_number")["users"][0]
+        self.assertEqual(set(user), {"_id", "email", "phone_number"})
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get("/users", params={"fields": "hashed_password"}).status_code, 400)
+        self.assertEqual(self.client.get("/users", params={"limit": 0}).status_code, 400)
+        self.assertEqual(self.client.get("/users", params={"cursor": "garbage"}).status_code, 400)
+
+    def test_requires_an_admin(self):
+        params = {"fields": "phone_number,address"}
+        self.assertEqual(self.client.get("/users", params=params, headers={"Authorization": ""}).status_code, 401)
+        user = {"Authorization": self.bearer("amy@example.com")}
+        self.assertEqual(self.client.get("/users", params=params, headers=user).status_code, 403)
+
+if __name__ == "__main__":
+    unittest.main()